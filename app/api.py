@@ -13,16 +13,6 @@ from werkzeug.exceptions import BadRequest
 from flask_cors import CORS # type: ignore
 from dotenv import load_dotenv
 
-### NUEVO: Importaciones para el procesamiento avanzado de PDF y OCR ###
-from io import BytesIO
-import pdfplumber
-try:
-    import pytesseract
-    from pdf2image import convert_from_bytes
-    OCR_AVAILABLE = True
-except ImportError:
-    OCR_AVAILABLE = False
-
 # Esto permite que las importaciones absolutas 'from app...' funcionen
 current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
@@ -46,9 +36,32 @@ load_dotenv()
 try:
     # Las importaciones ahora son absolutas desde el paquete 'app'
     from app.src.database.mongo_manager import MongoManager
-    from app.src.memory.conversation_memory import ConversationMemory
-    from app.config.settings import SYSTEM_MESSAGE
-    from app.chains.graph_definition import create_hr_graph
+    from app.src.memory.conversation_memory import ConversationMemory, get_conversation_memory_cache_stats
+    from app.src.memory.session_cache import SessionCache
+    from app.src.metrics import histograms_snapshot
+    from app.src.tools.pdf_extraction import available_backends
+    from app.src.tools.document_ingestion import (
+        DocumentError,
+        DocumentQueueFull,
+        file_extension,
+        ingest_document,
+        get_document_job_queue,
+        mark_pending_documents,
+        claim_pending_documents
+    )
+    from app.config.settings import (
+        SYSTEM_MESSAGE,
+        SESSION_CACHE_MAX_ENTRIES,
+        SESSION_CACHE_IDLE_TTL_SECONDS,
+        SESSION_CACHE_MAX_MB,
+        DOCUMENT_BATCH_MAX_FILES,
+        DOCUMENT_MAX_MB,
+        DOCUMENT_CONTEXT_MAX_CHARS,
+        PAYMENT_RECEIVED_MESSAGE,
+        DOCUMENT_REJECTED_MESSAGE,
+        TTS_PREWARM_ON_START
+    )
+    from app.chains.graph_definition import get_hr_graph, get_llm_pool_stats, get_prompt_cache_stats, GRAPH_BUILD_STATS
     from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
     # ### MODIFICADO: Se remueven las herramientas 'process_pdf' y 'extract_text_from_image' que ya no se usarán directamente ###
     from app.src.tools.voice_tool import speech_to_text_tool, text_to_speech_tool, voice_tool_instance
@@ -68,63 +81,30 @@ except Exception as e:
     logging.critical(f"Error al inicializar MongoManager: {e}")
     sys.exit(1)
 
-# Almacenamiento de conversaciones activas
-active_conversations = {}
+# Cola de extracción de documentos en segundo plano (/documents/batch)
+document_jobs = get_document_job_queue(mongo_manager)
 
+# Precalentamiento opcional de la caché de audio TTS (frases fijas y del SYSTEM_MESSAGE)
+if TTS_PREWARM_ON_START and voice_tool_instance.tts_client is not None:
+    from app.src.tools.tts_prewarm import start_background_prewarm
+    start_background_prewarm()
 
-### NUEVO: Función de extracción de texto de PDF con OCR (traída de api1.py y mejorada) ###
-# def _extract_text_from_pdf_with_ocr(pdf_content: bytes) -> str:
-#     """
-#     Extrae texto de un contenido de PDF en bytes.
-#     Intenta la extracción directa y, si falla o el texto es escaso, utiliza OCR.
-#     """
-#     extracted_text = ""
-    
-#     # --- Intento 1: Extracción directa con pdfplumber ---
-#     try:
-#         logging.info("[PDF_EXTRACT] Intentando extracción directa con pdfplumber.")
-#         with pdfplumber.open(BytesIO(pdf_content)) as pdf:
-#             for page in pdf.pages:
-#                 page_text = page.extract_text()
-#                 if page_text:
-#                     extracted_text += page_text + "\n"
-#         logging.info(f"[PDF_EXTRACT] pdfplumber extrajo {len(extracted_text)} caracteres.")
-#     except Exception as e:
-#         logging.warning(f"[PDF_EXTRACT] pdfplumber falló: {e}")
-#         extracted_text = ""
+# Compilar el grafo una sola vez por proceso (se reutiliza en todas las peticiones)
+try:
+    get_hr_graph()
+    logging.info(f"Grafo LangGraph compilado en {GRAPH_BUILD_STATS['last_build_seconds'] * 1000:.1f} ms")
+except Exception as e:
+    logging.critical(f"Error al compilar el grafo: {e}")
+    sys.exit(1)
 
-#     # --- Intento 2: OCR si la extracción directa falló o fue pobre (y si las librerías están disponibles) ---
-#     if OCR_AVAILABLE and (not extracted_text or len(extracted_text.strip()) < 100):
-#         logging.warning(f"[PDF_EXTRACT] Texto extraído es insuficiente ({len(extracted_text)} chars). Intentando OCR.")
-#         try:
-#             images = convert_from_bytes(pdf_content)
-#             ocr_text = ""
-#             for i, image in enumerate(images):
-#                 try:
-#                     # Usar español como idioma principal para el OCR
-#                     page_text = pytesseract.image_to_string(image, lang='spa+eng')
-#                     if page_text.strip():
-#                         ocr_text += f"--- Página {i+1} (OCR) ---\n{page_text}\n\n"
-#                 except Exception as page_error:
-#                     logging.error(f"[PDF_EXTRACT] Error en OCR de página {i+1}: {page_error}")
-            
-#             if ocr_text.strip():
-#                 logging.info(f"[PDF_EXTRACT] OCR exitoso, se extrajeron {len(ocr_text)} caracteres.")
-#                 # El texto de OCR es ahora el texto principal
-#                 extracted_text = ocr_text
-#             else:
-#                 logging.warning("[PDF_EXTRACT] OCR no produjo texto útil.")
-#                 if not extracted_text:
-#                     raise ValueError("No se pudo extraer texto del PDF (extracción normal y OCR fallaron).")
-
-#         except Exception as ocr_error:
-#             logging.error(f"[PDF_EXTRACT] Error general durante OCR: {ocr_error}")
-#             if not extracted_text:
-#                 raise ValueError(f"No se pudo procesar el PDF para OCR: {ocr_error}")
-#     elif not OCR_AVAILABLE and (not extracted_text or len(extracted_text.strip()) < 100):
-#         logging.warning("[PDF_EXTRACT] El texto extraído es insuficiente y OCR no está disponible.")
-
-#     return extracted_text.strip()
+# Almacenamiento de conversaciones activas (acotado: LRU + TTL por inactividad + presupuesto de memoria).
+# Una conversación expulsada se reconstruye desde MongoDB en su siguiente petición.
+active_conversations = SessionCache(
+    max_entries=SESSION_CACHE_MAX_ENTRIES,
+    idle_ttl_seconds=SESSION_CACHE_IDLE_TTL_SECONDS,
+    max_bytes=SESSION_CACHE_MAX_MB * 1024 * 1024,
+    name="active_conversations"
+)
 
 
 def handle_api_error(error, status_code=500):
@@ -160,6 +140,35 @@ def index():
                 "POST_voice": "Form-data: thread_id, audio (WAV/MP3/FLAC/M4A/OGG), voice_name"
             }
         },
+        "documents": {
+            "path": "/documents/batch",
+            "methods": ["POST"],
+            "description": "Extrae en segundo plano el texto de varios archivos; se adjunta a la conversación en el siguiente turno",
+            "usage": {
+                "POST_batch": "Form-data: thread_id, files (varios PDF/PNG/JPG) -> 202 con batch_id y job_id por archivo",
+                "GET_job": "/documents/jobs/<job_id>?include_text=1",
+                "GET_batch": "/documents/batch/<batch_id>?include_text=1"
+            }
+        },
+        "voice_stream": {
+            "path": "/conversation/voice/stream",
+            "methods": ["WEBSOCKET", "POST"],
+            "description": "Turno de voz en streaming: transcripciones parciales y respuesta al detectar el final del enunciado",
+            "usage": {
+                "query": "?thread_id=...&encoding=WEBM_OPUS|OGG_OPUS|LINEAR16|FLAC&sample_rate_hertz=...&language_code=es-ES",
+                "WEBSOCKET": "Frames binarios con el audio; {'event': 'end'} opcional al terminar de hablar. Con &tts=1 la respuesta llega también como frames MP3",
+                "POST": "Cuerpo con Transfer-Encoding: chunked; la respuesta son Server-Sent Events"
+            }
+        },
+        "tts": {
+            "path": "/tts",
+            "methods": ["POST"],
+            "description": "Texto a voz por frases: el MP3 se envía en streaming a medida que se sintetiza",
+            "usage": {
+                "POST_mp3": "JSON: {'text': '...', 'voice_name': '...'} -> audio/mpeg (chunked)",
+                "POST_base64": "JSON: {'text': '...', 'voice_name': '...', 'format': 'base64'}"
+            }
+        },
         "health": {
             "path": "/health",
             "method": "GET",
@@ -182,41 +191,154 @@ def health_check():
                 "voice_services": "ok" if voice_available else "warning",
                 "voice_speech_to_text": voice_tool_instance.speech_client is not None,
                 "voice_text_to_speech": voice_tool_instance.tts_client is not None,
-                "ocr_services": "ok" if OCR_AVAILABLE else "warning"
-            }
+                "ocr_services": "ok" if "ocr" in available_backends() else "warning"
+            },
+            "graph": {
+                "builds": GRAPH_BUILD_STATS["builds"],
+                "last_build_ms": round((GRAPH_BUILD_STATS["last_build_seconds"] or 0) * 1000, 1)
+            },
+            "llm_pool": get_llm_pool_stats(),
+            "prompt_cache": get_prompt_cache_stats(),
+            "session_cache": active_conversations.stats(),
+            "conversation_memory_cache": get_conversation_memory_cache_stats(),
+            "mongo_write_queue": mongo_manager.get_write_queue_stats(),
+            "mongo_pool": mongo_manager.get_pool_stats(),
+            "document_jobs": document_jobs.stats(),
+            "tts": voice_tool_instance.get_tts_stats(),
+            "latency": histograms_snapshot()
         })
     except Exception as e:
         return handle_api_error(e)
 
+def build_initial_state(messages, conversation_summary=None, summarized_turns=0):
+    """Crea el estado inicial del grafo a partir de una lista de mensajes"""
+    return {
+        "messages": messages,
+        "user_name": None,
+        "country": None,
+        "country_verified": False,
+        "cv_summary": None,
+        "cv_analysis": None,
+        "cv_info": None,
+        "conversation_summary": conversation_summary,
+        "summarized_turns": summarized_turns,
+        # Los turnos ya resumidos no se cargan en 'messages'
+        "state_turn_offset": summarized_turns
+    }
+
+def rebuild_messages_from_memory(conversation_memory, skip_turns=0):
+    """
+    Reconstruye los mensajes de LangChain desde el historial persistido en MongoDB.
+    Omite los primeros `skip_turns` turnos (ya incluidos en el resumen de la conversación).
+    """
+    previous_messages = [SystemMessage(content=SYSTEM_MESSAGE)]
+    turn_index = -1
+    for msg in conversation_memory.get_conversation_history():
+        role = msg.get("role", "")
+        content = msg.get("content", "")
+        # Cada mensaje del usuario abre un turno nuevo (misma regla que context_budget.split_turns)
+        if role == "user" or turn_index < 0:
+            turn_index += 1
+        if turn_index < skip_turns:
+            continue
+        if role == "user":
+            previous_messages.append(HumanMessage(content=content))
+        elif role == "assistant":
+            previous_messages.append(AIMessage(content=content))
+    return previous_messages
+
+def load_conversation_summary(thread_id):
+    """Lee de MongoDB el resumen acumulado del hilo. Devuelve (resumen, turnos_resumidos)"""
+    try:
+        context = mongo_manager.get_context(thread_id) or {}
+    except Exception as e:
+        logging.error(f"Error leyendo el resumen de la conversación {thread_id}: {e}")
+        context = {}
+    return context.get("conversation_summary"), int(context.get("summarized_turns") or 0)
+
+def rebuild_state_from_memory(thread_id, conversation_memory):
+    """Estado del grafo para una conversación que no está en caché: resumen + turnos no resumidos"""
+    conversation_summary, summarized_turns = load_conversation_summary(thread_id)
+    messages = rebuild_messages_from_memory(conversation_memory, skip_turns=summarized_turns)
+    return build_initial_state(messages, conversation_summary, summarized_turns)
+
+def persist_conversation_summary(thread_id, previous_summarized_turns, state):
+    """Guarda el resumen junto al hilo si el nodo context_budget lo actualizó en este turno"""
+    summarized_turns = state.get("summarized_turns") or 0
+    if summarized_turns <= previous_summarized_turns:
+        return
+    mongo_manager.save_context(thread_id, {
+        "conversation_summary": state.get("conversation_summary"),
+        "summarized_turns": summarized_turns
+    })
+
+def parse_history_limit(limit):
+    """Valida el parámetro 'limit' del historial paginado. Lanza ValueError si no es válido"""
+    if limit is None:
+        return None
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise ValueError("'limit' debe ser un entero")
+    if limit <= 0:
+        raise ValueError("'limit' debe ser mayor que 0")
+    return limit
+
+def get_history_page(thread_id, limit=None, page_token=None):
+    """
+    Devuelve una página del historial ({'messages', 'next_page_token'}) leída directamente de MongoDB.
+    Lanza ValueError si 'limit' o 'page_token' no son válidos.
+    """
+    return mongo_manager.get_history_page(thread_id, limit=parse_history_limit(limit), page_token=page_token or None)
+
+def extract_ai_response(state):
+    """Devuelve el contenido del último AIMessage del estado, o None si no hay ninguno"""
+    for msg in reversed(state.get("messages", [])):
+        if isinstance(msg, AIMessage):
+            return msg.content
+    return None
+
+def document_context_message(document):
+    """Mensaje con el texto extraído de un documento, recortado a DOCUMENT_CONTEXT_MAX_CHARS"""
+    text = document.get("text") or ""
+    if DOCUMENT_CONTEXT_MAX_CHARS and len(text) > DOCUMENT_CONTEXT_MAX_CHARS:
+        text = text[:DOCUMENT_CONTEXT_MAX_CHARS] + "\n\n[... contenido recortado ...]"
+    return f"[Contenido extraído del archivo '{document.get('filename')}']:\n\n{text}"
+
+def attach_pending_documents(thread_id, current_state, conversation_memory):
+    """
+    Añade al estado (y al historial) los documentos ya extraídos del hilo que aún no
+    se adjuntaron, p. ej. los de un lote de /documents/batch. El texto se lee de
+    MongoDB: no se vuelve a extraer. Solo consulta MongoDB si el hilo está marcado
+    con documentos pendientes. Devuelve el número de documentos adjuntados.
+    """
+    if not claim_pending_documents(thread_id):
+        return 0
+    documents = mongo_manager.get_pending_documents(thread_id)
+    for document in documents:
+        content = document_context_message(document)
+        conversation_memory.add_message("user", content)
+        current_state["messages"].append(HumanMessage(content=content))
+    if documents:
+        if not mongo_manager.mark_documents_attached(thread_id, [document["sha256"] for document in documents]):
+            # Se vuelven a buscar en el siguiente turno
+            mark_pending_documents(thread_id)
+        logging.info(f"[documents] {len(documents)} documentos adjuntados a la conversación {thread_id}")
+    return len(documents)
+
 def process_text_conversation(thread_id, user_message):
     """Procesa una conversación de texto normal"""
     conversation = active_conversations.get(thread_id)
     if not conversation:
         conversation_memory = ConversationMemory(thread_id, mongo_manager)
-        graph = create_hr_graph()
-        previous_messages = [SystemMessage(content=SYSTEM_MESSAGE)]
-        history = conversation_memory.get_conversation_history()
-        for msg in history:
-            role = msg.get("role", "")
-            content = msg.get("content", "")
-            if role == "user":
-                previous_messages.append(HumanMessage(content=content))
-            elif role == "assistant":
-                previous_messages.append(AIMessage(content=content))
-        current_state = {
-            "messages": previous_messages,
-            "user_name": None,
-            "country": None,
-            "country_verified": False,
-            "cv_summary": None,
-            "cv_analysis": None,
-            "cv_info": None
-        }
+        current_state = rebuild_state_from_memory(thread_id, conversation_memory)
     else:
         current_state = conversation.get("state")
         conversation_memory = conversation.get("memory")
-        graph = create_hr_graph()
+    graph = get_hr_graph()
+    previous_summarized_turns = current_state.get("summarized_turns") or 0
 
+    attach_pending_documents(thread_id, current_state, conversation_memory)
     conversation_memory.add_message("user", user_message)
     current_state["messages"].append(HumanMessage(content=user_message))
 
@@ -227,16 +349,11 @@ def process_text_conversation(thread_id, user_message):
         logging.error(f"Error al invocar el grafo: {e}")
         raise Exception(f"Error al procesar el mensaje: {str(e)}")
 
-    ai_response = None
-    for msg in reversed(current_state.get("messages", [])):
-        if isinstance(msg, AIMessage):
-            ai_response = msg.content
-            conversation_memory.add_message("assistant", ai_response)
-            break
-
+    ai_response = extract_ai_response(current_state)
     if ai_response is None:
         ai_response = "Lo siento, no pude generar una respuesta."
-        conversation_memory.add_message("assistant", ai_response)
+    conversation_memory.add_message("assistant", ai_response)
+    persist_conversation_summary(thread_id, previous_summarized_turns, current_state)
 
     active_conversations[thread_id] = {
         "state": current_state,
@@ -245,154 +362,68 @@ def process_text_conversation(thread_id, user_message):
 
     return ai_response
 
-# def process_file_conversation(thread_id, user_message, uploaded_file):
-#     """Procesa una conversación con archivo (PDF o imagen)"""
-#     if uploaded_file.filename == '':
-#         raise Exception("Nombre de archivo vacío")
-
-#     # Verificar el tipo de archivo
-#     allowed_extensions = {'pdf', 'png', 'jpg', 'jpeg'}
-#     file_extension = uploaded_file.filename.rsplit('.', 1)[1].lower()
-#     if file_extension not in allowed_extensions:
-#         raise Exception("Tipo de archivo no permitido")
-
-#     # Guardar el archivo temporalmente
-#     temp_dir = os.path.join(os.getcwd(), 'temp')
-#     os.makedirs(temp_dir, exist_ok=True)
-#     # Usar un nombre de archivo único para evitar colisiones
-#     unique_filename = f"{uuid.uuid4().hex}_{uploaded_file.filename}"
-#     file_path = os.path.join(temp_dir, unique_filename)
-#     uploaded_file.save(file_path)
-
-#     try:
-#         file_text = ""
-#         # Procesar el archivo según su tipo
-#         if file_extension in {'png', 'jpg', 'jpeg'}:
-#             # Se mantiene la excelente lógica de `api2.py` para imágenes con Google Vision
-#             try:
-#                 from google.cloud import vision
-                
-#                 client = vision.ImageAnnotatorClient()
-                
-#                 with open(file_path, 'rb') as image_file:
-#                     content = image_file.read()
-
-#                 image = vision.Image(content=content)
-#                 text_detection_response = client.text_detection(image=image)
-#                 texts = text_detection_response.text_annotations
-#                 label_detection_response = client.label_detection(image=image)
-#                 labels = label_detection_response.label_annotations
-
-#                 extracted_text = ""
-#                 if texts:
-#                     extracted_text = texts[0].description
-                
-#                 extracted_labels = [label.description for label in labels]
-                
-#                 file_text = f"[Imagen analizada: {uploaded_file.filename}]\n"
-#                 if extracted_text:
-#                     file_text += f"\nTexto detectado en la imagen:\n{extracted_text}\n"
-#                 if extracted_labels:
-#                     file_text += f"\nElementos detectados en la imagen:\n- " + "\n- ".join(extracted_labels[:10])
-
-#             except ImportError:
-#                 file_text = f"[Contenido de imagen: {uploaded_file.filename}. No se pudo analizar el contenido específico porque la API de Vision no está disponible.]"
-#             except Exception as e:
-#                 logging.error(f"Error al analizar imagen con Vision API: {e}")
-#                 file_text = f"[Imagen recibida: {uploaded_file.filename}. No se pudo analizar completamente debido a un error: {str(e)}]"
-        
-#         else: # ### MODIFICADO: Lógica para procesar PDF con OCR de respaldo ###
-#             # Procesar como PDF usando la nueva función robusta
-#             logging.info(f"[PDF_PROCESS] Procesando archivo PDF: {file_path}")
-#             try:
-#                 with open(file_path, 'rb') as f:
-#                     pdf_content = f.read()
-#                 file_text = _extract_text_from_pdf_with_ocr(pdf_content)
-#                 if not file_text:
-#                     file_text = "[El documento PDF fue procesado, pero no se encontró contenido textual extraíble.]"
-#             except Exception as e:
-#                 logging.error(f"Fallo crítico al procesar PDF {file_path}: {e}")
-#                 file_text = f"[Error al procesar el PDF: {e}. No se pudo extraer el contenido.]"
-
-
-#         # ----- La lógica de negocio de Geraldine se mantiene intacta -----
-
-#         # Verificar si es un comprobante de pago
-#         payment_keywords = ["pago", "transferencia", "depósito", "voucher", "comprobante", "recibo", "factura", "cheque", "depósito","Scotiabank", "Yape","Plin", "Bbva", "BCP"]
-#         is_payment = any(keyword.lower() in file_text.lower() for keyword in payment_keywords)
-
-#         # Verificar si es un documento legal
-#         legal_keywords = [
-#             "contrato", "constitución", "poder", "sociedad", "herederos", "divorcio",
-#             "notarial", "INDECOPI", "marca", "acta", "junta", "directorio", "alquiler",
-#             "compra", "venta", "liquidación", "sucesión", "testamento", "demandado", "demandante",
-#             "administrativo", "conciliación", "alimentos", "tenencia", "liquidación", "garantía",
-#             "hipoteca", "saneamiento", "due diligence", "protección al consumidor"
-#         ]
-#         is_legal = any(keyword.lower() in file_text.lower() for keyword in legal_keywords)
-
-#         # Construir el mensaje del usuario combinando el texto y el archivo
-#         file_type = "comprobante de pago" if is_payment else "documento legal" if is_legal else "documento"
-        
-#         # Formatear el mensaje del usuario para ser más claro para el LLM
-#         if user_message:
-#             combined_message = f"{user_message}\n\n[Contexto Adicional del Usuario: Se ha adjuntado un archivo '{uploaded_file.filename}', que he identificado como un {file_type}. Procedo a analizarlo.]"
-#         else:
-#             combined_message = f"[Contexto Adicional del Usuario: Se ha adjuntado un archivo '{uploaded_file.filename}', identificado como un {file_type}. Procedo a analizarlo.]"
-
-
-#         if is_payment:
-#             ai_response = "He recibido tu comprobante de pago. Procederé a verificarlo y continuaremos con el proceso de asesoría."
-#         elif not is_legal and file_extension == 'pdf': # Solo aplicar esta lógica estricta a PDFs
-#             ai_response = "Lo siento, no puedo ayudarte con este tipo de documento. Como abogada digital especialista en Derecho Corporativo, Derechos Reales y Derecho de Familia, solo puedo asistirte con documentos legales relacionados con estas áreas. Por favor, sube un documento legal (como contratos, poderes, actas, documentos de constitución de empresa, sucesiones, etc.) o hazme una consulta específica sobre temas jurídicos."
-#         else:
-#             # Si es legal (o una imagen que podría ser legal), seguir el flujo normal
-#             # El primer `process_text_conversation` ahora solo establece el contexto
-#             ai_response = process_text_conversation(thread_id, combined_message)
-            
-#             # Ahora, inyectamos el contenido real del archivo como un mensaje separado para un análisis profundo
-#             conversation = active_conversations.get(thread_id)
-#             if not conversation:
-#                  raise Exception("Estado de la conversación no encontrado después del mensaje inicial.")
-
-#             conversation_memory = conversation.get("memory")
-#             current_state = conversation.get("state")
-
-#             # Añadir el texto extraído del archivo como un nuevo mensaje de "contexto de herramienta"
-#             file_content_message = f"[Contenido extraído del archivo '{uploaded_file.filename}']:\n\n{file_text}"
-#             conversation_memory.add_message("user", file_content_message) # Guardar en historial como si el usuario lo hubiera pegado
-#             current_state["messages"].append(HumanMessage(content=file_content_message))
-
-#             # Volver a invocar el grafo con el contenido completo del archivo para obtener una respuesta detallada
-#             graph = create_hr_graph()
-#             response = graph.invoke(current_state)
-#             current_state = response
-
-#             # Extraer la respuesta final del asistente
-#             for msg in reversed(current_state.get("messages", [])):
-#                 if isinstance(msg, AIMessage):
-#                     ai_response = msg.content
-#                     conversation_memory.add_message("assistant", ai_response)
-#                     break
-            
-#             if not ai_response:
-#                 ai_response = "He procesado el documento. ¿Cómo puedo ayudarte con la información contenida en él?"
-#                 conversation_memory.add_message("assistant", ai_response)
-
-#             active_conversations[thread_id] = {
-#                 "state": current_state,
-#                 "memory": conversation_memory
-#             }
-
-#         return ai_response, file_text
-
-#     finally:
-#         # Eliminar el archivo temporal
-#         if os.path.exists(file_path):
-#             try:
-#                 os.remove(file_path)
-#             except OSError as e:
-#                 logging.error(f"Error al eliminar el archivo temporal {file_path}: {e}")
+# Palabras clave para clasificar los archivos subidos en /conversation
+PAYMENT_KEYWORDS = ["pago", "transferencia", "depósito", "voucher", "comprobante", "recibo", "factura", "cheque", "Scotiabank", "Yape", "Plin", "Bbva", "BCP"]
+LEGAL_KEYWORDS = [
+    "contrato", "constitución", "poder", "sociedad", "herederos", "divorcio",
+    "notarial", "INDECOPI", "marca", "acta", "junta", "directorio", "alquiler",
+    "compra", "venta", "liquidación", "sucesión", "testamento", "demandado", "demandante",
+    "administrativo", "conciliación", "alimentos", "tenencia", "garantía",
+    "hipoteca", "saneamiento", "due diligence", "protección al consumidor"
+]
+
+def save_upload(uploaded_file):
+    """
+    Guarda un archivo subido en un temporal único (el llamador lo elimina).
+    Devuelve (extensión, ruta). Lanza DocumentError si el tipo o el tamaño no son válidos.
+    """
+    extension = file_extension(uploaded_file.filename)
+    fd, file_path = tempfile.mkstemp(prefix="document_", suffix=f".{extension}")
+    os.close(fd)
+    uploaded_file.save(file_path)
+    if os.path.getsize(file_path) > DOCUMENT_MAX_MB * 1024 * 1024:
+        os.remove(file_path)
+        raise DocumentError(f"El archivo '{uploaded_file.filename}' supera el máximo de {DOCUMENT_MAX_MB} MB")
+    return extension, file_path
+
+def process_file_conversation(thread_id, user_message, uploaded_file):
+    """
+    Procesa una conversación con archivo (PDF o imagen). El texto se extrae una sola
+    vez y se guarda en MongoDB; process_text_conversation lo adjunta al estado antes
+    del mensaje del usuario. Devuelve (respuesta, texto extraído).
+    """
+    file_extension_name, file_path = save_upload(uploaded_file)
+    try:
+        document = ingest_document(mongo_manager, thread_id, uploaded_file.filename, file_path)
+    finally:
+        try:
+            os.remove(file_path)
+        except OSError as e:
+            logging.error(f"Error al eliminar el archivo temporal {file_path}: {e}")
+
+    if document["status"] != "done":
+        raise Exception(f"Error al procesar el archivo: {document.get('error')}")
+    file_text = document["text"]
+
+    # ----- La lógica de negocio de Geraldine se mantiene intacta -----
+    is_payment = any(keyword.lower() in file_text.lower() for keyword in PAYMENT_KEYWORDS)
+    is_legal = any(keyword.lower() in file_text.lower() for keyword in LEGAL_KEYWORDS)
+    file_type = "comprobante de pago" if is_payment else "documento legal" if is_legal else "documento"
+
+    if is_payment or (not is_legal and file_extension_name == 'pdf'):
+        # No se adjunta a la conversación: se marca como atendido para que los turnos siguientes lo ignoren
+        mongo_manager.mark_documents_attached(thread_id, [document["sha256"]])
+        if is_payment:
+            return PAYMENT_RECEIVED_MESSAGE, file_text
+        return DOCUMENT_REJECTED_MESSAGE, file_text
+
+    # Si es legal (o una imagen que podría ser legal), seguir el flujo normal
+    if user_message:
+        combined_message = f"{user_message}\n\n[Contexto Adicional del Usuario: Se ha adjuntado un archivo '{uploaded_file.filename}', que he identificado como un {file_type}. Procedo a analizarlo.]"
+    else:
+        combined_message = f"[Contexto Adicional del Usuario: Se ha adjuntado un archivo '{uploaded_file.filename}', identificado como un {file_type}. Procedo a analizarlo.]"
+    ai_response = process_text_conversation(thread_id, combined_message)
+    return ai_response, file_text
 
 # # ... (El resto del archivo, incluyendo `process_voice_conversation` y todas las rutas, permanece exactamente igual)
 
@@ -524,6 +555,14 @@ def handle_conversation():
 
             # Obtener historial de conversación
             if action == 'history':
+                # Paginado: ?limit=N y/o ?page_token=... (se lee solo la página pedida)
+                if 'limit' in request.args or 'page_token' in request.args:
+                    try:
+                        page = get_history_page(thread_id, request.args.get('limit'), request.args.get('page_token'))
+                    except ValueError as e:
+                        return jsonify({"success": False, "error": str(e)}), 400
+                    return jsonify({"success": True, "thread_id": thread_id, **page})
+
                 conversation = active_conversations.get(thread_id)
                 if conversation:
                     memory = conversation['memory']
@@ -654,20 +693,12 @@ def handle_conversation():
                 if 'thread_id' not in data:
                     thread_id = f"api_{uuid.uuid4().hex[:8]}"
                     conversation_memory = ConversationMemory(thread_id, mongo_manager)
-                    graph = create_hr_graph()
+                    graph = get_hr_graph()
                     initial_messages = [SystemMessage(content=SYSTEM_MESSAGE)]
                     initial_user_message = "Hola, me gustaría recibir ayuda."
                     initial_messages.append(HumanMessage(content=initial_user_message))
                     conversation_memory.add_message("user", initial_user_message)
-                    current_state = {
-                        "messages": initial_messages,
-                        "user_name": None,
-                        "country": None,
-                        "country_verified": False,
-                        "cv_summary": None,
-                        "cv_analysis": None,
-                        "cv_info": None
-                    }
+                    current_state = build_initial_state(initial_messages)
                     try:
                         initial_response = graph.invoke(current_state)
                         last_message = initial_response.get("messages", [])[-1] if initial_response.get("messages") else None
@@ -730,6 +761,73 @@ def handle_conversation():
             "details": str(e)
         }), 500
 
+def include_text_requested():
+    return request.args.get('include_text', '').lower() in ('1', 'true')
+
+@app.route('/documents/batch', methods=['POST'])
+@app.route('/api/documents/batch', methods=['POST'])
+def submit_document_batch():
+    """
+    Encola la extracción de varios archivos (form-data: thread_id, files) y responde
+    de inmediato con 202, el batch_id y un job_id por archivo
+    """
+    try:
+        thread_id = request.form.get('thread_id')
+        uploaded_files = request.files.getlist('files') or request.files.getlist('file')
+        if not thread_id:
+            return jsonify({"success": False, "error": "Se requiere thread_id para procesar archivos"}), 400
+        if not uploaded_files:
+            return jsonify({"success": False, "error": "Se requiere al menos un archivo en 'files'"}), 400
+        if len(uploaded_files) > DOCUMENT_BATCH_MAX_FILES:
+            return jsonify({
+                "success": False,
+                "error": f"Se admiten como máximo {DOCUMENT_BATCH_MAX_FILES} archivos por lote"
+            }), 400
+
+        saved = []
+        try:
+            for uploaded_file in uploaded_files:
+                _, file_path = save_upload(uploaded_file)
+                saved.append((uploaded_file.filename, file_path))
+            batch = document_jobs.submit(thread_id, saved)
+        except Exception as e:
+            # Nada quedó en cola: se eliminan los temporales ya guardados (submit puede haberlos borrado)
+            for _, file_path in saved:
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+            if not isinstance(e, (DocumentError, DocumentQueueFull)):
+                raise
+            status_code = 503 if isinstance(e, DocumentQueueFull) else 400
+            return jsonify({"success": False, "error": str(e)}), status_code
+
+        return jsonify({"success": True, "thread_id": thread_id, **batch}), 202
+    except Exception as e:
+        return handle_api_error(e)
+
+@app.route('/documents/batch/<batch_id>', methods=['GET'])
+@app.route('/api/documents/batch/<batch_id>', methods=['GET'])
+def get_document_batch(batch_id):
+    """Progreso y resultados de un lote"""
+    try:
+        batch = document_jobs.get_batch(batch_id, include_text=include_text_requested())
+        if batch is None:
+            return jsonify({"success": False, "error": "Lote no encontrado"}), 404
+        return jsonify({"success": True, **batch})
+    except Exception as e:
+        return handle_api_error(e)
+
+@app.route('/documents/jobs/<job_id>', methods=['GET'])
+@app.route('/api/documents/jobs/<job_id>', methods=['GET'])
+def get_document_job(job_id):
+    """Estado y resultado de un trabajo de extracción"""
+    try:
+        job = document_jobs.get_job(job_id, include_text=include_text_requested())
+        if job is None:
+            return jsonify({"success": False, "error": "Trabajo no encontrado"}), 404
+        return jsonify({"success": True, "job": job})
+    except Exception as e:
+        return handle_api_error(e)
+
 # @app.route('/conversation/audio/<filename>', methods=['GET', 'OPTIONS'])
 # def download_voice_file(filename):
 #     """Endpoint para descargar archivos de audio generados"""
@@ -1,6 +1,25 @@
-from fastapi import FastAPI
+import asyncio
+import base64
+import json
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.wsgi import WSGIMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, AIMessageChunk
+
+import api as flask_api
 from api import app as flask_app
+from app.src.database.async_mongo_manager import create_async_mongo_manager
+from app.src.metrics import get_histogram
+from app.src.tools.document_ingestion import has_pending_documents
+from app.src.tools.voice_tool import AudioChunkQueue
+from app.config.settings import VOICE_STREAM_MAX_SESSIONS
 
 app = FastAPI()
 
@@ -13,20 +32,584 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Mount Flask app under FastAPI
+# La app Flask se sirve a través de WSGIMiddleware, que ejecuta cada petición en
+# un hilo del pool, así una vista síncrona no bloquea el event loop.
+flask_wsgi = WSGIMiddleware(flask_app)
+
+# Acceso a MongoDB con Motor para las rutas nativas (None si Motor no está instalado:
+# ConversationMemory recurre entonces a hilos del pool)
+async_mongo_manager = create_async_mongo_manager(flask_api.mongo_manager)
+
+
+class FlaskFallbackResponse(Response):
+    """
+    Delegates a request whose body was already read to the Flask app.
+    Used for the /conversation variants that still live only in Flask
+    (file and voice uploads).
+    """
+
+    def __init__(self, body: bytes):
+        super().__init__()
+        self._request_body = body
+
+    async def __call__(self, scope, receive, send):
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": self._request_body, "more_body": False}
+            return await receive()
+
+        await flask_wsgi(scope, replay_receive, send)
+
+
 @app.get("/")
 async def root():
     return {"message": "Geraldine AI Agent API"}
 
-# Import all routes from Flask app
-for rule in flask_app.url_map.iter_rules():
-    endpoint = flask_app.view_functions[rule.endpoint]
-    methods = list(rule.methods - {"OPTIONS", "HEAD"})
-    path = str(rule)
-    
-    if path == "/":
-        continue
-        
-    @app.route(path, methods=methods)
-    async def wrapper(*args, **kwargs):
-        return await endpoint(*args, **kwargs)
\ No newline at end of file
+
+# --- Ruta nativa asíncrona para /conversation ---
+
+async def aload_conversation(thread_id: str):
+    """Devuelve (estado, memoria) de la conversación, rehidratándola desde MongoDB si no está en caché"""
+    conversation = flask_api.active_conversations.get(thread_id)
+    if conversation:
+        return conversation.get("state"), conversation.get("memory")
+    conversation_memory = await flask_api.ConversationMemory.acreate(
+        thread_id, flask_api.mongo_manager, async_mongo_manager
+    )
+    if async_mongo_manager is None:
+        current_state = await asyncio.to_thread(flask_api.rebuild_state_from_memory, thread_id, conversation_memory)
+        return current_state, conversation_memory
+
+    context = await async_mongo_manager.get_context(thread_id) or {}
+    summarized_turns = int(context.get("summarized_turns") or 0)
+    messages = flask_api.rebuild_messages_from_memory(conversation_memory, skip_turns=summarized_turns)
+    current_state = flask_api.build_initial_state(messages, context.get("conversation_summary"), summarized_turns)
+    return current_state, conversation_memory
+
+
+async def afinish_turn(thread_id: str, current_state: dict, conversation_memory,
+                       previous_summarized_turns: int = 0) -> str:
+    """Persiste la respuesta final del asistente (y el resumen si cambió) y guarda la conversación en la caché"""
+    ai_response = flask_api.extract_ai_response(current_state)
+    if ai_response is None:
+        ai_response = "Lo siento, no pude generar una respuesta."
+    await conversation_memory.aadd_message("assistant", ai_response)
+    summarized_turns = current_state.get("summarized_turns") or 0
+    if async_mongo_manager is None:
+        await asyncio.to_thread(
+            flask_api.persist_conversation_summary, thread_id, previous_summarized_turns, current_state
+        )
+    elif summarized_turns > previous_summarized_turns:
+        await async_mongo_manager.save_context(thread_id, {
+            "conversation_summary": current_state.get("conversation_summary"),
+            "summarized_turns": summarized_turns
+        })
+
+    flask_api.active_conversations[thread_id] = {
+        "state": current_state,
+        "memory": conversation_memory
+    }
+    return ai_response
+
+
+async def aprocess_text_conversation(thread_id: str, user_message: str) -> str:
+    """Versión asíncrona de process_text_conversation: usa graph.ainvoke y no bloquea el event loop"""
+    current_state, conversation_memory = await aload_conversation(thread_id)
+    previous_summarized_turns = current_state.get("summarized_turns") or 0
+
+    # Documentos ya extraídos (p. ej. de /documents/batch) que aún no están en la conversación
+    if has_pending_documents(thread_id):
+        await asyncio.to_thread(flask_api.attach_pending_documents, thread_id, current_state, conversation_memory)
+    await conversation_memory.aadd_message("user", user_message)
+    current_state["messages"].append(HumanMessage(content=user_message))
+
+    try:
+        current_state = await flask_api.get_hr_graph().ainvoke(current_state)
+    except Exception as e:
+        logging.error(f"Error al invocar el grafo: {e}")
+        raise Exception(f"Error al procesar el mensaje: {str(e)}")
+
+    return await afinish_turn(thread_id, current_state, conversation_memory, previous_summarized_turns)
+
+
+def _sse_event(event: str, data: dict) -> str:
+    """Formatea un evento Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def astream_text_conversation(thread_id: str, user_message: str):
+    """
+    Ejecuta un turno de conversación y emite los tokens del nodo chatbot como eventos SSE.
+
+    Eventos: 'token' ({"text": ...}) por cada fragmento del LLM, y al final 'done'
+    con la respuesta completa ya post-procesada, el tiempo hasta el primer token
+    (ttft_ms) y la duración total. La respuesta se persiste en MongoDB antes de 'done'.
+    """
+    start = time.perf_counter()
+    first_token_at = None
+    try:
+        current_state, conversation_memory = await aload_conversation(thread_id)
+        previous_summarized_turns = current_state.get("summarized_turns") or 0
+        if has_pending_documents(thread_id):
+            await asyncio.to_thread(flask_api.attach_pending_documents, thread_id, current_state,
+                                    conversation_memory)
+        await conversation_memory.aadd_message("user", user_message)
+        current_state["messages"].append(HumanMessage(content=user_message))
+
+        final_state = None
+        async for mode, chunk in flask_api.get_hr_graph().astream(current_state, stream_mode=["messages", "values"]):
+            if mode == "values":
+                final_state = chunk
+                continue
+            message_chunk, metadata = chunk
+            if metadata.get("langgraph_node") != "chatbot" or not isinstance(message_chunk, AIMessageChunk):
+                continue
+            text = message_chunk.content if isinstance(message_chunk.content, str) else ""
+            if not text:
+                continue # Fragmentos de tool_calls sin texto
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            yield _sse_event("token", {"text": text})
+
+        ai_response = await afinish_turn(
+            thread_id, final_state or current_state, conversation_memory, previous_summarized_turns
+        )
+        total = time.perf_counter() - start
+        ttft_ms = round((first_token_at - start) * 1000, 1) if first_token_at else None
+        logging.info(f"[stream] thread={thread_id} ttft_ms={ttft_ms} total_ms={total * 1000:.1f}")
+        yield _sse_event("done", {
+            "success": True,
+            "thread_id": thread_id,
+            "message": ai_response,
+            "ttft_ms": ttft_ms,
+            "total_ms": round(total * 1000, 1)
+        })
+    except Exception as e:
+        logging.exception(f"Error en la conversación en streaming: {e}")
+        yield _sse_event("error", {"success": False, "error": str(e)})
+
+
+def streaming_response(thread_id: str, user_message: str) -> StreamingResponse:
+    return StreamingResponse(
+        astream_text_conversation(thread_id, user_message),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def astart_conversation() -> dict:
+    """Inicia una conversación nueva y devuelve el saludo inicial del asistente"""
+    thread_id = f"api_{uuid.uuid4().hex[:8]}"
+    conversation_memory = await flask_api.ConversationMemory.acreate(
+        thread_id, flask_api.mongo_manager, async_mongo_manager
+    )
+    initial_user_message = "Hola, me gustaría recibir ayuda."
+    await conversation_memory.aadd_message("user", initial_user_message)
+    current_state = flask_api.build_initial_state([
+        SystemMessage(content=flask_api.SYSTEM_MESSAGE),
+        HumanMessage(content=initial_user_message)
+    ])
+    try:
+        initial_response = await flask_api.get_hr_graph().ainvoke(current_state)
+        last_message = initial_response.get("messages", [])[-1] if initial_response.get("messages") else None
+        ai_response = (last_message.content if isinstance(last_message, AIMessage)
+                       else "Bienvenido a la asistencia de Geraldine.")
+        await conversation_memory.aadd_message("assistant", ai_response)
+    except Exception as e:
+        logging.error(f"Error en invocación inicial del grafo: {e}")
+        ai_response = "Lo siento, ha ocurrido un error al iniciar la conversación."
+    flask_api.active_conversations[thread_id] = {
+        "state": current_state,
+        "memory": conversation_memory
+    }
+    return {"success": True, "thread_id": thread_id, "type": "text", "message": ai_response}
+
+
+async def aget_history_page(thread_id: str, limit=None, page_token=None) -> dict:
+    """Versión asíncrona de api.get_history_page (misma validación de parámetros)"""
+    if async_mongo_manager is None:
+        return await asyncio.to_thread(flask_api.get_history_page, thread_id, limit, page_token)
+    return await async_mongo_manager.get_history_page(
+        thread_id, limit=flask_api.parse_history_limit(limit), page_token=page_token or None
+    )
+
+
+@app.get("/conversation")
+@app.get("/api/conversation")
+async def get_conversation(request: Request):
+    """Historial (action=history, opcionalmente paginado); el resto de acciones GET las atiende Flask"""
+    thread_id = request.query_params.get("thread_id")
+    action = request.query_params.get("action", "history")
+    if action != "history" or not thread_id:
+        return FlaskFallbackResponse(b"")
+
+    # Paginado: ?limit=N y/o ?page_token=... (se lee solo la página pedida)
+    if "limit" in request.query_params or "page_token" in request.query_params:
+        try:
+            page = await aget_history_page(
+                thread_id, request.query_params.get("limit"), request.query_params.get("page_token")
+            )
+        except ValueError as e:
+            return JSONResponse({"success": False, "error": str(e)}, status_code=400)
+        return {"success": True, "thread_id": thread_id, **page}
+
+    conversation = flask_api.active_conversations.get(thread_id)
+    if conversation:
+        memory = conversation["memory"]
+    else:
+        memory = await flask_api.ConversationMemory.acreate(thread_id, flask_api.mongo_manager, async_mongo_manager)
+    return {"success": True, "thread_id": thread_id, "messages": memory.get_conversation_history()}
+
+
+@app.post("/conversation")
+@app.post("/api/conversation")
+async def post_conversation(request: Request):
+    """
+    Conversación de texto asíncrona (JSON o form-data solo con texto).
+    Con ?stream=1 la respuesta se emite como Server-Sent Events.
+    Las subidas de archivos y audio se delegan a la implementación Flask.
+    """
+    body = await request.body()
+    stream = request.query_params.get("stream", "").lower() in ("1", "true")
+    content_type = request.headers.get("content-type", "")
+
+    try:
+        if content_type.startswith("application/json"):
+            try:
+                data = await request.json() or {}
+            except ValueError as e:
+                data = {}
+                logging.warning(f"JSON malformado recibido: {str(e)}, usando datos vacíos")
+
+            if "thread_id" not in data:
+                return await astart_conversation()
+            if "message" not in data:
+                return JSONResponse({
+                    "success": False,
+                    "error": "Datos incompletos. Se requiere 'message' cuando se proporciona 'thread_id'."
+                }, status_code=400)
+            thread_id, user_message = data["thread_id"], data["message"]
+            if not thread_id:
+                return JSONResponse({"success": False, "error": "thread_id inválido"}, status_code=400)
+
+        elif content_type.startswith("multipart/form-data"):
+            form = await request.form()
+            if "audio" in form or "file" in form:
+                return FlaskFallbackResponse(body)
+            thread_id, user_message = form.get("thread_id"), form.get("message", "")
+            if not thread_id:
+                return JSONResponse({"success": False, "error": "Se requiere thread_id"}, status_code=400)
+            if not user_message:
+                return JSONResponse({"success": False, "error": "Se requiere un mensaje"}, status_code=400)
+
+        else:
+            return FlaskFallbackResponse(body)
+
+        if stream:
+            return streaming_response(thread_id, user_message)
+
+        try:
+            ai_response = await aprocess_text_conversation(thread_id, user_message)
+        except Exception as e:
+            return JSONResponse({"success": False, "error": str(e)}, status_code=500)
+        return {
+            "success": True,
+            "thread_id": thread_id,
+            "type": "text",
+            "message": ai_response,
+            "conversation_ended": False
+        }
+
+    except Exception as e:
+        logging.exception(f"Error en la operación de conversación: {e}")
+        return JSONResponse({
+            "success": False,
+            "error": "Error interno al procesar la solicitud",
+            "details": str(e)
+        }, status_code=500)
+
+
+@app.post("/conversation/stream")
+@app.post("/api/conversation/stream")
+async def post_conversation_stream(request: Request):
+    """Turno de conversación en streaming (SSE). JSON: {'thread_id': '...', 'message': '...'}"""
+    try:
+        data = await request.json() or {}
+    except ValueError:
+        data = {}
+    thread_id, user_message = data.get("thread_id"), data.get("message")
+    if not thread_id or not user_message:
+        return JSONResponse({"success": False, "error": "Se requieren 'thread_id' y 'message'"}, status_code=400)
+    return streaming_response(thread_id, user_message)
+
+
+# --- Voz en streaming: audio por chunks -> transcripciones parciales -> turno del grafo ---
+
+# streaming_recognize es bloqueante: cada sesión ocupa un hilo de este pool mientras dura el enunciado
+voice_stream_executor = ThreadPoolExecutor(max_workers=VOICE_STREAM_MAX_SESSIONS, thread_name_prefix="stt-stream")
+voice_stream_slots = asyncio.Semaphore(VOICE_STREAM_MAX_SESSIONS)
+
+
+def voice_stream_options(params) -> dict:
+    """Parámetros de reconocimiento tomados de la query (?language_code=&encoding=&sample_rate_hertz=)"""
+    sample_rate = params.get("sample_rate_hertz")
+    return {
+        "language_code": params.get("language_code") or "es-ES",
+        "encoding": params.get("encoding") or None,
+        "sample_rate_hertz": int(sample_rate) if sample_rate else None
+    }
+
+
+async def astream_voice_turn(thread_id: str, audio: AudioChunkQueue, options: dict):
+    """
+    Reconoce el audio que el llamador va poniendo en `audio` y, en cuanto se detecta el
+    final del enunciado, ejecuta el turno del grafo con la transcripción definitiva.
+
+    Eventos: 'interim' y 'final' (transcripciones), 'end_of_utterance', 'transcript'
+    (texto completo), 'response' (respuesta del asistente) o 'error'.
+    """
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+
+    def recognize():
+        try:
+            for event in flask_api.voice_tool_instance.streaming_speech_to_text(audio, **options):
+                if event["event"] == "end_of_utterance":
+                    audio.close()  # El servidor ya cerró el enunciado: no se envía más audio
+                loop.call_soon_threadsafe(events.put_nowait, event)
+        except Exception as e:
+            loop.call_soon_threadsafe(events.put_nowait, {"event": "error", "error": str(e)})
+        finally:
+            loop.call_soon_threadsafe(events.put_nowait, None)
+
+    loop.run_in_executor(voice_stream_executor, recognize)
+    transcript = ""
+    utterance_ended_at = None
+    try:
+        while True:
+            event = await events.get()
+            if event is None:
+                break
+            if event["event"] == "end_of_utterance":
+                utterance_ended_at = time.perf_counter()
+            elif event["event"] == "transcript":
+                transcript = event["transcript"]
+                utterance_ended_at = utterance_ended_at or time.perf_counter()
+            yield event
+            if event["event"] == "error":
+                return
+    finally:
+        audio.close()  # También si el cliente se desconecta: termina el stream de gRPC
+
+    if not transcript:
+        yield {"event": "error", "error": "No se detectó voz en el audio"}
+        return
+    try:
+        ai_response = await aprocess_text_conversation(thread_id, transcript)
+    except Exception as e:
+        yield {"event": "error", "error": str(e)}
+        return
+    latency_ms = (time.perf_counter() - utterance_ended_at) * 1000
+    get_histogram("voice.stream.eou_to_response").observe(latency_ms)
+    logging.info(f"[voice_stream] thread={thread_id} audio_bytes={audio.bytes_received} "
+                 f"eou_to_response_ms={latency_ms:.1f}")
+    yield {
+        "event": "response",
+        "success": True,
+        "thread_id": thread_id,
+        "transcript": transcript,
+        "message": ai_response,
+        "eou_to_response_ms": round(latency_ms, 1)
+    }
+
+
+async def aiter_speech_chunks(text: str, voice_name: str = None):
+    """Fragmentos MP3 de text_to_speech_chunks sin bloquear el event loop (cada espera va a un hilo)"""
+    cancel = threading.Event()
+    chunks = flask_api.voice_tool_instance.text_to_speech_chunks(text, voice_name, cancel=cancel)
+    loop = asyncio.get_running_loop()
+    step = None
+    try:
+        while True:
+            step = loop.run_in_executor(None, next, chunks, None)
+            # shield: si se cancela esta corrutina el hilo sigue dentro del generador hasta terminar el paso
+            chunk = await asyncio.shield(step)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        # Cliente desconectado o fin: no se encolan más frases y se cancelan las pendientes.
+        # El generador no puede cerrarse mientras un hilo lo está ejecutando
+        cancel.set()
+        if step is not None and not step.done():
+            step.add_done_callback(lambda _: chunks.close())
+        else:
+            chunks.close()
+
+
+class UploadStreamingResponse(Response):
+    """
+    Server-Sent Events response that keeps reading the request body while it streams.
+    StreamingResponse cannot be used here: it listens for disconnects on the same
+    receive channel and would swallow the audio chunks still being uploaded.
+    """
+
+    def __init__(self, event_source):
+        self.status_code = 200
+        self.background = None
+        self.event_source = event_source  # callable(receive) -> iterador asíncrono de str
+        self.init_headers({"Content-Type": "text/event-stream", "Cache-Control": "no-cache",
+                           "X-Accel-Buffering": "no"})
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        async for chunk in self.event_source(receive):
+            await send({"type": "http.response.body", "body": chunk.encode("utf-8"), "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+@app.websocket("/conversation/voice/stream")
+@app.websocket("/api/conversation/voice/stream")
+async def voice_stream_websocket(websocket: WebSocket):
+    """
+    Turno de voz por WebSocket. Query: thread_id, encoding, sample_rate_hertz, language_code.
+    El cliente envía el audio en frames binarios y, opcionalmente, {"event": "end"} al terminar
+    de hablar; el servidor responde con eventos JSON y cierra tras 'response' o 'error'.
+    Con ?tts=1 (y voice_name) la respuesta se envía también hablada: frames binarios MP3
+    seguidos de {"event": "audio_end"}.
+    """
+    await websocket.accept()
+    if voice_stream_slots.locked():
+        await websocket.send_json({"event": "error", "error": "Demasiadas sesiones de voz simultáneas"})
+        await websocket.close(code=1013)
+        return
+    async with voice_stream_slots:
+        thread_id = websocket.query_params.get("thread_id") or f"voice_{uuid.uuid4().hex[:8]}"
+        audio = AudioChunkQueue()
+
+        async def receive_audio():
+            try:
+                while not audio.closed:
+                    message = await websocket.receive()
+                    if message["type"] == "websocket.disconnect":
+                        break
+                    if message.get("bytes"):
+                        audio.put(message["bytes"])
+                    elif message.get("text") and json.loads(message["text"]).get("event") == "end":
+                        break
+            except (WebSocketDisconnect, ValueError):
+                pass
+            finally:
+                audio.close()
+
+        receiver = asyncio.create_task(receive_audio())
+        try:
+            await websocket.send_json({"event": "ready", "thread_id": thread_id})
+            async for event in astream_voice_turn(thread_id, audio, voice_stream_options(websocket.query_params)):
+                await websocket.send_json(event)
+                if event["event"] == "response" and websocket.query_params.get("tts", "").lower() in ("1", "true"):
+                    # Respuesta hablada: cada fragmento MP3 va en un frame binario en cuanto está listo
+                    chunks = 0
+                    async for chunk in aiter_speech_chunks(event["message"], websocket.query_params.get("voice_name")):
+                        await websocket.send_bytes(chunk)
+                        chunks += 1
+                    await websocket.send_json({"event": "audio_end", "chunks": chunks, "audio_format": "MP3"})
+            await websocket.close()
+        except WebSocketDisconnect:
+            logging.info(f"[voice_stream] El cliente cerró la conexión ({thread_id})")
+        except ValueError as e:
+            await websocket.send_json({"event": "error", "error": str(e)})
+            await websocket.close(code=1003)
+        finally:
+            receiver.cancel()
+
+
+@app.post("/conversation/voice/stream")
+@app.post("/api/conversation/voice/stream")
+async def voice_stream_upload(request: Request):
+    """
+    Turno de voz con subida por chunks (Transfer-Encoding: chunked): el audio se reconoce
+    a medida que llega y los eventos se devuelven como Server-Sent Events.
+    Query: thread_id, encoding, sample_rate_hertz, language_code.
+    """
+    if voice_stream_slots.locked():
+        return JSONResponse({"success": False, "error": "Demasiadas sesiones de voz simultáneas"}, status_code=503)
+    try:
+        options = voice_stream_options(request.query_params)
+    except ValueError as e:
+        return JSONResponse({"success": False, "error": str(e)}, status_code=400)
+    thread_id = request.query_params.get("thread_id") or f"voice_{uuid.uuid4().hex[:8]}"
+
+    async def events(receive):
+        async with voice_stream_slots:
+            audio = AudioChunkQueue()
+
+            async def receive_audio():
+                try:
+                    while not audio.closed:
+                        message = await receive()
+                        if message["type"] == "http.disconnect":
+                            break
+                        audio.put(message.get("body", b""))  # Tras el final del enunciado se descarta
+                        if not message.get("more_body", False):
+                            break
+                finally:
+                    audio.close()
+
+            receiver = asyncio.create_task(receive_audio())
+            try:
+                async for event in astream_voice_turn(thread_id, audio, options):
+                    yield _sse_event(event["event"], event)
+            finally:
+                receiver.cancel()
+
+    return UploadStreamingResponse(events)
+
+
+@app.post("/tts")
+@app.post("/api/tts")
+async def text_to_speech_stream(request: Request):
+    """
+    Texto a voz. JSON: {'text': '...', 'voice_name': '...', 'format': 'mp3' | 'base64'}.
+    'mp3' (por defecto) devuelve audio/mpeg en streaming: cada frase se envía en cuanto se
+    sintetiza. 'base64' mantiene la respuesta JSON con el MP3 completo en base64.
+    """
+    try:
+        data = await request.json() or {}
+    except ValueError:
+        data = {}
+    text, voice_name = data.get("text"), data.get("voice_name")
+    if not text:
+        return JSONResponse({"success": False, "error": "Se requiere 'text'"}, status_code=400)
+    if flask_api.voice_tool_instance.tts_client is None:
+        return JSONResponse({"success": False, "error": "Cliente de Text-to-Speech no disponible"}, status_code=503)
+
+    if data.get("format", "mp3").lower() == "base64":
+        try:
+            audio_data = b"".join([chunk async for chunk in aiter_speech_chunks(text, voice_name)])
+        except Exception as e:
+            logging.error(f"Error en text-to-speech: {e}")
+            return JSONResponse({"success": False, "error": str(e)}, status_code=500)
+        return {
+            "success": True,
+            "audio_base64": base64.b64encode(audio_data).decode("utf-8"),
+            "audio_format": "MP3",
+            "voice_name": voice_name,
+            "audio_size_bytes": len(audio_data)
+        }
+
+    return StreamingResponse(
+        aiter_speech_chunks(text, voice_name),
+        media_type="audio/mpeg",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# Rutas Flask sin equivalente nativo. '/legacy' expone también la ruta Flask de
+# /conversation (útil para comparar ambas implementaciones o revertir).
+app.mount("/legacy", flask_wsgi)
+app.mount("/", flask_wsgi)
@@ -4,11 +4,17 @@
 # y facilita la importación de módulos dentro de este paquete.
 
 try:
-    from .graph_definition import create_hr_graph
+    from .graph_definition import create_hr_graph, get_hr_graph, rebuild_hr_graph, get_llm_pool_stats
 except ImportError as e:
     import logging
     logging.warning(f"Error al importar graph_definition: {e}")
     # Definir una función de respaldo para evitar errores fatales
     def create_hr_graph(*args, **kwargs):
         logging.error("No se pudo cargar el grafo HR. Usando función de respaldo.")
-        return None
\ No newline at end of file
+        return None
+
+    get_hr_graph = create_hr_graph
+    rebuild_hr_graph = create_hr_graph
+
+    def get_llm_pool_stats():
+        return {}
\ No newline at end of file
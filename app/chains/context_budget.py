@@ -0,0 +1,236 @@
+# chains/context_budget.py
+"""
+Context budget for the conversation history sent to the LLM.
+
+The history is split into turns (each turn starts at a HumanMessage and holds the
+AI/tool messages that followed it). The last N turns are kept verbatim; older
+turns are folded into a rolling summary that is updated incrementally, so each
+turn is summarized only once. A cheap local token estimator enforces a hard
+ceiling on summary + window; the system prompt is not counted because it is
+constant (and served from the prompt cache). The in-progress turn is never
+folded, so when it alone overflows the ceiling its longest messages are
+truncated in the window sent to the LLM (the stored history is untouched).
+"""
+import math
+import logging
+from typing import Callable, List, Optional, Tuple
+
+from langchain_core.messages import BaseMessage, AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+# Aproximación habitual: ~4 caracteres por token en texto español/inglés
+CHARS_PER_TOKEN = 4
+# Sobrecarga por mensaje (rol, separadores)
+MESSAGE_OVERHEAD_TOKENS = 4
+# Lo mínimo que se conserva de un mensaje recortado para respetar el techo de tokens
+MIN_TRUNCATED_MESSAGE_TOKENS = 200
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap local token estimate; no tokenizer or network call involved."""
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def estimate_message_tokens(message: BaseMessage) -> int:
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    tokens = estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+    for tool_call in getattr(message, "tool_calls", None) or []:
+        tokens += estimate_tokens(str(tool_call.get("args", ""))) + MESSAGE_OVERHEAD_TOKENS
+    return tokens
+
+
+def split_turns(messages: List[BaseMessage]) -> Tuple[List[BaseMessage], List[List[BaseMessage]]]:
+    """
+    Splits a message list into (leading system messages, turns).
+    Messages before the first HumanMessage that are not system messages form their own turn.
+    """
+    system_messages = []
+    index = 0
+    while index < len(messages) and isinstance(messages[index], SystemMessage):
+        system_messages.append(messages[index])
+        index += 1
+
+    turns: List[List[BaseMessage]] = []
+    for message in messages[index:]:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([message])
+        else:
+            turns[-1].append(message)
+    return system_messages, turns
+
+
+def format_turns_for_summary(turns: List[List[BaseMessage]]) -> str:
+    """Plain-text transcript of the turns, used as summarizer input (tool calls are omitted)."""
+    lines = []
+    for turn in turns:
+        for message in turn:
+            if isinstance(message, HumanMessage):
+                speaker = "Usuario"
+            elif isinstance(message, AIMessage) and not message.tool_calls:
+                speaker = "Asistente"
+            elif isinstance(message, ToolMessage):
+                speaker = "Herramienta"
+            else:
+                continue
+            content = message.content if isinstance(message.content, str) else str(message.content)
+            if content.strip():
+                lines.append(f"{speaker}: {content.strip()}")
+    return "\n".join(lines)
+
+
+def build_summary_prompt(previous_summary: Optional[str], turns: List[List[BaseMessage]], max_tokens: int) -> str:
+    return (
+        "Actualiza el resumen de una conversación entre un usuario y Geraldine, asistente legal. "
+        "Conserva datos del usuario (nombre, país, empresa), decisiones, montos, fechas, documentos "
+        "mencionados y solicitudes pendientes. Omite saludos y relleno. "
+        f"Responde solo con el resumen actualizado, en español, en menos de {max_tokens * CHARS_PER_TOKEN} caracteres.\n\n"
+        f"RESUMEN ANTERIOR:\n{previous_summary or '(vacío)'}\n\n"
+        f"NUEVOS TURNOS:\n{format_turns_for_summary(turns)}"
+    )
+
+
+def fallback_summary(previous_summary: Optional[str], turns: List[List[BaseMessage]], max_tokens: int) -> str:
+    """Extractive summary used when the LLM summarizer fails: keeps the most recent text within budget."""
+    text = "\n".join(part for part in [previous_summary, format_turns_for_summary(turns)] if part)
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    return text if len(text) <= max_chars else "..." + text[-max_chars:]
+
+
+def plan_context_window(turns: List[List[BaseMessage]], folded_turns: int, summary: Optional[str],
+                        keep_turns: int, max_tokens: int) -> int:
+    """
+    Decides how many turns (from the start of `turns`) must be folded into the summary.
+
+    Keeps at most `keep_turns` unfolded turns, then folds more of the oldest ones while
+    summary + window exceed `max_tokens`. The last (in-progress) turn is never folded.
+    Returns the new number of folded turns (>= folded_turns).
+    """
+    keep_turns = max(keep_turns, 1)
+    new_folded = max(folded_turns, len(turns) - keep_turns)
+    summary_tokens = estimate_tokens(summary or "")
+    window_tokens = sum(estimate_message_tokens(m) for turn in turns[new_folded:] for m in turn)
+    while summary_tokens + window_tokens > max_tokens and new_folded < len(turns) - 1:
+        window_tokens -= sum(estimate_message_tokens(m) for m in turns[new_folded])
+        new_folded += 1
+    return new_folded
+
+
+def truncate_text(text: str, max_tokens: int) -> str:
+    """Keeps the head and the tail of `text` within ~max_tokens, marking the omitted middle."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    marker = f"\n[... {len(text)} caracteres omitidos ...]\n"  # Cota superior de su longitud final
+    kept = max(max_chars - len(marker), 0)
+    head = kept * 2 // 3
+    tail = kept - head
+    return f"{text[:head]}\n[... {len(text) - kept} caracteres omitidos ...]\n{text[len(text) - tail:]}"
+
+
+def fit_turns_to_budget(turns: List[List[BaseMessage]], summary: Optional[str],
+                        max_tokens: int) -> List[List[BaseMessage]]:
+    """
+    Truncates the longest text messages of `turns` (largest first) until summary + turns
+    fit in `max_tokens`, or nothing else can be cut. Returns copies; the input is untouched.
+    """
+    turns = [list(turn) for turn in turns]
+    total = estimate_tokens(summary or "") + sum(estimate_message_tokens(m) for turn in turns for m in turn)
+    if total <= max_tokens:
+        return turns
+
+    original = total
+    candidates = sorted(
+        ((t, i) for t, turn in enumerate(turns) for i, m in enumerate(turn) if isinstance(m.content, str)),
+        key=lambda position: estimate_message_tokens(turns[position[0]][position[1]]),
+        reverse=True
+    )
+    for t, i in candidates:
+        if total <= max_tokens:
+            break
+        message = turns[t][i]
+        content_tokens = estimate_tokens(message.content)
+        target = max(content_tokens - (total - max_tokens), MIN_TRUNCATED_MESSAGE_TOKENS)
+        if target >= content_tokens:
+            continue
+        truncated = message.model_copy(update={"content": truncate_text(message.content, target)})
+        total += estimate_message_tokens(truncated) - estimate_message_tokens(message)
+        turns[t][i] = truncated
+
+    log = logging.warning if total > max_tokens else logging.info
+    log(f"[context_budget] El turno en curso supera el techo de contexto ({original} > {max_tokens} tokens); "
+        f"mensajes recortados a {total} tokens")
+    return turns
+
+
+def build_window_messages(messages: List[BaseMessage], folded_turns: int, summary: Optional[str],
+                          max_tokens: Optional[int] = None) -> List[BaseMessage]:
+    """
+    Returns system messages + summary message + the unfolded turns, in order.
+    With `max_tokens`, messages of the unfolded turns are truncated so summary + turns
+    stay under the ceiling even when the retained turn alone exceeds it.
+    """
+    system_messages, turns = split_turns(messages)
+    window = list(system_messages)
+    if summary:
+        window.append(SystemMessage(
+            content=f"[Resumen de la conversación anterior. Úsalo como contexto; no lo menciones al usuario.]\n{summary}",
+            name="conversation_summary"
+        ))
+    turns = turns[folded_turns:]
+    if max_tokens:
+        turns = fit_turns_to_budget(turns, summary, max_tokens)
+    for turn in turns:
+        window.extend(turn)
+    return window
+
+
+def update_summary(state: dict, keep_turns: int, max_tokens: int, summary_max_tokens: int,
+                   summarize_fn: Callable[[str], str]) -> dict:
+    """
+    Folds turns that fall outside the budget into the rolling summary.
+    Returns the state update ({} when nothing changes).
+    """
+    _, turns = split_turns(list(state.get("messages", [])))
+    offset = state.get("state_turn_offset") or 0
+    folded = max((state.get("summarized_turns") or 0) - offset, 0)
+    summary = state.get("conversation_summary")
+
+    new_folded = plan_context_window(turns, folded, summary, keep_turns, max_tokens)
+    if new_folded <= folded:
+        return {}
+
+    to_fold = turns[folded:new_folded]
+    try:
+        new_summary = summarize_fn(build_summary_prompt(summary, to_fold, summary_max_tokens)).strip()
+        if not new_summary:
+            raise ValueError("resumen vacío")
+    except Exception as e:
+        print(f"[WARN] context_budget: Falló el resumen con LLM ({e}). Usando resumen extractivo.")
+        new_summary = fallback_summary(summary, to_fold, summary_max_tokens)
+
+    return {"conversation_summary": new_summary, "summarized_turns": offset + new_folded}
+
+
+async def aupdate_summary(state: dict, keep_turns: int, max_tokens: int, summary_max_tokens: int,
+                          asummarize_fn) -> dict:
+    """Async twin of update_summary; asummarize_fn is awaited."""
+    _, turns = split_turns(list(state.get("messages", [])))
+    offset = state.get("state_turn_offset") or 0
+    folded = max((state.get("summarized_turns") or 0) - offset, 0)
+    summary = state.get("conversation_summary")
+
+    new_folded = plan_context_window(turns, folded, summary, keep_turns, max_tokens)
+    if new_folded <= folded:
+        return {}
+
+    to_fold = turns[folded:new_folded]
+    try:
+        new_summary = (await asummarize_fn(build_summary_prompt(summary, to_fold, summary_max_tokens))).strip()
+        if not new_summary:
+            raise ValueError("resumen vacío")
+    except Exception as e:
+        print(f"[WARN] context_budget: Falló el resumen con LLM ({e}). Usando resumen extractivo.")
+        new_summary = fallback_summary(summary, to_fold, summary_max_tokens)
+
+    return {"conversation_summary": new_summary, "summarized_turns": offset + new_folded}
@@ -2,6 +2,8 @@
 import sys
 import os
 import re # <-- Added import for regular expressions
+import time
+import threading
 from typing import Annotated, List, Optional, Dict
 from typing_extensions import TypedDict
 import traceback # Import traceback for better error logging
@@ -9,6 +11,7 @@ import traceback # Import traceback for better error logging
 
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import BaseMessage, AIMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph, END
 from langgraph.graph.message import add_messages
 from langgraph.prebuilt import ToolNode, tools_condition
@@ -18,9 +21,19 @@ from langgraph.prebuilt import ToolNode, tools_condition
 try:
     # Assumes execution context where 'config' and 'src' are findable
     from app.config.settings import MARCELLA_GOOGLE_API_KEY, LLM_MODEL_NAME, LLM_TEMPERATURE, SYSTEM_MESSAGE
+    from app.config.settings import PROMPT_CACHE_BACKEND, PROMPT_CACHE_TTL_SECONDS, PROMPT_CACHE_REFRESH_MARGIN_SECONDS
+    from app.config.settings import CONTEXT_KEEP_TURNS, CONTEXT_MAX_HISTORY_TOKENS, CONTEXT_SUMMARY_MAX_TOKENS, CONTEXT_SUMMARY_MODEL
+    from app.chains.prompt_cache import create_prompt_cache
+    from app.chains.context_budget import update_summary, aupdate_summary, build_window_messages
     # from app.src.tools import hr_tools_list # Importa la lista de herramientas - COMENTADO TEMPORALMENTE
     hr_tools_list = []  # Lista vacía temporal mientras las tools están comentadas
+
+    # --- Caché del prefijo del prompt (SYSTEM_MESSAGE) ---
+    prompt_cache = create_prompt_cache(
+        PROMPT_CACHE_BACKEND, MARCELLA_GOOGLE_API_KEY, PROMPT_CACHE_TTL_SECONDS, PROMPT_CACHE_REFRESH_MARGIN_SECONDS
+    )
 except ImportError as e:
+    prompt_cache = None  # Sin configuración no hay caché de prompt: se envía el prompt completo
     print(f"Error importando dependencias en graph_definition.py: {e}")
     print(f"sys.path actual: {sys.path}")
     print("Asegúrate de que la estructura de carpetas es correcta y __init__.py existen.")
@@ -43,27 +56,166 @@ class State(TypedDict):
     cv_summary: Optional[str] # Summary or full text extracted from CV
     cv_analysis: Optional[Dict[str, any]] # Result of RAG analysis on CV
     cv_info: Optional[Dict[str, any]] # Structured CV info (future use)
+    conversation_summary: Optional[str] # Rolling summary of turns folded out of the context window
+    summarized_turns: int    # Turns folded into the summary since the thread started (persisted)
+    state_turn_offset: int   # Turns already absent from 'messages' when the state was rebuilt from MongoDB
 
 # --- Configuración del LLM ---
-def get_llm_with_tools():
-    """Creates and configures the LLM instance with bound tools."""
+# Caché de clientes LLM ya enlazados con sus herramientas, por proceso.
+# Crear ChatGoogleGenerativeAI abre un transporte nuevo (HTTP/gRPC); reutilizar
+# la instancia mantiene la conexión caliente entre turnos y entre iteraciones
+# del bucle de herramientas.
+_llm_cache = {}
+_llm_cache_lock = threading.Lock()
+_llm_cache_stats = {"hits": 0, "misses": 0}
+
+def _tools_cache_key(tools):
+    """Stable key for a tool set: tool names in binding order."""
+    return tuple(getattr(t, "name", None) or getattr(t, "__name__", repr(t)) for t in tools)
+
+def get_llm_with_tools(model_name: Optional[str] = None, temperature: Optional[float] = None, tools: Optional[list] = None,
+                       cached_content: Optional[str] = None):
+    """
+    Returns a cached LLM instance with bound tools.
+    Instances are keyed by model name, temperature, tool set and cached content, and are created once per process.
+    With cached_content the tools already live in the server-side cache, so they are not bound again.
+    """
     if not MARCELLA_GOOGLE_API_KEY:
         raise ValueError("Google API Key not configured. Check config/settings.py and .env")
 
-    llm = ChatGoogleGenerativeAI(
-        model=LLM_MODEL_NAME,
-        google_api_key=MARCELLA_GOOGLE_API_KEY,
-        temperature=LLM_TEMPERATURE,
-        convert_system_message_to_human=False # Usually correct for Gemini
-    )
-    # Bind the tools defined in hr_tools_list to the LLM
-    return llm.bind_tools(hr_tools_list)
+    model_name = model_name or LLM_MODEL_NAME
+    temperature = LLM_TEMPERATURE if temperature is None else temperature
+    tools = hr_tools_list if tools is None else tools
+    cache_key = (model_name, temperature, _tools_cache_key(tools), cached_content)
+
+    with _llm_cache_lock:
+        llm_with_tools = _llm_cache.get(cache_key)
+        if llm_with_tools is not None:
+            _llm_cache_stats["hits"] += 1
+            return llm_with_tools
+
+        _llm_cache_stats["misses"] += 1
+        if cached_content:
+            # Un contexto cacheado nuevo reemplaza al anterior: soltar los clientes que apuntan al viejo
+            for stale_key in [k for k in _llm_cache if k[:3] == cache_key[:3] and k[3]]:
+                del _llm_cache[stale_key]
+            llm_with_tools = ChatGoogleGenerativeAI(
+                model=model_name,
+                google_api_key=MARCELLA_GOOGLE_API_KEY,
+                temperature=temperature,
+                cached_content=cached_content
+            )
+        else:
+            llm = ChatGoogleGenerativeAI(
+                model=model_name,
+                google_api_key=MARCELLA_GOOGLE_API_KEY,
+                temperature=temperature,
+                convert_system_message_to_human=False # Usually correct for Gemini
+            )
+            # Bind the tools to the LLM
+            llm_with_tools = llm.bind_tools(tools)
+        _llm_cache[cache_key] = llm_with_tools
+        if DEBUG_MODE:
+            print(f"--- [Grafo] Nuevo cliente LLM creado para {cache_key[:2]} con {len(tools)} herramientas ---")
+        return llm_with_tools
+
+def get_llm_pool_stats() -> Dict[str, any]:
+    """Returns hit/miss counters and the cached client keys."""
+    with _llm_cache_lock:
+        return {
+            "size": len(_llm_cache),
+            "hits": _llm_cache_stats["hits"],
+            "misses": _llm_cache_stats["misses"],
+            "clients": [
+                {"model": key[0], "temperature": key[1], "tools": len(key[2]), "cached_content": key[3]}
+                for key in _llm_cache
+            ]
+        }
+
+def get_prompt_cache_stats() -> Dict[str, any]:
+    """Returns prompt-cache metrics (cached vs. uncached input tokens), or {'enabled': False}."""
+    if prompt_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **prompt_cache.stats()}
+
+def _uses_prompt_cache(final_messages_for_llm: List[BaseMessage]) -> bool:
+    """True when the conversation starts with the standard SYSTEM_MESSAGE and caching is enabled."""
+    first = final_messages_for_llm[0]
+    return prompt_cache is not None and isinstance(first, SystemMessage) and first.content == SYSTEM_MESSAGE
+
+def _llm_call(final_messages_for_llm: List[BaseMessage], cached_content: Optional[str]):
+    """
+    Picks the LLM client and the messages to send.
+    With a cached context the system prompt is dropped from the request (it lives in
+    the cache) and any remaining system messages are sent as human context, since
+    Gemini rejects system instructions alongside cached content.
+    Returns (llm, messages, cached_content or None).
+    """
+    if cached_content:
+        messages = [
+            HumanMessage(content=m.content) if isinstance(m, SystemMessage) else m
+            for m in final_messages_for_llm[1:]
+        ]
+        return get_llm_with_tools(cached_content=cached_content), messages, cached_content
+    return get_llm_with_tools(), final_messages_for_llm, None
+
+def _resolve_llm_call(final_messages_for_llm: List[BaseMessage]):
+    """Sync path: may block while the cached context is created or refreshed."""
+    cached_content = None
+    if _uses_prompt_cache(final_messages_for_llm):
+        cached_content = prompt_cache.get_cached_content(LLM_MODEL_NAME, SYSTEM_MESSAGE, hr_tools_list)
+    return _llm_call(final_messages_for_llm, cached_content)
+
+async def _aresolve_llm_call(final_messages_for_llm: List[BaseMessage]):
+    """Async path: cache creation runs off the event loop (see PromptCache.aget_cached_content)."""
+    cached_content = None
+    if _uses_prompt_cache(final_messages_for_llm):
+        cached_content = await prompt_cache.aget_cached_content(LLM_MODEL_NAME, SYSTEM_MESSAGE, hr_tools_list)
+    return _llm_call(final_messages_for_llm, cached_content)
+
+def _invoke_llm(final_messages_for_llm: List[BaseMessage]):
+    """Invokes the LLM using the cached prompt prefix when possible; retries uncached if the cache is rejected."""
+    llm, messages, cached_content = _resolve_llm_call(final_messages_for_llm)
+    if cached_content:
+        try:
+            response = llm.invoke(messages)
+            prompt_cache.record_usage(response, used_cache=True)
+            return response
+        except Exception as e:
+            print(f"[WARN] chatbot_node: Falló la llamada con contexto cacheado ({e}). Reintentando sin caché.")
+            prompt_cache.invalidate(cached_content)
+    response = get_llm_with_tools().invoke(final_messages_for_llm)
+    if prompt_cache is not None:
+        prompt_cache.record_usage(response, used_cache=False)
+    return response
+
+async def _ainvoke_llm(final_messages_for_llm: List[BaseMessage]):
+    """Async twin of _invoke_llm."""
+    llm, messages, cached_content = await _aresolve_llm_call(final_messages_for_llm)
+    if cached_content:
+        try:
+            response = await llm.ainvoke(messages)
+            prompt_cache.record_usage(response, used_cache=True)
+            return response
+        except Exception as e:
+            print(f"[WARN] achatbot_node: Falló la llamada con contexto cacheado ({e}). Reintentando sin caché.")
+            prompt_cache.invalidate(cached_content)
+    response = await get_llm_with_tools().ainvoke(final_messages_for_llm)
+    if prompt_cache is not None:
+        prompt_cache.record_usage(response, used_cache=False)
+    return response
+
+def clear_llm_cache():
+    """Drops every cached LLM client. The next call to get_llm_with_tools() creates fresh ones."""
+    with _llm_cache_lock:
+        _llm_cache.clear()
 
 # --- Nodos del Grafo ---
 
-def chatbot_node(state: State):
+def _prepare_llm_messages(state: State) -> Optional[List[BaseMessage]]:
     """
-    Main node interacting with the LLM to generate responses or decide tool usage.
+    Builds the message list sent to the LLM: ensures the system prompt, adds CV/RAG
+    context and filters invalid messages. Returns None if nothing valid remains.
     """
     if DEBUG_MODE:
         print("\n--- [Grafo] Entrando en Nodo: chatbot_node ---")
@@ -86,7 +238,7 @@ def chatbot_node(state: State):
             current_messages = [system_msg]
         else:
             print("[ERROR] chatbot_node: Message state empty and SYSTEM_MESSAGE not defined.")
-            return {} # Avoid LLM call if no messages and no system prompt
+            return None # Avoid LLM call if no messages and no system prompt
 
     # --- Ensure System Message ---
     # Check if the first message is SystemMessage or has type 'system'. If not, prepend it.
@@ -102,6 +254,15 @@ def chatbot_node(state: State):
             system_msg = SystemMessage(content=SYSTEM_MESSAGE)
             current_messages.insert(0, system_msg)
 
+    # --- Context Budget: summary + recent turns only ---
+    # Turns already folded into the rolling summary are replaced by the summary itself.
+    # The window is also capped at CONTEXT_MAX_HISTORY_TOKENS: an oversized in-progress turn is truncated.
+    folded_turns = max((state.get("summarized_turns") or 0) - (state.get("state_turn_offset") or 0), 0)
+    current_messages = build_window_messages(current_messages, folded_turns, state.get("conversation_summary"),
+                                             CONTEXT_MAX_HISTORY_TOKENS)
+    if DEBUG_MODE and (folded_turns or state.get("conversation_summary")):
+        print(f"[Grafo] chatbot_node: {folded_turns} turnos sustituidos por el resumen. Mensajes en ventana: {len(current_messages)}")
+
     # --- Context Enrichment with CV/RAG Data ---
     last_message = current_messages[-1] if current_messages else None
     should_enrich = bool(state.get("cv_summary") or state.get("cv_analysis"))
@@ -205,12 +366,8 @@ def chatbot_node(state: State):
     if not final_messages_for_llm:
         if DEBUG_MODE:
             print("[ERROR] chatbot_node: No valid messages remaining after filtering. Aborting LLM call.")
-        return {} # Return empty dict to avoid errors downstreams
-
-    # --- START OF REPLACED BLOCK ---
+        return None
 
-    # --- Llamada al LLM ---
-    llm_with_tools = get_llm_with_tools() # Obtiene el LLM configurado
     if DEBUG_MODE:
         print(f"--- [Grafo] Mensajes FINALES enviados al LLM ({len(final_messages_for_llm)}): ---")
         # Imprimir representación más corta en debug
@@ -219,72 +376,141 @@ def chatbot_node(state: State):
             print(f"  {i}: Type={type(m).__name__}, Content='{str(getattr(m, 'content', 'N/A'))[:100]}...', ToolCalls={tool_calls_present}")
         print("--- [Grafo] Llamando al LLM... ---")
 
-    # Invocar el LLM con los mensajes finales procesados
-    try:
-        response = llm_with_tools.invoke(final_messages_for_llm)
-        
-        # Asegúrate de que la respuesta sea un AIMessage
-        if not isinstance(response, AIMessage):
-            response = AIMessage(content=str(response))
-        
-        # Procesamiento de la respuesta para corregir problemas conocidos
-        if isinstance(response, AIMessage) and response.content and isinstance(response.content, str):
-            content = response.content
-            original_content = content # Keep original for comparison
-
-            # Corregir problema de URLs duplicadas en formato markdown
-            url_pattern = r'\[(https?://[^\]]+)\]\(\1\)' # Use backreference \1 to ensure URLs match
-            urls_found = re.findall(url_pattern, content) # Find only the URL part
-
-            modified = False
-            if urls_found:
-                if DEBUG_MODE: 
-                    print(f"--- [Grafo] Found duplicated URL patterns to potentially fix: {urls_found}")
+    return final_messages_for_llm
+
+
+def _postprocess_llm_response(response) -> AIMessage:
+    """Normalizes the LLM output to an AIMessage and fixes known formatting issues."""
+    # Asegúrate de que la respuesta sea un AIMessage
+    if not isinstance(response, AIMessage):
+        response = AIMessage(content=str(response))
+    
+    # Procesamiento de la respuesta para corregir problemas conocidos
+    if isinstance(response, AIMessage) and response.content and isinstance(response.content, str):
+        content = response.content
+        original_content = content # Keep original for comparison
+
+        # Corregir problema de URLs duplicadas en formato markdown
+        url_pattern = r'\[(https?://[^\]]+)\]\(\1\)' # Use backreference \1 to ensure URLs match
+        urls_found = re.findall(url_pattern, content) # Find only the URL part
+
+        modified = False
+        if urls_found:
+            if DEBUG_MODE: 
+                print(f"--- [Grafo] Found duplicated URL patterns to potentially fix: {urls_found}")
+            
+            def replace_link(match):
+                nonlocal modified # Allow modification of outer scope variable
+                full_match_text = match.group(0) # e.g., [http://...](http://...)
+                actual_url = match.group(1)      # e.g., http://...
                 
-                def replace_link(match):
-                    nonlocal modified # Allow modification of outer scope variable
-                    full_match_text = match.group(0) # e.g., [http://...](http://...)
-                    actual_url = match.group(1)      # e.g., http://...
-                    
-                    # Create a link with more descriptive text
-                    if 'docs.google.com/document' in actual_url:
-                        replacement = f"[Ver CV en Google Docs]({actual_url})"
-                    elif 'drive.google.com' in actual_url:
-                        replacement = f"[Ver archivo en Google Drive]({actual_url})"
-                    else:
-                        replacement = f"[Ver enlace]({actual_url})"
-
-                    if replacement != full_match_text:
-                        modified = True # Mark that a change happened
-                        if DEBUG_MODE: 
-                            print(f"--- [Grafo] Replacing link '{full_match_text}' with '{replacement}'")
-                        return replacement
-                    else:
-                        return full_match_text # Return original if no change needed
-
-                content = re.sub(url_pattern, replace_link, content)
-
-            # Si se hicieron cambios, actualizar el contenido del mensaje
-            if modified:
-                if DEBUG_MODE:
-                    print("--- [Grafo] Se corrigió el formato de enlaces duplicados en la respuesta ---")
-                response.content = content # Update the response object's content
-            elif DEBUG_MODE and urls_found:
-                print("--- [Grafo] Duplicated URL patterns found, but replacement logic didn't change them.")
+                # Create a link with more descriptive text
+                if 'docs.google.com/document' in actual_url:
+                    replacement = f"[Ver CV en Google Docs]({actual_url})"
+                elif 'drive.google.com' in actual_url:
+                    replacement = f"[Ver archivo en Google Drive]({actual_url})"
+                else:
+                    replacement = f"[Ver enlace]({actual_url})"
 
-        if DEBUG_MODE:
-            resp_repr = response.pretty_repr() if hasattr(response, 'pretty_repr') else str(response)
-            print(f"--- [Grafo] Respuesta recibida del LLM: {resp_repr} ---")
-            print("--- [Grafo] Saliendo de Nodo: chatbot_node ---")
+                if replacement != full_match_text:
+                    modified = True # Mark that a change happened
+                    if DEBUG_MODE: 
+                        print(f"--- [Grafo] Replacing link '{full_match_text}' with '{replacement}'")
+                    return replacement
+                else:
+                    return full_match_text # Return original if no change needed
+
+            content = re.sub(url_pattern, replace_link, content)
+
+        # Si se hicieron cambios, actualizar el contenido del mensaje
+        if modified:
+            if DEBUG_MODE:
+                print("--- [Grafo] Se corrigió el formato de enlaces duplicados en la respuesta ---")
+            response.content = content # Update the response object's content
+        elif DEBUG_MODE and urls_found:
+            print("--- [Grafo] Duplicated URL patterns found, but replacement logic didn't change them.")
+
+    if DEBUG_MODE:
+        resp_repr = response.pretty_repr() if hasattr(response, 'pretty_repr') else str(response)
+        print(f"--- [Grafo] Respuesta recibida del LLM: {resp_repr} ---")
+        print("--- [Grafo] Saliendo de Nodo: chatbot_node ---")
+
+    return response
 
-        return {"messages": [response]}
 
+def chatbot_node(state: State):
+    """
+    Main node interacting with the LLM to generate responses or decide tool usage.
+    """
+    final_messages_for_llm = _prepare_llm_messages(state)
+    if not final_messages_for_llm:
+        return {} # Return empty dict to avoid errors downstreams
+
+    # --- Llamada al LLM (cliente reutilizado desde la caché, con el prefijo del prompt cacheado si está disponible) ---
+    try:
+        response = _invoke_llm(final_messages_for_llm)
+        return {"messages": [_postprocess_llm_response(response)]}
     except Exception as e:
         print(f"Error en chatbot_node: {e}")
         error_message = AIMessage(content=f"Ocurrió un error: {str(e)}")
         return {"messages": [error_message]}
 
-    # --- END OF REPLACED BLOCK ---
+
+async def achatbot_node(state: State):
+    """
+    Async twin of chatbot_node, used by graph.ainvoke/astream so the LLM call
+    does not block the event loop.
+    """
+    final_messages_for_llm = _prepare_llm_messages(state)
+    if not final_messages_for_llm:
+        return {}
+
+    try:
+        response = await _ainvoke_llm(final_messages_for_llm)
+        return {"messages": [_postprocess_llm_response(response)]}
+    except Exception as e:
+        print(f"Error en achatbot_node: {e}")
+        error_message = AIMessage(content=f"Ocurrió un error: {str(e)}")
+        return {"messages": [error_message]}
+
+
+# --- Nodo de Presupuesto de Contexto ---
+_summarizer_llm = None
+_summarizer_lock = threading.Lock()
+
+def _get_summarizer_llm():
+    """Returns the (cached) LLM used to fold old turns into the rolling summary."""
+    global _summarizer_llm
+    with _summarizer_lock:
+        if _summarizer_llm is None:
+            _summarizer_llm = ChatGoogleGenerativeAI(
+                model=CONTEXT_SUMMARY_MODEL,
+                google_api_key=MARCELLA_GOOGLE_API_KEY,
+                temperature=0.0
+            )
+        return _summarizer_llm
+
+def context_budget_node(state: State):
+    """
+    Runs before the chatbot on every user turn. Folds turns beyond the configured
+    window (CONTEXT_KEEP_TURNS) or token ceiling (CONTEXT_MAX_HISTORY_TOKENS) into
+    the rolling summary. chatbot_node then sends only summary + recent turns.
+    """
+    update = update_summary(
+        state, CONTEXT_KEEP_TURNS, CONTEXT_MAX_HISTORY_TOKENS, CONTEXT_SUMMARY_MAX_TOKENS,
+        lambda prompt: _get_summarizer_llm().invoke(prompt).content
+    )
+    if DEBUG_MODE and update:
+        print(f"[Grafo] context_budget_node: Resumen actualizado ({update['summarized_turns']} turnos resumidos).")
+    return update
+
+async def acontext_budget_node(state: State):
+    """Async twin of context_budget_node."""
+    async def asummarize(prompt):
+        return (await _get_summarizer_llm().ainvoke(prompt)).content
+    return await aupdate_summary(
+        state, CONTEXT_KEEP_TURNS, CONTEXT_MAX_HISTORY_TOKENS, CONTEXT_SUMMARY_MAX_TOKENS, asummarize
+    )
 
 
 # --- Nodo para Procesamiento RAG ---
@@ -370,6 +596,54 @@ def rag_processor_node(state: State):
 
 
 # --- Construcción y Compilación del Grafo ---
+# Registro del grafo compilado: uno por proceso, reutilizado entre peticiones.
+# Un grafo compilado sin checkpointer no guarda estado entre invocaciones,
+# así que es seguro compartirlo entre hilos.
+_compiled_graph = None
+_graph_lock = threading.Lock()
+GRAPH_BUILD_STATS = {
+    "builds": 0,               # Número de compilaciones en este proceso
+    "last_build_seconds": None, # Duración de la última construcción + compilación
+    "last_built_at": None      # Epoch de la última compilación
+}
+
+def get_hr_graph():
+    """
+    Returns the process-wide compiled graph, building it on first use.
+    Use this instead of create_hr_graph() on request paths.
+    """
+    global _compiled_graph
+    if _compiled_graph is None:
+        with _graph_lock:
+            if _compiled_graph is None: # Double-checked: otro hilo pudo compilarlo mientras esperábamos
+                _compiled_graph = _build_hr_graph_timed()
+    return _compiled_graph
+
+def rebuild_hr_graph():
+    """
+    Rebuilds the process-wide compiled graph and swaps it in atomically.
+    Call this after changing hr_tools_list or the LLM configuration; it also drops
+    the cached LLM clients so they are re-created with the new settings.
+    Requests already running keep using the previous graph until they finish.
+    """
+    global _compiled_graph
+    clear_llm_cache() # Las herramientas o la configuración del LLM pueden haber cambiado
+    with _graph_lock:
+        _compiled_graph = _build_hr_graph_timed()
+    return _compiled_graph
+
+def _build_hr_graph_timed():
+    """Builds the graph and records how long construction and compilation took."""
+    start = time.perf_counter()
+    compiled_graph = create_hr_graph()
+    elapsed = time.perf_counter() - start
+    GRAPH_BUILD_STATS["builds"] += 1
+    GRAPH_BUILD_STATS["last_build_seconds"] = elapsed
+    GRAPH_BUILD_STATS["last_built_at"] = time.time()
+    if DEBUG_MODE:
+        print(f"--- [Grafo] Construcción y compilación completadas en {elapsed * 1000:.1f} ms ---")
+    return compiled_graph
+
 def create_hr_graph():
     """Builds and compiles the LangGraph graph with defined nodes and edges."""
     if DEBUG_MODE:
@@ -378,15 +652,20 @@ def create_hr_graph():
     graph_builder = StateGraph(State)
 
     # --- Add Nodes ---
-    if DEBUG_MODE: print("[Grafo] Añadiendo nodos: chatbot, rag_processor, tools")
-    graph_builder.add_node("chatbot", chatbot_node)
+    if DEBUG_MODE: print("[Grafo] Añadiendo nodos: context_budget, chatbot, rag_processor, tools")
+    graph_builder.add_node("context_budget", RunnableLambda(context_budget_node, afunc=acontext_budget_node, name="context_budget"))
+    # El nodo chatbot tiene variante síncrona y asíncrona: invoke() usa la primera, ainvoke()/astream() la segunda
+    graph_builder.add_node("chatbot", RunnableLambda(chatbot_node, afunc=achatbot_node, name="chatbot"))
     graph_builder.add_node("rag_processor", rag_processor_node)
     tool_node = ToolNode(tools=hr_tools_list) # ToolNode executes tools selected by LLM
     graph_builder.add_node("tools", tool_node)
 
     # --- Define Entry Point ---
-    if DEBUG_MODE: print("[Grafo] Estableciendo punto de entrada: chatbot")
-    graph_builder.set_entry_point("chatbot")
+    # Cada turno del usuario pasa primero por el presupuesto de contexto; el bucle
+    # tools -> chatbot no vuelve a pasar por él (el turno en curso nunca se resume).
+    if DEBUG_MODE: print("[Grafo] Estableciendo punto de entrada: context_budget -> chatbot")
+    graph_builder.set_entry_point("context_budget")
+    graph_builder.add_edge("context_budget", "chatbot")
 
     # --- Define Edges (Control Flow) ---
 
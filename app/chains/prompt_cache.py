@@ -0,0 +1,195 @@
+# chains/prompt_cache.py
+"""
+Prompt-prefix caching for the (very large) SYSTEM_MESSAGE.
+
+Gemini can store a prefix (system instruction + tools) server-side as a
+"cached content" and bill/serve it at a reduced cost on later calls. This module
+creates that cached context once per model and prompt hash, refreshes it before
+it expires and falls back to sending the full prompt when caching is unavailable.
+Creating a cached content is a blocking network call: the async path runs it in
+a worker thread and, while it is in flight, keeps serving the current cache name
+(or the full prompt) instead of stalling the event loop.
+
+Backends:
+- GeminiPromptCacheBackend: real cached contents via langchain_google_genai.
+- LocalPromptCacheBackend: in-memory stand-in for offline runs and tests; it
+  hands out fake cache names and never talks to the network.
+"""
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class LocalPromptCacheBackend:
+    """Offline stand-in: records created caches in memory and returns synthetic names."""
+
+    def __init__(self):
+        self.created: List[Dict[str, Any]] = []
+
+    def create(self, model_name: str, system_message: str, tools: list, ttl_seconds: int) -> str:
+        name = f"cachedContents/local-{len(self.created) + 1}-{_prompt_hash(system_message, tools)[:12]}"
+        self.created.append({"name": name, "model": model_name, "ttl_seconds": ttl_seconds})
+        return name
+
+
+class GeminiPromptCacheBackend:
+    """Creates Gemini cached contents holding the system instruction and the tool declarations."""
+
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+
+    def create(self, model_name: str, system_message: str, tools: list, ttl_seconds: int) -> str:
+        from langchain_google_genai import ChatGoogleGenerativeAI, create_context_cache
+        from langchain_core.messages import SystemMessage
+
+        llm = ChatGoogleGenerativeAI(model=model_name, google_api_key=self.api_key)
+        return create_context_cache(
+            llm,
+            [SystemMessage(content=system_message)],
+            ttl=f"{int(ttl_seconds)}s",
+            tools=tools or None
+        )
+
+
+def _prompt_hash(system_message: str, tools: list) -> str:
+    digest = hashlib.sha256(system_message.encode("utf-8"))
+    for tool in tools or []:
+        digest.update(b"\x00" + str(getattr(tool, "name", tool)).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class PromptCache:
+    """
+    Keeps one cached context per (model, prompt hash) alive and tracks token metrics.
+
+    get_cached_content() returns the cache name to pass as `cached_content`, or
+    None when the caller must send the full prompt (caching disabled, creation
+    failed recently, etc.). It never raises.
+    """
+
+    def __init__(self, backend, ttl_seconds: int = 3600, refresh_margin_seconds: int = 300,
+                 failure_backoff_seconds: int = 300):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin_seconds = min(refresh_margin_seconds, ttl_seconds // 2)
+        self.failure_backoff_seconds = failure_backoff_seconds
+
+        self._entries: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._failures: Dict[Tuple[str, str], float] = {}
+        self._creating = set()  # Claves con una creación o refresco en curso
+        self._lock = threading.Lock()
+        self._stats = {
+            "created": 0,
+            "refreshed": 0,
+            "failures": 0,
+            "invalidated": 0,
+            "calls_cached": 0,
+            "calls_uncached": 0,
+            "cached_input_tokens": 0,
+            "uncached_input_tokens": 0
+        }
+
+    def get_cached_content(self, model_name: str, system_message: str, tools: Optional[list] = None) -> Optional[str]:
+        key = (model_name, _prompt_hash(system_message, tools))
+        now = time.time()
+
+        entry = self._entries.get(key)
+        if entry and entry["expires_at"] - now > self.refresh_margin_seconds:
+            return entry["name"]
+
+        with self._lock:
+            # Otro hilo pudo haberlo creado o refrescado mientras esperábamos
+            entry = self._entries.get(key)
+            if entry and entry["expires_at"] - now > self.refresh_margin_seconds:
+                return entry["name"]
+            if now - self._failures.get(key, 0) < self.failure_backoff_seconds:
+                return None
+
+            self._creating.add(key)
+            try:
+                name = self.backend.create(model_name, system_message, tools or [], self.ttl_seconds)
+            except Exception as e:
+                self._failures[key] = now
+                self._stats["failures"] += 1
+                logging.warning(f"[PromptCache] No se pudo crear el contexto cacheado para {model_name}: {e}. "
+                                "Se envía el prompt completo.")
+                return None
+            finally:
+                self._creating.discard(key)
+
+            self._stats["refreshed" if entry else "created"] += 1
+            self._entries[key] = {"name": name, "expires_at": now + self.ttl_seconds}
+            self._failures.pop(key, None)
+            logging.info(f"[PromptCache] Contexto cacheado {'refrescado' if entry else 'creado'}: {name} ({model_name})")
+            return name
+
+    async def aget_cached_content(self, model_name: str, system_message: str,
+                                  tools: Optional[list] = None) -> Optional[str]:
+        """
+        Async twin of get_cached_content that never blocks the event loop.
+        A cache close to expiry is refreshed in a background thread while its name is
+        still served; while a first creation is in flight other callers get None.
+        """
+        key = (model_name, _prompt_hash(system_message, tools))
+        now = time.time()
+
+        entry = self._entries.get(key)
+        if entry and entry["expires_at"] - now > self.refresh_margin_seconds:
+            return entry["name"]
+        if now - self._failures.get(key, 0) < self.failure_backoff_seconds:
+            return None
+
+        current = entry["name"] if entry and entry["expires_at"] > now else None
+        if key in self._creating:
+            return current
+        if current:
+            # Aún válido: se refresca en segundo plano y se sigue usando el actual
+            threading.Thread(target=self.get_cached_content, args=(model_name, system_message, tools),
+                             name="prompt-cache-refresh", daemon=True).start()
+            return current
+        return await asyncio.to_thread(self.get_cached_content, model_name, system_message, tools)
+
+    def invalidate(self, cached_content: str) -> None:
+        """Forgets a cache name the API rejected (expired or deleted server-side)."""
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry["name"] == cached_content:
+                    del self._entries[key]
+                    self._stats["invalidated"] += 1
+
+    def record_usage(self, response: Any, used_cache: bool) -> None:
+        """Accumulates cached vs. uncached input tokens from an AIMessage's usage_metadata."""
+        usage = getattr(response, "usage_metadata", None) or {}
+        input_tokens = usage.get("input_tokens", 0) or 0
+        cached_tokens = (usage.get("input_token_details") or {}).get("cache_read", 0) or 0
+        with self._lock:
+            self._stats["calls_cached" if used_cache else "calls_uncached"] += 1
+            self._stats["cached_input_tokens"] += cached_tokens
+            self._stats["uncached_input_tokens"] += max(input_tokens - cached_tokens, 0)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["active_caches"] = len(self._entries)
+        total_input = stats["cached_input_tokens"] + stats["uncached_input_tokens"]
+        stats["cached_token_ratio"] = round(stats["cached_input_tokens"] / total_input, 4) if total_input else None
+        return stats
+
+
+def create_prompt_cache(backend_name: str, api_key: Optional[str], ttl_seconds: int,
+                        refresh_margin_seconds: int) -> Optional[PromptCache]:
+    """Builds the PromptCache configured in settings, or None when caching is disabled."""
+    backend_name = (backend_name or "off").lower()
+    if backend_name == "gemini":
+        if not api_key:
+            logging.warning("[PromptCache] Sin API key de Google; la caché de prompt queda desactivada.")
+            return None
+        backend = GeminiPromptCacheBackend(api_key)
+    elif backend_name == "local":
+        backend = LocalPromptCacheBackend()
+    else:
+        return None
+    return PromptCache(backend, ttl_seconds=ttl_seconds, refresh_margin_seconds=refresh_margin_seconds)
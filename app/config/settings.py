@@ -1,5 +1,6 @@
 # config/settings.py
 import os
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 # from typing import Dict, List, Optional
@@ -56,9 +57,84 @@ if not MARCELLA_GOOGLE_API_KEY:
 LLM_MODEL_NAME = "gemini-2.5-flash-lite"
 LLM_TEMPERATURE = 0.3
 
+# Caché del prefijo del prompt (SYSTEM_MESSAGE + herramientas) en Gemini.
+# PROMPT_CACHE_BACKEND: "gemini" (cached contents reales), "local" (simulación offline) u "off".
+PROMPT_CACHE_BACKEND = os.getenv("PROMPT_CACHE_BACKEND", "gemini")
+PROMPT_CACHE_TTL_SECONDS = int(os.getenv("PROMPT_CACHE_TTL_SECONDS", "3600"))
+PROMPT_CACHE_REFRESH_MARGIN_SECONDS = int(os.getenv("PROMPT_CACHE_REFRESH_MARGIN_SECONDS", "300"))
+
+# Presupuesto de contexto del historial (sin contar el SYSTEM_MESSAGE, que es fijo y va cacheado).
+# Se conservan los últimos CONTEXT_KEEP_TURNS turnos literales; los anteriores se resumen.
+CONTEXT_KEEP_TURNS = int(os.getenv("CONTEXT_KEEP_TURNS", "6"))
+CONTEXT_MAX_HISTORY_TOKENS = int(os.getenv("CONTEXT_MAX_HISTORY_TOKENS", "8000"))
+CONTEXT_SUMMARY_MAX_TOKENS = int(os.getenv("CONTEXT_SUMMARY_MAX_TOKENS", "800"))
+CONTEXT_SUMMARY_MODEL = os.getenv("CONTEXT_SUMMARY_MODEL", LLM_MODEL_NAME)
+
 # Configuración de Blog API
 BLOG_API_URL = os.getenv("BLOG_API_URL", "http://localhost:3001/api/blog")
 BLOG_VERIFICATION_CODE = os.getenv("BLOG_VERIFICATION_CODE", "")  # Opcional, vacío por defecto
+
+# Caché de conversaciones activas por worker (LRU + TTL por inactividad + presupuesto de memoria)
+# Las conversaciones expulsadas se reconstruyen desde MongoDB en la siguiente petición.
+SESSION_CACHE_MAX_ENTRIES = int(os.getenv("SESSION_CACHE_MAX_ENTRIES", "500"))
+SESSION_CACHE_IDLE_TTL_SECONDS = int(os.getenv("SESSION_CACHE_IDLE_TTL_SECONDS", "1800"))
+SESSION_CACHE_MAX_MB = int(os.getenv("SESSION_CACHE_MAX_MB", "256"))
+
+# Extracción de PDFs (process_pdf): páginas repartidas en un pool de procesos.
+# Con menos de PDF_PARALLEL_MIN_PAGES páginas se extrae en el propio proceso.
+PDF_EXTRACTION_MAX_WORKERS = int(os.getenv("PDF_EXTRACTION_MAX_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_PAGE_TIMEOUT_SECONDS = float(os.getenv("PDF_PAGE_TIMEOUT_SECONDS", "60"))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "4"))
+
+# Máximo de caracteres que PostGeneratorTool extrae de un PDF (el LLM solo usa el principio del documento).
+# Al alcanzarlo se dejan de leer páginas; 0 = sin límite.
+PDF_TEXT_MAX_CHARS = int(os.getenv("PDF_TEXT_MAX_CHARS", "20000")) or None
+
+# Caché del texto extraído de documentos, por hash SHA-256 del contenido (memoria LRU + disco).
+# EXTRACTION_CACHE_DISK_MB=0 desactiva el nivel en disco.
+EXTRACTION_CACHE_MEMORY_MB = int(os.getenv("EXTRACTION_CACHE_MEMORY_MB", "64"))
+EXTRACTION_CACHE_DIR = os.getenv("EXTRACTION_CACHE_DIR", os.path.join(tempfile.gettempdir(), "repli_extraction_cache"))
+EXTRACTION_CACHE_DISK_MB = int(os.getenv("EXTRACTION_CACHE_DISK_MB", "512"))
+
+# Descargas de Google Drive (process_pdf): en streaming, con tamaño máximo, timeouts y reintentos
+DRIVE_DOWNLOAD_MAX_MB = int(os.getenv("DRIVE_DOWNLOAD_MAX_MB", "25"))
+DRIVE_DOWNLOAD_CONNECT_TIMEOUT_SECONDS = float(os.getenv("DRIVE_DOWNLOAD_CONNECT_TIMEOUT_SECONDS", "5"))
+DRIVE_DOWNLOAD_READ_TIMEOUT_SECONDS = float(os.getenv("DRIVE_DOWNLOAD_READ_TIMEOUT_SECONDS", "30"))
+DRIVE_DOWNLOAD_RETRIES = int(os.getenv("DRIVE_DOWNLOAD_RETRIES", "3"))
+
+# Ingesta de documentos en lote (/documents/batch): cola local servida por un pool de hilos por worker.
+# El texto extraído se guarda en MongoDB y se adjunta a la conversación en el siguiente turno.
+DOCUMENT_JOB_WORKERS = int(os.getenv("DOCUMENT_JOB_WORKERS", "2"))
+DOCUMENT_JOB_QUEUE_MAX = int(os.getenv("DOCUMENT_JOB_QUEUE_MAX", "200"))  # Archivos en cola o en curso
+DOCUMENT_JOB_RETAIN = int(os.getenv("DOCUMENT_JOB_RETAIN", "1000"))  # Trabajos terminados que se conservan en memoria
+DOCUMENT_BATCH_MAX_FILES = int(os.getenv("DOCUMENT_BATCH_MAX_FILES", "20"))
+DOCUMENT_MAX_MB = int(os.getenv("DOCUMENT_MAX_MB", "25"))
+DOCUMENT_CONTEXT_MAX_CHARS = int(os.getenv("DOCUMENT_CONTEXT_MAX_CHARS", "30000"))  # Por documento adjuntado
+
+# Voz en streaming (/conversation/voice/stream): reconocimientos simultáneos por worker.
+# Cada sesión ocupa un hilo mientras dura el enunciado; por encima del límite se rechaza la conexión.
+VOICE_STREAM_MAX_SESSIONS = int(os.getenv("VOICE_STREAM_MAX_SESSIONS", "16"))
+
+# Síntesis de voz por frases: cada respuesta tiene como mucho TTS_MAX_PARALLEL síntesis en curso,
+# repartidas en un pool de TTS_POOL_WORKERS hilos por worker.
+TTS_MAX_PARALLEL = int(os.getenv("TTS_MAX_PARALLEL", "3"))
+TTS_POOL_WORKERS = int(os.getenv("TTS_POOL_WORKERS", "8"))
+TTS_SENTENCE_MIN_CHARS = int(os.getenv("TTS_SENTENCE_MIN_CHARS", "40"))  # Las frases más cortas se unen a la siguiente
+TTS_CHUNK_MAX_CHARS = int(os.getenv("TTS_CHUNK_MAX_CHARS", "800"))  # Google TTS admite hasta 5000 bytes por petición
+
+# Caché del audio sintetizado por texto normalizado + voz + parámetros de audio (memoria LRU + disco).
+# El nivel en disco se comparte entre workers y con el comando de precalentamiento
+# (python -m app.src.tools.tts_prewarm); TTS_CACHE_DISK_MB=0 lo desactiva.
+TTS_CACHE_MEMORY_MB = int(os.getenv("TTS_CACHE_MEMORY_MB", "32"))
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", os.path.join(tempfile.gettempdir(), "repli_tts_cache"))
+TTS_CACHE_DISK_MB = int(os.getenv("TTS_CACHE_DISK_MB", "256"))
+TTS_PREWARM_ON_START = os.getenv("TTS_PREWARM_ON_START", "false").lower() == "true"
+TTS_PREWARM_VOICES = [voice.strip() for voice in os.getenv("TTS_PREWARM_VOICES", "").split(",") if voice.strip()]
+
+# Respuestas fijas del asistente a archivos subidos en /conversation
+PAYMENT_RECEIVED_MESSAGE = "He recibido tu comprobante de pago. Procederé a verificarlo y continuaremos con el proceso de asesoría."
+DOCUMENT_REJECTED_MESSAGE = "Lo siento, no puedo ayudarte con este tipo de documento. Como abogada digital especialista en Derecho Corporativo, Derechos Reales y Derecho de Familia, solo puedo asistirte con documentos legales relacionados con estas áreas. Por favor, sube un documento legal (como contratos, poderes, actas, documentos de constitución de empresa, sucesiones, etc.) o hazme una consulta específica sobre temas jurídicos."
+
 LATAM_COUNTRIES = [
     "Argentina",
     "Bolivia",
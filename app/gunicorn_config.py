@@ -7,7 +7,7 @@ bind = "0.0.0.0:8080"
 backlog = 2048
 
 # Worker processes
-workers = 1  # For memory-intensive applications, use fewer workers
+workers = 1  # For memory-intensive applications, use fewer workers. /conversation is async (asgi.py), so one worker serves many concurrent chats
 worker_class = "uvicorn.workers.UvicornWorker"
 worker_connections = 1000
 timeout = 300
@@ -34,5 +34,24 @@ proc_name = None
 def on_starting(server):
     server.log.info("Starting Geraldine AI Agent API")
 
+def post_fork(server, worker):
+    # Con preload_app el cliente MongoDB del master no debe usarse en los workers:
+    # cada worker crea su propio pool (client_factory también lo detecta por PID)
+    import sys
+    client_factory_module = sys.modules.get("app.src.database.client_factory")
+    if client_factory_module is not None:
+        client_factory_module.reset_client()
+
+def worker_exit(server, worker):
+    # Vaciar la cola write-behind de mensajes y cerrar el pool antes de que el worker termine
+    import sys
+    # Los trabajos de documentos escriben en MongoDB: se detienen antes de cerrar el cliente
+    document_ingestion_module = sys.modules.get("app.src.tools.document_ingestion")
+    if document_ingestion_module is not None:
+        document_ingestion_module.shutdown_document_job_queue()
+    mongo_manager_module = sys.modules.get("app.src.database.mongo_manager")
+    if mongo_manager_module is not None:
+        mongo_manager_module.MongoManager.shutdown()
+
 def on_exit(server):
     server.log.info("Shutting down Geraldine Gonzales AI Agent API")
\ No newline at end of file
@@ -0,0 +1,285 @@
+"""
+Asyncio twin of MongoManager built on Motor.
+
+AsyncMongoManager exposes the same methods as MongoManager as coroutines so the
+ASGI routes (app/asgi.py) can read and write MongoDB without blocking the event
+loop. It shares the document formats, the page tokens and the message
+write-behind queue with MongoManager, so both can be used on the same data in
+the same process:
+
+- save_message submits to the shared write-behind queue (never blocks in
+  MONGO_WRITE_MODE=async; in sync/group mode the wait runs in a worker thread).
+- Reads first flush pending queued messages (read-your-writes) in a worker thread.
+- With CONVERSATION_STORAGE_LAYOUT=thread the message methods delegate to the
+  synchronous bucket store in a worker thread; everything else is native Motor.
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional
+
+from pymongo import ReturnDocument
+
+from app.utils.config import Config
+from app.src.metrics import get_histogram
+from app.src.database.client_factory import get_async_client
+from app.src.database.write_behind import WRITE_MODE_ASYNC
+from app.src.database.mongo_manager import (
+    MongoManager,
+    HISTORY_PROJECTION,
+    HISTORY_PAGE_PROJECTION,
+    build_message_document,
+    make_page_filter,
+    history_page_query,
+    page_from_documents,
+    format_cv_analysis,
+    prepare_cv_analysis,
+    build_cv_analysis_update,
+    build_write_concern
+)
+
+
+class AsyncMongoManager:
+    """Motor-based MongoManager with the same surface, as coroutines"""
+
+    def __init__(self, mongo_manager: Optional[MongoManager] = None):
+        # El gestor síncrono aporta la cola write-behind, el almacén por hilos y el arranque del esquema
+        self.sync = mongo_manager or MongoManager()
+
+    @property
+    def db(self):
+        return get_async_client().agent_memory_repli_post
+
+    @property
+    def agent_memory_repli_post(self):
+        return self.db.conversations_memory
+
+    async def _read_your_writes(self):
+        """Flushes queued messages (in a worker thread) before a read"""
+        if MongoManager._message_queue.has_pending():
+            await asyncio.to_thread(MongoManager._message_queue.flush)
+
+    # --- Mensajes ---
+
+    async def save_message(self, thread_id: str, user_name: str, role: str, content: str):
+        """Saves a message through the shared write-behind queue (see MONGO_WRITE_MODE)"""
+        message = build_message_document(thread_id, user_name, role, content)
+        queue = MongoManager._message_queue
+        if queue.mode == WRITE_MODE_ASYNC:
+            queue.submit(message)  # Solo encola; bloquea únicamente si la cola está llena
+        else:
+            await asyncio.to_thread(queue.submit, message)
+
+    async def get_conversation_history(self, thread_id: str, limit: int = None) -> List[Dict]:
+        """Gets the conversation history"""
+        await self._read_your_writes()
+        if self.sync.thread_store:
+            return await asyncio.to_thread(self.sync.get_conversation_history, thread_id, limit)
+        cursor = self.agent_memory_repli_post.find({"thread_id": thread_id}).sort([("timestamp", 1), ("_id", 1)])
+        if isinstance(limit, int) and limit > 0:
+            cursor = cursor.limit(limit)
+        return await cursor.to_list(length=None)
+
+    async def iter_conversation_history(self, thread_id: str, projection: dict = None,
+                                        batch_size: int = 200) -> AsyncIterator[Dict]:
+        """Streams the conversation in chronological order with the given projection"""
+        await self._read_your_writes()
+        if self.sync.thread_store:
+            messages = await asyncio.to_thread(
+                lambda: list(self.sync.iter_conversation_history(thread_id, projection, batch_size))
+            )
+            for message in messages:
+                yield message
+            return
+        cursor = self.agent_memory_repli_post.find(
+            {"thread_id": thread_id},
+            projection or HISTORY_PROJECTION
+        ).sort([("timestamp", 1), ("_id", 1)]).batch_size(batch_size)
+        async for message in cursor:
+            yield message
+
+    async def get_history_page(self, thread_id: str, limit: int = None, before: datetime = None,
+                               page_token: str = None) -> Dict:
+        """Async version of MongoManager.get_history_page (same page tokens)"""
+        await self._read_your_writes()
+        if self.sync.thread_store:
+            return await asyncio.to_thread(self.sync.get_history_page, thread_id, limit, before, page_token)
+        limit = min(limit or Config.HISTORY_PAGE_SIZE_DEFAULT, Config.HISTORY_PAGE_SIZE_MAX)
+        token_timestamp, _, older_than_cursor = make_page_filter(page_token, before)
+
+        cursor = self.agent_memory_repli_post.find(
+            history_page_query(thread_id, token_timestamp, before), HISTORY_PAGE_PROJECTION
+        ).sort([("timestamp", -1), ("_id", -1)]).batch_size(limit + 2)
+        documents = []
+        try:
+            async for doc in cursor:
+                if not older_than_cursor(doc):
+                    continue
+                documents.append(doc)
+                if len(documents) > limit:
+                    break
+        finally:
+            await cursor.close()
+        return page_from_documents(documents, limit)
+
+    async def get_recent_messages(self, thread_id: str, limit: int) -> List[Dict]:
+        return (await self.get_history_page(thread_id, limit=limit))["messages"]
+
+    async def get_messages(self, thread_id: str, limit: int = None) -> List[Dict]:
+        """Gets the most recent messages from a conversation (most recent first)"""
+        await self._read_your_writes()
+        if self.sync.thread_store:
+            return await asyncio.to_thread(self.sync.get_messages, thread_id, limit)
+        cursor = self.agent_memory_repli_post.find(
+            {"thread_id": thread_id, "role": {"$in": ["user", "assistant"]}}
+        ).sort([("timestamp", -1), ("_id", -1)])
+        if limit:
+            cursor = cursor.limit(limit)
+        return await cursor.to_list(length=None)
+
+    async def update_user_name(self, thread_id: str, user_name: str):
+        """Updates the user name in all their messages"""
+        await self._read_your_writes()
+        if self.sync.thread_store:
+            await asyncio.to_thread(self.sync.update_user_name, thread_id, user_name)
+            return
+        await self.agent_memory_repli_post.update_many(
+            {'thread_id': thread_id},
+            {'$set': {'user_name': user_name}}
+        )
+
+    async def finalize_conversation(self, thread_id: str):
+        """Marks the conversation as finalized in MongoDB"""
+        await self._read_your_writes()
+        if self.sync.thread_store:
+            await asyncio.to_thread(self.sync.finalize_conversation, thread_id)
+            return
+        await self.agent_memory_repli_post.update_many(
+            {'thread_id': thread_id},
+            {'$set': {'status': 'completed', 'end_time': datetime.utcnow()}}
+        )
+
+    async def get_last_active_thread(self) -> Optional[str]:
+        """Gets the last active thread_id"""
+        await self._read_your_writes()
+        if self.sync.thread_store:
+            return await asyncio.to_thread(self.sync.get_last_active_thread)
+        last_conversation = await self.agent_memory_repli_post.find_one(
+            {'status': 'active'},
+            sort=[('timestamp', -1)]
+        )
+        return last_conversation['thread_id'] if last_conversation else None
+
+    async def get_conversation_by_user(self, user_name: str) -> Optional[dict]:
+        """Gets the last active conversation of a specific user"""
+        if self.sync.thread_store:
+            return await asyncio.to_thread(self.sync.get_conversation_by_user, user_name)
+        last_conversation = await self.agent_memory_repli_post.find_one(
+            {'user_name': user_name, 'status': 'active'},
+            sort=[('timestamp', -1)]
+        )
+        if last_conversation:
+            return {
+                'thread_id': last_conversation['thread_id'],
+                'user_name': last_conversation['user_name'],
+                'last_timestamp': last_conversation['timestamp']
+            }
+        return None
+
+    # --- Análisis de CV ---
+
+    async def get_cv_analysis(self, thread_id: str) -> dict:
+        """Gets the saved CV analysis for a specific thread_id"""
+        try:
+            return format_cv_analysis(await self.db.cv_analysis.find_one({"thread_id": thread_id}), thread_id)
+        except Exception as e:
+            logging.error(f"Error retrieving CV analysis from MongoDB: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    async def save_cv_analysis(self, thread_id: str, cv_analysis: dict, return_document: bool = False):
+        """Async version of MongoManager.save_cv_analysis (same write concern and return values)"""
+        try:
+            collection = self.db.cv_analysis.with_options(write_concern=build_write_concern())
+            query, update = build_cv_analysis_update(thread_id, prepare_cv_analysis(cv_analysis))
+            with get_histogram("mongo.save_cv_analysis").time():
+                if return_document:
+                    stored = await collection.find_one_and_update(
+                        query, update, upsert=True, return_document=ReturnDocument.AFTER
+                    )
+                else:
+                    result = await collection.update_one(query, update, upsert=True)
+
+            if return_document:
+                return stored
+            return result.acknowledged or not collection.write_concern.acknowledged
+        except Exception as e:
+            logging.error(f"Error saving CV analysis to MongoDB: {str(e)}")
+            return None if return_document else False
+
+    # --- Contexto y usuarios ---
+
+    async def _upsert_context(self, collection_name: str, thread_id: str, context_data: dict) -> bool:
+        # Las colecciones se crean al arrancar (MongoManager.bootstrap_schema); el upsert crea las demás
+        document = dict(context_data, thread_id=thread_id, last_updated=datetime.utcnow())
+        result = await self.db[collection_name].update_one(
+            {"thread_id": thread_id},
+            {"$set": document},
+            upsert=True
+        )
+        return result.acknowledged
+
+    async def get_context(self, thread_id: str) -> Optional[dict]:
+        try:
+            return await self.db.context_data.find_one({"thread_id": thread_id})
+        except Exception as e:
+            logging.error(f"Error retrieving context from MongoDB: {str(e)}")
+            return None
+
+    async def save_context(self, thread_id: str, context_data: dict) -> bool:
+        try:
+            return await self._upsert_context("context_data", thread_id, context_data)
+        except Exception as e:
+            logging.error(f"Error saving context to MongoDB: {str(e)}")
+            return False
+
+    async def get_conversation_context(self, thread_id: str) -> Optional[dict]:
+        try:
+            return (await self.db.conversation_context.find_one({"thread_id": thread_id})
+                    or await self.db.context_data.find_one({"thread_id": thread_id}))
+        except Exception as e:
+            logging.error(f"Error retrieving conversation context from MongoDB: {str(e)}")
+            return None
+
+    async def save_conversation_context(self, thread_id: str, context_data: dict) -> bool:
+        try:
+            return await self._upsert_context("conversation_context", thread_id, context_data)
+        except Exception as e:
+            logging.error(f"Error saving conversation context to MongoDB: {str(e)}")
+            return False
+
+    async def get_user_info(self, thread_id: str) -> Optional[Dict]:
+        try:
+            return await self.db.users.find_one({"thread_id": thread_id})
+        except Exception as e:
+            logging.error(f"Error retrieving user info from MongoDB: {str(e)}")
+            return None
+
+    async def save_user_info(self, user_info: dict) -> None:
+        try:
+            await self.db.users.update_one(
+                {"thread_id": user_info["thread_id"]},
+                {"$set": user_info},
+                upsert=True
+            )
+        except Exception as e:
+            logging.error(f"Error saving user info to MongoDB: {str(e)}")
+
+
+def create_async_mongo_manager(mongo_manager: Optional[MongoManager] = None) -> Optional[AsyncMongoManager]:
+    """AsyncMongoManager, or None when Motor is not installed (callers fall back to worker threads)"""
+    try:
+        import motor  # noqa: F401
+    except ImportError:
+        logging.warning("Motor no está instalado; las rutas asíncronas usarán MongoManager en hilos")
+        return None
+    return AsyncMongoManager(mongo_manager)
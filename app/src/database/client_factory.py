@@ -0,0 +1,217 @@
+"""
+Process-wide pooled MongoClient.
+
+get_client() returns one MongoClient per process, configured from Config
+(pool sizes, idle time, wire compression, retryable writes). The client is
+tied to the PID that created it: after a fork (gunicorn workers) the child
+transparently builds its own client instead of reusing sockets inherited
+from the parent. A ConnectionPoolListener records how long requests wait to
+check a connection out of the pool.
+"""
+import os
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+from pymongo import MongoClient, monitoring
+
+from app.utils.config import Config
+from app.src.metrics import get_histogram
+
+# Módulo Python que necesita cada compresor de protocolo (zlib viene con Python)
+_COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """Tracks pool checkout wait times and connection counts."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.checkout_wait = get_histogram("mongo.pool_checkout_wait")
+        self.counters = {
+            "connections_created": 0,
+            "connections_closed": 0,
+            "checkouts": 0,
+            "checkout_failures": 0,
+            "checked_out": 0
+        }
+
+    def _increment(self, name: str, value: int = 1):
+        with self._lock:
+            self.counters[name] += value
+
+    def _observe_wait(self, event):
+        # pymongo >= 4.7 informa la duración; en versiones anteriores se mide desde checkout_started
+        duration = getattr(event, "duration", None)
+        if duration is None:
+            started = getattr(self._local, "checkout_started", None)
+            duration = time.perf_counter() - started if started is not None else None
+        if duration is not None:
+            self.checkout_wait.observe(duration * 1000)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._increment("connections_created")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._increment("connections_closed")
+
+    def connection_check_out_started(self, event):
+        self._local.checkout_started = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        self._observe_wait(event)
+        self._increment("checkout_failures")
+
+    def connection_checked_out(self, event):
+        self._observe_wait(event)
+        with self._lock:
+            self.counters["checkouts"] += 1
+            self.counters["checked_out"] += 1
+
+    def connection_checked_in(self, event):
+        self._increment("checked_out", -1)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.counters)
+        counters["open_connections"] = counters["connections_created"] - counters["connections_closed"]
+        counters["checkout_wait"] = self.checkout_wait.snapshot()
+        return counters
+
+
+_client: Optional[MongoClient] = None
+_client_pid: Optional[int] = None
+_client_lock = threading.Lock()
+_pool_listener: Optional[PoolMetricsListener] = None
+
+# Cliente Motor (AsyncMongoManager): uno por proceso y event loop
+_async_clients: Dict[tuple, Any] = {}
+
+
+def available_compressors(requested: str) -> List[str]:
+    """Filters the configured compressors down to the ones whose module is installed."""
+    compressors = []
+    for name in [c.strip().lower() for c in (requested or "").split(",") if c.strip()]:
+        module = _COMPRESSOR_MODULES.get(name)
+        if module is None:
+            logging.warning(f"[mongo] Compresor desconocido ignorado: {name}")
+            continue
+        try:
+            __import__(module)
+            compressors.append(name)
+        except ImportError:
+            logging.warning(f"[mongo] Compresor {name} no disponible (falta el paquete '{module}')")
+    return compressors
+
+
+def build_client_options() -> Dict[str, Any]:
+    """MongoClient keyword arguments built from Config."""
+    options = {
+        "serverSelectionTimeoutMS": 5000,
+        "maxPoolSize": Config.MONGO_MAX_POOL_SIZE,
+        "minPoolSize": Config.MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": Config.MONGO_MAX_IDLE_TIME_MS,
+        "retryWrites": Config.MONGO_RETRY_WRITES,
+        "retryReads": True,
+    }
+    if Config.MONGO_WAIT_QUEUE_TIMEOUT_MS:
+        options["waitQueueTimeoutMS"] = Config.MONGO_WAIT_QUEUE_TIMEOUT_MS
+    compressors = available_compressors(Config.MONGO_COMPRESSORS)
+    if compressors:
+        options["compressors"] = ",".join(compressors)
+    return options
+
+
+def get_client() -> MongoClient:
+    """
+    Returns this process's MongoClient, creating it on first use or after a fork.
+    Raises if the server cannot be reached.
+    """
+    global _client, _client_pid, _pool_listener
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+
+    with _client_lock:
+        if _client is not None and _client_pid == pid:
+            return _client
+        # Tras un fork no se cierra el cliente heredado: sus sockets pertenecen al proceso padre
+        _pool_listener = PoolMetricsListener()
+        options = build_client_options()
+        client = MongoClient(Config.REPLI_MONGO_URI, event_listeners=[_pool_listener], **options)
+        client.server_info()  # Verify the connection
+        logging.info(f"Connected to MongoDB Atlas (pid={pid}, maxPoolSize={options['maxPoolSize']}, "
+                     f"compressors={options.get('compressors', 'none')})")
+        _client, _client_pid = client, pid
+        return _client
+
+
+def get_async_client():
+    """
+    Returns the Motor client for this process and the running event loop, with the
+    same pool options as get_client(). Motor is optional: raises ImportError without it.
+    """
+    import asyncio
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    key = (os.getpid(), id(asyncio.get_running_loop()))
+    client = _async_clients.get(key)
+    if client is None:
+        with _client_lock:
+            client = _async_clients.get(key)
+            if client is None:
+                listener = _pool_listener or PoolMetricsListener()
+                client = AsyncIOMotorClient(Config.REPLI_MONGO_URI, event_listeners=[listener],
+                                            **build_client_options())
+                # Se descartan los clientes de otros procesos (heredados tras un fork)
+                for stale in [k for k in _async_clients if k[0] != key[0]]:
+                    del _async_clients[stale]
+                _async_clients[key] = client
+    return client
+
+
+def reset_client() -> None:
+    """Drops this process's reference to the clients so the next get_client() builds a new one."""
+    global _client, _client_pid
+    with _client_lock:
+        _client, _client_pid = None, None
+        _async_clients.clear()
+
+
+def close_client() -> None:
+    """Closes the client owned by this process (on shutdown)."""
+    global _client, _client_pid
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        for (pid, _), client in list(_async_clients.items()):
+            if pid == os.getpid():
+                client.close()
+        _client, _client_pid = None, None
+        _async_clients.clear()
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Pool metrics of this process's client (empty before the first connection)."""
+    if _pool_listener is None or _client_pid != os.getpid():
+        return {}
+    stats = _pool_listener.stats()
+    stats["max_pool_size"] = Config.MONGO_MAX_POOL_SIZE
+    return stats
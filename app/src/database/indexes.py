@@ -0,0 +1,268 @@
+"""
+Collection/index bootstrap and query plan verification for the agent_memory_repli_post database.
+
+ensure_collections() creates the collections the app writes to with a single
+list_collection_names() call and returns the known names, so request paths
+never have to ask the server whether a collection exists. ensure_indexes() creates the indexes the MongoManager queries rely on and drops
+the ones they replaced (it is idempotent, so it runs at every startup). verify_query_plans() runs explain()
+on the hot queries and raises IndexCoverageError when one of them would scan
+the whole collection or sort in memory.
+
+Uso desde la línea de comandos (con REPLI_MONGO_URI configurado):
+    python -m app.src.database.indexes            # crea los índices
+    python -m app.src.database.indexes --verify   # crea y verifica los planes
+"""
+import sys
+import logging
+from typing import Any, Dict, List, Set
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import CollectionInvalid, OperationFailure
+
+
+class IndexCoverageError(Exception):
+    """Raised when a hot query is not served by an index."""
+
+
+# Índices por colección: (claves, opciones)
+INDEX_SPECS: Dict[str, List[tuple]] = {
+    "conversations_memory": [
+        # get_conversation_history / get_messages / get_history_page: filtro por hilo,
+        # orden cronológico con desempate por _id (paginación por cursor)
+        ([("thread_id", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)],
+         {"name": "thread_id_timestamp_id"}),
+        # get_last_active_thread / get_active_conversation_info
+        ([("status", ASCENDING), ("timestamp", DESCENDING)], {"name": "status_timestamp_desc"}),
+        # get_conversation_by_user
+        ([("user_name", ASCENDING), ("status", ASCENDING), ("timestamp", DESCENDING)],
+         {"name": "user_name_status_timestamp_desc"}),
+    ],
+    # Diseño de un documento por hilo (thread_store.ThreadBucketStore)
+    "conversation_threads": [
+        ([("thread_id", ASCENDING), ("first_timestamp", ASCENDING), ("_id", ASCENDING)],
+         {"name": "thread_id_first_timestamp_id"}),
+        ([("status", ASCENDING), ("last_timestamp", DESCENDING)], {"name": "status_last_timestamp_desc"}),
+        ([("user_name", ASCENDING), ("status", ASCENDING), ("last_timestamp", DESCENDING)],
+         {"name": "user_name_status_last_timestamp_desc"}),
+    ],
+    "cv_analysis": [
+        ([("thread_id", ASCENDING)], {"name": "thread_id_unique", "unique": True}),
+    ],
+    "context_data": [
+        ([("thread_id", ASCENDING)], {"name": "thread_id_unique", "unique": True}),
+    ],
+    "conversation_context": [
+        ([("thread_id", ASCENDING)], {"name": "thread_id_unique", "unique": True}),
+    ],
+    "users": [
+        ([("thread_id", ASCENDING)], {"name": "thread_id_unique", "unique": True}),
+    ],
+    # Texto extraído de los documentos subidos (un documento por hilo y contenido)
+    "documents": [
+        ([("thread_id", ASCENDING), ("sha256", ASCENDING)], {"name": "thread_id_sha256_unique", "unique": True}),
+        # get_pending_documents: documentos del hilo en orden de subida
+        ([("thread_id", ASCENDING), ("created_at", ASCENDING)], {"name": "thread_id_created_at"}),
+        ([("job_ids", ASCENDING)], {"name": "job_ids"}),
+        ([("batch_ids", ASCENDING)], {"name": "batch_ids"}),
+    ],
+}
+
+# Índices reemplazados por uno de INDEX_SPECS: {colección: {índice obsoleto: índice que lo sustituye}}.
+# ensure_indexes los elimina una vez creado el sustituto, para que las escrituras no los mantengan
+SUPERSEDED_INDEXES: Dict[str, Dict[str, str]] = {
+    "conversations_memory": {
+        "thread_id_timestamp": "thread_id_timestamp_id",
+    },
+}
+
+# Consultas calientes de MongoManager que deben resolverse con un índice
+HOT_QUERIES: List[Dict[str, Any]] = [
+    {
+        "name": "get_conversation_history",
+        "collection": "conversations_memory",
+        "filter": {"thread_id": "__explain__"},
+        "sort": [("timestamp", ASCENDING), ("_id", ASCENDING)],
+    },
+    {
+        "name": "get_messages",
+        "collection": "conversations_memory",
+        "filter": {"thread_id": "__explain__", "role": {"$in": ["user", "assistant"]}},
+        "sort": [("timestamp", DESCENDING), ("_id", DESCENDING)],
+    },
+    {
+        "name": "get_history_page",
+        "collection": "conversations_memory",
+        "filter": {"thread_id": "__explain__"},
+        "sort": [("timestamp", DESCENDING), ("_id", DESCENDING)],
+    },
+    {
+        "name": "get_last_active_thread",
+        "collection": "conversations_memory",
+        "filter": {"status": "active"},
+        "sort": [("timestamp", DESCENDING)],
+    },
+    {
+        "name": "get_conversation_by_user",
+        "collection": "conversations_memory",
+        "filter": {"user_name": "__explain__", "status": "active"},
+        "sort": [("timestamp", DESCENDING)],
+    },
+    {
+        "name": "thread_store.iter_newest_first",
+        "collection": "conversation_threads",
+        "filter": {"thread_id": "__explain__"},
+        "sort": [("first_timestamp", DESCENDING), ("_id", DESCENDING)],
+    },
+    {
+        "name": "thread_store.get_last_active",
+        "collection": "conversation_threads",
+        "filter": {"status": "active"},
+        "sort": [("last_timestamp", DESCENDING)],
+    },
+    {
+        "name": "thread_store.get_last_active_by_user",
+        "collection": "conversation_threads",
+        "filter": {"user_name": "__explain__", "status": "active"},
+        "sort": [("last_timestamp", DESCENDING)],
+    },
+    {"name": "get_cv_analysis", "collection": "cv_analysis", "filter": {"thread_id": "__explain__"}},
+    {"name": "get_context", "collection": "context_data", "filter": {"thread_id": "__explain__"}},
+    {"name": "get_conversation_context", "collection": "conversation_context", "filter": {"thread_id": "__explain__"}},
+    {"name": "get_user_info", "collection": "users", "filter": {"thread_id": "__explain__"}},
+    {"name": "find_document", "collection": "documents", "filter": {"thread_id": "__explain__", "sha256": "__explain__"}},
+    {
+        "name": "get_pending_documents",
+        "collection": "documents",
+        "filter": {"thread_id": "__explain__", "status": "done", "attached_at": None},
+        "sort": [("created_at", ASCENDING)],
+    },
+    {"name": "find_document_by_job", "collection": "documents", "filter": {"job_ids": "__explain__"}},
+    {"name": "find_documents_by_batch", "collection": "documents", "filter": {"batch_ids": "__explain__"}},
+]
+
+# Etapas del plan que indican que la consulta no está cubierta por un índice
+UNINDEXED_STAGES = {"COLLSCAN", "SORT"}
+
+
+def ensure_collections(db, names=None) -> Set[str]:
+    """
+    Creates the missing collections among `names` (default: every collection in INDEX_SPECS).
+    Returns the set of collection names known to exist afterwards.
+    """
+    known = set(db.list_collection_names())
+    for name in names or INDEX_SPECS:
+        if name in known:
+            continue
+        try:
+            db.create_collection(name)
+        except CollectionInvalid:
+            pass  # Otro proceso la creó entre el listado y la creación
+        known.add(name)
+    return known
+
+
+def ensure_indexes(db) -> Dict[str, List[str]]:
+    """
+    Creates every index in INDEX_SPECS (no-op for the ones that already exist) and
+    drops the SUPERSEDED_INDEXES whose replacement is in place.
+    A failing index (e.g. duplicated thread_id values blocking a unique index) is
+    logged and skipped so the others are still created.
+    Returns {collection: [index names created or confirmed]}.
+    """
+    result = {}
+    for collection_name, specs in INDEX_SPECS.items():
+        collection = db[collection_name]
+        result[collection_name] = []
+        for keys, options in specs:
+            try:
+                result[collection_name].append(collection.create_index(keys, **options))
+            except OperationFailure as e:
+                logging.error(f"[indexes] No se pudo crear el índice {options.get('name')} en "
+                              f"{collection_name}: {e}")
+        drop_superseded_indexes(collection, result[collection_name])
+    logging.info(f"[indexes] Índices verificados: {result}")
+    return result
+
+
+def drop_superseded_indexes(collection, confirmed: List[str]) -> List[str]:
+    """
+    Drops the SUPERSEDED_INDEXES of the collection whose replacement is among `confirmed`.
+    Returns the names of the dropped indexes (none once they are gone).
+    """
+    superseded = SUPERSEDED_INDEXES.get(collection.name)
+    if not superseded:
+        return []
+    dropped = []
+    existing = collection.index_information()
+    for name, replacement in superseded.items():
+        if name not in existing or replacement not in confirmed:
+            continue
+        try:
+            collection.drop_index(name)
+            dropped.append(name)
+            logging.info(f"[indexes] Índice obsoleto {name} eliminado de {collection.name} "
+                         f"(sustituido por {replacement})")
+        except OperationFailure as e:
+            logging.error(f"[indexes] No se pudo eliminar el índice {name} de {collection.name}: {e}")
+    return dropped
+
+
+def _plan_stages(plan: Any) -> List[str]:
+    """Collects every 'stage' in an explain() plan tree (classic and SBE layouts)."""
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            if isinstance(value, (dict, list)):
+                stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(_plan_stages(item))
+    return stages
+
+
+def explain_query(db, query: Dict[str, Any]) -> List[str]:
+    """Returns the stages of the winning plan for one HOT_QUERIES entry."""
+    cursor = db[query["collection"]].find(query["filter"])
+    if query.get("sort"):
+        cursor = cursor.sort(query["sort"])
+    explanation = cursor.limit(1).explain()
+    return _plan_stages(explanation.get("queryPlanner", {}).get("winningPlan", {}))
+
+
+def verify_query_plans(db, queries: List[Dict[str, Any]] = None) -> Dict[str, List[str]]:
+    """
+    Explains each hot query and raises IndexCoverageError listing every query whose
+    winning plan contains a collection scan or an in-memory sort.
+    Returns {query name: plan stages} when all of them are covered.
+    """
+    plans = {}
+    failures = []
+    for query in queries or HOT_QUERIES:
+        stages = explain_query(db, query)
+        plans[query["name"]] = stages
+        unindexed = UNINDEXED_STAGES.intersection(stages)
+        if unindexed:
+            failures.append(f"{query['name']} ({query['collection']}): {' -> '.join(stages)}")
+
+    if failures:
+        raise IndexCoverageError("Consultas sin índice:\n  " + "\n  ".join(failures))
+    logging.info(f"[indexes] Todas las consultas calientes usan índice ({len(plans)})")
+    return plans
+
+
+if __name__ == "__main__":
+    from app.src.database.mongo_manager import MongoManager
+
+    logging.basicConfig(level=logging.INFO)
+    manager = MongoManager()
+    for name, created in ensure_indexes(manager.db).items():
+        print(f"{name}: {', '.join(created) or '-'}")
+    if "--verify" in sys.argv:
+        try:
+            for name, stages in verify_query_plans(manager.db).items():
+                print(f"OK {name}: {' -> '.join(stages)}")
+        except IndexCoverageError as e:
+            print(e)
+            sys.exit(1)
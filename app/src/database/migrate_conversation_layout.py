@@ -0,0 +1,86 @@
+"""
+Migrates conversations from the one-document-per-message layout (conversations_memory)
+to the one-document-per-thread layout (conversation_threads, see thread_store).
+
+The source collection is left untouched, so the migration can be re-run and
+CONVERSATION_STORAGE_LAYOUT can be switched back. Threads that already exist in
+conversation_threads are skipped unless --force is given, in which case their
+buckets are rebuilt from the source.
+
+Uso (con REPLI_MONGO_URI configurado):
+    python -m app.src.database.migrate_conversation_layout --dry-run
+    python -m app.src.database.migrate_conversation_layout [--force] [--thread-id ID] [--bucket-size 200]
+
+Después de migrar, arrancar con CONVERSATION_STORAGE_LAYOUT=thread.
+"""
+import argparse
+import logging
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.utils.config import Config
+from app.src.database.client_factory import get_client
+from app.src.database.indexes import ensure_indexes
+from app.src.database.thread_store import ThreadBucketStore, THREADS_COLLECTION
+
+
+def iter_source_threads(source, thread_id: Optional[str] = None) -> Iterator[Tuple[str, List[Dict]]]:
+    """Yields (thread_id, messages in chronological order) reading the source collection once, sorted by thread."""
+    query = {"thread_id": thread_id} if thread_id else {}
+    cursor = source.find(query).sort([("thread_id", 1), ("timestamp", 1), ("_id", 1)]).batch_size(1000)
+    current_id, messages = None, []
+    for message in cursor:
+        if message["thread_id"] != current_id:
+            if messages:
+                yield current_id, messages
+            current_id, messages = message["thread_id"], []
+        messages.append(message)
+    if messages:
+        yield current_id, messages
+
+
+def migrate(bucket_size: int, force: bool = False, dry_run: bool = False,
+            thread_id: Optional[str] = None) -> Dict[str, int]:
+    db = get_client().agent_memory_repli_post
+    source, target = db.conversations_memory, db[THREADS_COLLECTION]
+    store = ThreadBucketStore(lambda: target, bucket_size=bucket_size)
+    if not dry_run:
+        ensure_indexes(db)
+
+    stats = {"threads": 0, "skipped": 0, "messages": 0, "buckets": 0}
+    for current_id, messages in iter_source_threads(source, thread_id):
+        if target.find_one({"thread_id": current_id}, {"_id": 1}):
+            if not force:
+                stats["skipped"] += 1
+                continue
+            if not dry_run:
+                target.delete_many({"thread_id": current_id})
+
+        buckets = store.build_buckets(current_id, messages)
+        if not dry_run:
+            target.insert_many(buckets, ordered=True)
+        stats["threads"] += 1
+        stats["messages"] += len(messages)
+        stats["buckets"] += len(buckets)
+        if stats["threads"] % 500 == 0:
+            logging.info(f"[migrate] {stats['threads']} hilos migrados ({stats['messages']} mensajes)")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migra conversations_memory a conversation_threads")
+    parser.add_argument("--bucket-size", type=int, default=Config.CONVERSATION_BUCKET_SIZE)
+    parser.add_argument("--force", action="store_true", help="Reconstruye los hilos ya migrados")
+    parser.add_argument("--dry-run", action="store_true", help="Solo cuenta, no escribe")
+    parser.add_argument("--thread-id", help="Migra solo este hilo")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    start = time.perf_counter()
+    stats = migrate(args.bucket_size, force=args.force, dry_run=args.dry_run, thread_id=args.thread_id)
+    print(f"{'[dry-run] ' if args.dry_run else ''}hilos={stats['threads']} omitidos={stats['skipped']} "
+          f"mensajes={stats['messages']} buckets={stats['buckets']} en {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
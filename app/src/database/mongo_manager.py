@@ -1,131 +1,419 @@
-from pymongo import MongoClient
+from pymongo import ReturnDocument
+from pymongo.write_concern import WriteConcern
+from pymongo.errors import BulkWriteError, CollectionInvalid
+from bson import ObjectId
+from bson.errors import InvalidId
 from datetime import datetime
 import os
+import json
+import base64
 from dotenv import load_dotenv
-from typing import List, Dict
+from typing import List, Dict, Iterator, Optional, Tuple
 import uuid
 import logging
 from app.utils.config import Config
+from app.src.metrics import get_histogram
+from app.src.database.write_behind import WriteBehindQueue
+from app.src.database.client_factory import get_client, get_pool_stats, close_client
+from app.src.database.thread_store import ThreadBucketStore, THREADS_COLLECTION
+from app.src.database.indexes import ensure_collections, ensure_indexes, verify_query_plans
 
 load_dotenv()
 
+# Campos que necesitan los lectores del historial (ConversationMemory, /conversation?action=history)
+HISTORY_PROJECTION = {"_id": 0, "role": 1, "content": 1}
+HISTORY_PAGE_PROJECTION = {"role": 1, "content": 1, "timestamp": 1}
+
+
+def encode_page_token(timestamp: datetime, message_id: ObjectId) -> str:
+    """Opaque cursor pointing at the oldest message of a history page"""
+    payload = json.dumps({"ts": timestamp.isoformat(), "id": str(message_id)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_page_token(token: str) -> Tuple[datetime, ObjectId]:
+    """Inverse of encode_page_token. Raises ValueError on a malformed token"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(payload["ts"]), ObjectId(payload["id"])
+    except (ValueError, KeyError, TypeError, InvalidId) as e:
+        raise ValueError(f"page_token inválido: {e}")
+
+
+def build_message_document(thread_id: str, user_name: str, role: str, content: str) -> Dict:
+    """Document stored for one chat message (shared by MongoManager and AsyncMongoManager)"""
+    return {
+        '_id': ObjectId(),  # Asignado aquí para que los reintentos y el cursor de paginación lo conozcan
+        'thread_id': thread_id,
+        'user_name': user_name,
+        'role': role,
+        'content': content,
+        'timestamp': datetime.utcnow(),  # Se fija al encolar para conservar el orden
+        'status': 'active'  # New field for tracking
+    }
+
+
+def make_page_filter(page_token: Optional[str], before: Optional[datetime]):
+    """
+    Returns (token_timestamp, token_id, predicate) for a history page request; the
+    predicate tells whether a message document is older than the requested cursor
+    """
+    token_timestamp = token_id = None
+    if page_token:
+        token_timestamp, token_id = decode_page_token(page_token)
+
+    def older_than_cursor(doc):
+        # Desempate por _id: varios mensajes pueden compartir timestamp (precisión de ms)
+        if token_id is not None:
+            return doc["timestamp"] < token_timestamp or (
+                doc["timestamp"] == token_timestamp and doc["_id"] < token_id)
+        return before is None or doc["timestamp"] < before
+
+    return token_timestamp, token_id, older_than_cursor
+
+
+def history_page_query(thread_id: str, token_timestamp: Optional[datetime], before: Optional[datetime]) -> Dict:
+    """conversations_memory query for a history page (newest first)"""
+    query = {"thread_id": thread_id}
+    if token_timestamp is not None:
+        # $lte y no $lt: los mensajes con el mismo timestamp ya devueltos se descartan con el predicado.
+        # Así la consulta sigue siendo un rango simple del índice
+        query["timestamp"] = {"$lte": token_timestamp}
+    elif before:
+        query["timestamp"] = {"$lt": before}
+    return query
+
+
+def build_history_page(newest_first, limit: int, older_than_cursor) -> Dict:
+    """Consumes message documents (newest first) and builds {'messages', 'next_page_token'}"""
+    documents = []
+    for doc in newest_first:
+        if not older_than_cursor(doc):
+            continue
+        documents.append(doc)
+        if len(documents) > limit:  # Un documento extra indica que hay una página siguiente
+            break
+    return page_from_documents(documents, limit)
+
+
+def page_from_documents(documents: List[Dict], limit: int) -> Dict:
+    has_more = len(documents) > limit
+    documents = documents[:limit]
+    next_page_token = None
+    if has_more:
+        oldest = documents[-1]
+        next_page_token = encode_page_token(oldest["timestamp"], oldest["_id"])
+
+    messages = [{
+        "role": doc["role"],
+        "content": doc["content"],
+        "timestamp": doc["timestamp"].isoformat() if isinstance(doc.get("timestamp"), datetime) else doc.get("timestamp")
+    } for doc in reversed(documents)]
+    return {"messages": messages, "next_page_token": next_page_token}
+
+
+def format_cv_analysis(cv_analysis: Optional[Dict], thread_id: str) -> dict:
+    """Normalizes a cv_analysis document (current or old format) into the analysis returned to callers"""
+    if cv_analysis:
+        # Log for diagnostic - see which fields exist
+        cv_data = cv_analysis.get("cv_analysis", {})
+
+        # Verify if we have data in the correct format
+        if cv_data and isinstance(cv_data, dict) and 'data' in cv_data:
+            logging.info(f"CV found in correct format for thread_id: {thread_id}")
+            return cv_data  # Returns directly the cv_analysis object that contains 'data'
+        elif 'cv_data' in cv_analysis:
+            # Old format - return in the new format for compatibility
+            logging.info(f"CV found in old format for thread_id: {thread_id}")
+            return {
+                "success": True,
+                "data": cv_analysis.get("cv_data", {}),
+                "timestamp": cv_analysis.get("timestamp", datetime.utcnow().isoformat())
+            }
+        else:
+            logging.warning(f"CV found but without valid data for thread_id: {thread_id}")
+            return {"success": False, "error": "Invalid data format in the saved CV"}
+
+    logging.info(f"No CV analysis found for thread_id: {thread_id}")
+    return {"success": False, "error": "No CV analysis found for this user"}
+
+
+def prepare_cv_analysis(cv_analysis: dict) -> dict:
+    """Migrates old-format CV analyses in place and guarantees a 'data' field before saving"""
+    # Verify that cv_analysis has the expected structure
+    if 'data' not in cv_analysis:
+        logging.warning("Attempting to save CV without 'data' field")
+        if 'cv_data' in cv_analysis:
+            # Migrate old format to new
+            logging.info("Migrating old CV format to new format")
+            cv_analysis['data'] = cv_analysis.pop('cv_data')
+
+    # Ensure we have valid data before saving
+    if not cv_analysis.get('data') and 'raw_text' in cv_analysis:
+        logging.warning("CV without structured data. Saving with raw_text")
+        # Ensure a minimal data field to prevent later problems
+        cv_analysis['data'] = {
+            "note": "Data extracted from raw text",
+            "text": cv_analysis['raw_text'][:500] + "..."
+        }
+
+    # Log the complete object for diagnostics
+    logging.info(f"Saving CV with data: {str(cv_analysis.get('data', {}))[:300]}...")
+    return cv_analysis
+
+
+def build_cv_analysis_update(thread_id: str, cv_analysis: dict) -> Tuple[Dict, Dict]:
+    """(query, update) for the cv_analysis upsert"""
+    return {"thread_id": thread_id}, {"$set": {
+        "thread_id": thread_id,
+        "timestamp": datetime.utcnow().isoformat(),
+        "cv_analysis": cv_analysis  # Save complete cv_analysis as a nested document
+    }}
+
+
+def build_write_concern() -> WriteConcern:
+    """Write concern for acknowledged writes, from MONGO_WRITE_CONCERN_W / _J / _WTIMEOUT_MS"""
+    w = Config.MONGO_WRITE_CONCERN_W
+    return WriteConcern(
+        w=int(w) if w.isdigit() else w,
+        j=Config.MONGO_WRITE_CONCERN_J,
+        wtimeout=Config.MONGO_WRITE_CONCERN_WTIMEOUT_MS or None
+    )
+
+
 class MongoManager:
-    _client = None
+    _message_queue = None  # Cola write-behind compartida por todas las instancias del proceso
+    _schema_ready = False
+    _known_collections = set()  # Colecciones que ya existen (se llena al arrancar, sin consultar al servidor en cada llamada)
+    _thread_store = None  # ThreadBucketStore cuando CONVERSATION_STORAGE_LAYOUT=thread
 
     def __init__(self):
-        if MongoManager._client is None:  # If there is no active connection, we create it
+        try:
+            get_client()  # Cliente con pool compartido por el proceso (ver client_factory)
+        except Exception as e:
+            logging.error(f"Error connecting to MongoDB: {str(e)}")
+            raise Exception("Could not connect to MongoDB. Check the connection string and network.")
+
+        if Config.CONVERSATION_STORAGE_LAYOUT == "thread" and MongoManager._thread_store is None:
+            MongoManager._thread_store = ThreadBucketStore(
+                lambda: get_client().agent_memory_repli_post[THREADS_COLLECTION],
+                bucket_size=Config.CONVERSATION_BUCKET_SIZE
+            )
+
+        if not MongoManager._schema_ready:
+            MongoManager._schema_ready = True
+            self.bootstrap_schema()
+
+        if MongoManager._message_queue is None:
+            MongoManager._message_queue = WriteBehindQueue(
+                flush_fn=self._insert_messages,
+                mode=Config.MONGO_WRITE_MODE,
+                batch_size=Config.MONGO_WRITE_BATCH_SIZE,
+                flush_interval=Config.MONGO_WRITE_FLUSH_INTERVAL_MS / 1000,
+                max_queue=Config.MONGO_WRITE_QUEUE_MAX,
+                max_retries=Config.MONGO_WRITE_MAX_RETRIES,
+                name="conversations_memory"
+            )
+
+    # El cliente se resuelve en cada acceso: tras un fork, las instancias creadas en el
+    # proceso padre pasan a usar el cliente del hijo sin reconstruirse
+    @property
+    def client(self):
+        return get_client()
+
+    @property
+    def db(self):
+        return get_client().agent_memory_repli_post
+
+    @property
+    def agent_memory_repli_post(self):
+        return self.db.conversations_memory
+
+    @property
+    def thread_store(self):
+        """ThreadBucketStore when messages use the one-document-per-thread layout, else None"""
+        return MongoManager._thread_store
+
+    def bootstrap_schema(self):
+        """
+        Creates the collections and indexes (MONGO_ENSURE_INDEXES) once per process
+        and optionally checks the hot query plans
+        """
+        try:
+            MongoManager._known_collections = ensure_collections(self.db)
+        except Exception as e:
+            logging.error(f"Error creating MongoDB collections: {str(e)}")
+        if Config.MONGO_ENSURE_INDEXES:
             try:
-                MongoManager._client = MongoClient(Config.REPLI_MONGO_URI, serverSelectionTimeoutMS=5000)
-                MongoManager._client.server_info()  # Verify the connection
-                logging.info("Connected to MongoDB Atlas")
+                ensure_indexes(self.db)
             except Exception as e:
-                logging.error(f"Error connecting to MongoDB: {str(e)}")
-                raise Exception("Could not connect to MongoDB. Check the connection string and network.")
-
-        # Assign the established connection
-        self.client = MongoManager._client
-        self.db = self.client.agent_memory_repli_post
-        self.agent_memory_repli_post = self.db.conversations_memory
+                logging.error(f"Error creating MongoDB indexes: {str(e)}")
+        if Config.MONGO_VERIFY_QUERY_PLANS:
+            # IndexCoverageError se propaga: el proceso no debe arrancar con consultas sin índice
+            verify_query_plans(self.db)
+
+    def _insert_messages(self, messages: List[Dict]):
+        """Inserts a batch of messages. Safe to retry: already-inserted documents are skipped."""
+        if self.thread_store:
+            self.thread_store.insert_messages(messages)
+            return
+        try:
+            self.agent_memory_repli_post.insert_many(messages, ordered=False)
+        except BulkWriteError as e:
+            # insert_many asigna _id a cada documento antes de enviarlo, así que al reintentar
+            # un lote parcialmente escrito los ya insertados fallan con clave duplicada (11000)
+            other_errors = [err for err in e.details.get("writeErrors", []) if err.get("code") != 11000]
+            if other_errors or e.details.get("writeConcernErrors"):
+                raise
+
+    def flush_pending_writes(self, timeout: float = None) -> bool:
+        """Waits until every queued message has been written to MongoDB"""
+        return MongoManager._message_queue.flush(timeout)
+
+    def get_write_queue_stats(self) -> dict:
+        """Returns counters of the message write-behind queue"""
+        return MongoManager._message_queue.stats()
+
+    def get_pool_stats(self) -> dict:
+        """Returns connection pool metrics (checkout wait times, open connections)"""
+        return get_pool_stats()
+
+    @classmethod
+    def shutdown(cls):
+        """Flushes pending writes and closes the client; call on worker shutdown"""
+        if cls._message_queue is not None:
+            cls._message_queue.close()
+        close_client()
+
+    def _read_your_writes(self):
+        """Flushes queued messages before a read so callers always see their own writes"""
+        if MongoManager._message_queue.has_pending():
+            MongoManager._message_queue.flush()
 
     def get_cv_analysis(self, thread_id: str) -> dict:
         """Gets the saved CV analysis for a specific thread_id"""
         try:
-            cv_analysis = self.db.cv_analysis.find_one({"thread_id": thread_id})
-            if cv_analysis:
-                # Log for diagnostic - see which fields exist
-                cv_data = cv_analysis.get("cv_analysis", {})
-
-                # Verify if we have data in the correct format
-                if cv_data and isinstance(cv_data, dict) and 'data' in cv_data:
-                    logging.info(f"CV found in correct format for thread_id: {thread_id}")
-                    return cv_data  # Returns directly the cv_analysis object that contains 'data'
-                elif 'cv_data' in cv_analysis:
-                    # Old format - return in the new format for compatibility
-                    logging.info(f"CV found in old format for thread_id: {thread_id}")
-                    return {
-                        "success": True,
-                        "data": cv_analysis.get("cv_data", {}),
-                        "timestamp": cv_analysis.get("timestamp", datetime.utcnow().isoformat())
-                    }
-                else:
-                    logging.warning(f"CV found but without valid data for thread_id: {thread_id}")
-                    return {"success": False, "error": "Invalid data format in the saved CV"}
-
-            logging.info(f"No CV analysis found for thread_id: {thread_id}")
-            return {"success": False, "error": "No CV analysis found for this user"}
+            return format_cv_analysis(self.db.cv_analysis.find_one({"thread_id": thread_id}), thread_id)
         except Exception as e:
             logging.error(f"Error retrieving CV analysis from MongoDB: {str(e)}")
             return {"success": False, "error": str(e)}
 
-    def save_cv_analysis(self, thread_id: str, cv_analysis: dict) -> bool:
-        """Saves the CV analysis to the database with the correct format"""
+    def save_cv_analysis(self, thread_id: str, cv_analysis: dict, return_document: bool = False):
+        """
+        Saves the CV analysis to the database with the correct format
+
+        Args:
+            thread_id (str): Conversation ID
+            cv_analysis (dict): CV analysis to store
+            return_document (bool): If True, uses find_one_and_update and returns the stored document
+
+        Returns:
+            bool: True if the write was acknowledged (default)
+            dict: The stored document, or None on error (return_document=True)
+        """
         try:
-            # Verify that cv_analysis has the expected structure
-            if 'data' not in cv_analysis:
-                logging.warning(f"Attempting to save CV without 'data' field for thread_id: {thread_id}")
-                if 'cv_data' in cv_analysis:
-                    # Migrate old format to new
-                    logging.info("Migrating old CV format to new format")
-                    cv_analysis['data'] = cv_analysis.pop('cv_data')
-
-            # Ensure we have valid data before saving
-            if not cv_analysis.get('data') and 'raw_text' in cv_analysis:
-                logging.warning("CV without structured data. Saving with raw_text")
-                # Ensure a minimal data field to prevent later problems
-                cv_analysis['data'] = {
-                    "note": "Data extracted from raw text",
-                    "text": cv_analysis['raw_text'][:500] + "..."
-                }
-
-            # Log the complete object for diagnostics
-            logging.info(f"Saving CV with data: {str(cv_analysis.get('data', {}))[:300]}...")
-
-            # Save in MongoDB with the appropriate format
-            self.db.cv_analysis.update_one(
-                {"thread_id": thread_id},
-                {"$set": {
-                    "thread_id": thread_id,
-                    "timestamp": datetime.utcnow().isoformat(),
-                    "cv_analysis": cv_analysis  # Save complete cv_analysis as a nested document
-                }},
-                upsert=True
-            )
+            collection = self.db.cv_analysis.with_options(write_concern=build_write_concern())
+            query, update = build_cv_analysis_update(thread_id, prepare_cv_analysis(cv_analysis))
+            with get_histogram("mongo.save_cv_analysis").time():
+                if return_document:
+                    stored = collection.find_one_and_update(
+                        query, update, upsert=True, return_document=ReturnDocument.AFTER
+                    )
+                else:
+                    result = collection.update_one(query, update, upsert=True)
 
-            # Verify that it was saved correctly
-            verification = self.db.cv_analysis.find_one({"thread_id": thread_id})
-            if verification and "cv_analysis" in verification:
+            if return_document:
+                logging.info(f"CV saved correctly for thread_id: {thread_id}")
+                return stored
+            # Con w=0 el servidor no confirma la escritura; no hay nada que verificar
+            if result.acknowledged or not collection.write_concern.acknowledged:
                 logging.info(f"CV saved correctly for thread_id: {thread_id}")
                 return True
-            else:
-                logging.warning(f"CV save verification failed for thread_id: {thread_id}")
-                return False
+            logging.warning(f"CV save not acknowledged for thread_id: {thread_id}")
+            return False
         except Exception as e:
             logging.error(f"Error saving CV analysis to MongoDB: {str(e)}")
-            return False
+            return None if return_document else False
 
     def save_message(self, thread_id: str, user_name: str, role: str, content: str):
-        """Saves a message to the user's conversation"""
-        message = {
-            'thread_id': thread_id,
-            'user_name': user_name,
-            'role': role,
-            'content': content,
-            'timestamp': datetime.utcnow(),
-            'status': 'active'  # New field for tracking
-        }
-        self.agent_memory_repli_post.insert_one(message)
+        """Saves a message to the user's conversation (through the write-behind queue, see MONGO_WRITE_MODE)"""
+        message = build_message_document(thread_id, user_name, role, content)
+        MongoManager._message_queue.submit(message)
 
     def get_conversation_history(self, thread_id: str, limit: int = None) -> List[Dict]:
         """Gets the conversation history"""
+        self._read_your_writes()
+        if self.thread_store:
+            return self.thread_store.get_history(thread_id, limit if isinstance(limit, int) and limit > 0 else None)
         query = {"thread_id": thread_id}
         # Use self.agent_memory_repli_post instead of self.messages_collection
-        cursor = self.agent_memory_repli_post.find(query).sort("timestamp", 1)  # 1 for ascending, -1 for descending
+        cursor = self.agent_memory_repli_post.find(query).sort([("timestamp", 1), ("_id", 1)])  # 1 for ascending, -1 for descending
         if isinstance(limit, int) and limit > 0:
             cursor = cursor.limit(limit)
         return list(cursor)
 
+    def iter_conversation_history(self, thread_id: str, projection: dict = None,
+                                  batch_size: int = 200) -> Iterator[Dict]:
+        """
+        Streams the conversation in chronological order, fetching only the projected
+        fields (role and content by default) in batches of `batch_size` documents
+        """
+        self._read_your_writes()
+        projection = projection or HISTORY_PROJECTION
+        if self.thread_store:
+            fields = tuple(field for field, include in projection.items() if include and field != "_id")
+            yield from self.thread_store.iter_history(thread_id, fields)
+            return
+        cursor = self.agent_memory_repli_post.find(
+            {"thread_id": thread_id},
+            projection
+        ).sort([("timestamp", 1), ("_id", 1)]).batch_size(batch_size)
+        for message in cursor:
+            yield message
+
+    def get_history_page(self, thread_id: str, limit: int = None, before: datetime = None,
+                         page_token: str = None) -> Dict:
+        """
+        Gets one page of the conversation, newest messages first in the query and
+        returned in chronological order.
+
+        Args:
+            thread_id (str): Conversation ID
+            limit (int, optional): Page size (capped at Config.HISTORY_PAGE_SIZE_MAX)
+            before (datetime, optional): Only messages older than this timestamp
+            page_token (str, optional): Token returned by the previous page (takes precedence over 'before')
+
+        Returns:
+            dict: {'messages': [...], 'next_page_token': str or None}
+        """
+        self._read_your_writes()
+        limit = min(limit or Config.HISTORY_PAGE_SIZE_DEFAULT, Config.HISTORY_PAGE_SIZE_MAX)
+        token_timestamp, _, older_than_cursor = make_page_filter(page_token, before)
+
+        if self.thread_store:
+            source = self.thread_store.iter_newest_first(thread_id, until=token_timestamp or before)
+            cursor = None
+        else:
+            cursor = source = (self.agent_memory_repli_post.find(
+                history_page_query(thread_id, token_timestamp, before), HISTORY_PAGE_PROJECTION
+            ).sort([("timestamp", -1), ("_id", -1)]).batch_size(limit + 2))
+        try:
+            return build_history_page(source, limit, older_than_cursor)
+        finally:
+            if cursor is not None:
+                cursor.close()
+
+    def get_recent_messages(self, thread_id: str, limit: int) -> List[Dict]:
+        """Gets the last `limit` messages in chronological order (role, content, timestamp)"""
+        return self.get_history_page(thread_id, limit=limit)["messages"]
+
     def update_user_name(self, thread_id: str, user_name: str):
         """Updates the user name in all their messages"""
+        self._read_your_writes()
+        if self.thread_store:
+            self.thread_store.update_user_name(thread_id, user_name)
+            return
         self.agent_memory_repli_post.update_many(
             {'thread_id': thread_id},
             {'$set': {'user_name': user_name}}
@@ -148,6 +436,10 @@ class MongoManager:
 
     def finalize_conversation(self, thread_id: str):
         """Marks the conversation as finalized in MongoDB"""
+        self._read_your_writes()
+        if self.thread_store:
+            self.thread_store.finalize_conversation(thread_id)
+            return
         self.agent_memory_repli_post.update_many(
             {'thread_id': thread_id},
             {'$set': {
@@ -158,18 +450,22 @@ class MongoManager:
 
     def get_last_active_thread(self) -> str:
         """Gets the last active thread_id"""
-        last_conversation = self.agent_memory_repli_post.find_one(
+        self._read_your_writes()
+        last_conversation = self._find_last_active()
+        return last_conversation['thread_id'] if last_conversation else None
+
+    def _find_last_active(self) -> dict:
+        """Most recent active message (or thread summary), with thread_id, user_name and timestamp"""
+        if self.thread_store:
+            return self.thread_store.get_last_active()
+        return self.agent_memory_repli_post.find_one(
             {'status': 'active'},
             sort=[('timestamp', -1)]
         )
-        return last_conversation['thread_id'] if last_conversation else None
 
     def get_active_conversation_info(self) -> dict:
         """Gets information of the last active conversation"""
-        last_conversation = self.agent_memory_repli_post.find_one(
-            {'status': 'active'},
-            sort=[('timestamp', -1)]
-        )
+        last_conversation = self._find_last_active()
         if last_conversation:
             # Get all messages from this conversation for context
             messages = self.get_conversation_history(last_conversation['thread_id'])
@@ -191,7 +487,10 @@ class MongoManager:
             'user_name': user_name,
             'status': 'active'
         }
-        last_conversation = self.agent_memory_repli_post.find_one(query, sort=[('timestamp', -1)])
+        if self.thread_store:
+            last_conversation = self.thread_store.get_last_active_by_user(user_name)
+        else:
+            last_conversation = self.agent_memory_repli_post.find_one(query, sort=[('timestamp', -1)])
         if last_conversation:
             return {
                 'thread_id': last_conversation['thread_id'],
@@ -200,64 +499,6 @@ class MongoManager:
             }
         return None
         
-    def get_context(self, thread_id: str) -> dict:
-        """Gets the context for a specific thread_id"""
-        try:
-            # Ensure we have a context collection
-            if not hasattr(self.db, 'context'):
-                self.db.create_collection('context')
-                
-            context = self.db.context.find_one({"thread_id": thread_id})
-            if context:
-                logging.info(f"Retrieved context from MongoDB for thread_id: {thread_id}")
-                # Log location info for debugging
-                if "user_location" in context:
-                    logging.info(f"Context has location: {context['user_location']} (Latinoamérica: {context.get('is_latinamerica')})")
-                return context
-            else:
-                logging.info(f"No context found in MongoDB for thread_id: {thread_id}")
-                return None
-        except Exception as e:
-            logging.error(f"Error retrieving context from MongoDB: {str(e)}")
-            return None
-            
-    def save_context(self, thread_id: str, context: dict) -> bool:
-        """Saves the context to the database"""
-        try:
-            # Ensure we have a context collection
-            if not hasattr(self.db, 'context'):
-                self.db.create_collection('context')
-                
-            # Make sure thread_id is in the context
-            context["thread_id"] = thread_id
-            context["last_updated"] = datetime.utcnow().isoformat()
-            
-            # Log location info for debugging
-            if "user_location" in context:
-                logging.info(f"Saving context with location: {context['user_location']} (Latinoamérica: {context.get('is_latinamerica')})")
-            
-            # Log service sold info for debugging
-            if "service_sold" in context:
-                logging.info(f"Saving context with service sold: {context['service_sold']}")
-                
-            # Update or insert the context
-            result = self.db.context.update_one(
-                {"thread_id": thread_id},
-                {"$set": context},
-                upsert=True
-            )
-            
-            # Verify the operation was successful
-            if result.acknowledged:
-                logging.info(f"Context saved successfully for thread_id: {thread_id}")
-                return True
-            else:
-                logging.warning(f"Context save operation not acknowledged for thread_id: {thread_id}")
-                return False
-        except Exception as e:
-            logging.error(f"Error saving context to MongoDB: {str(e)}")
-            return False
-
     def get_or_create_user_thread(self, user_name: str) -> str:
         """Gets or creates a thread_id for a user"""
         existing_conv = self.get_conversation_by_user(user_name)
@@ -335,10 +576,13 @@ class MongoManager:
         Returns:
             list: List of messages sorted by date (most recent first)
         """
+        self._read_your_writes()
+        if self.thread_store:
+            return self.thread_store.get_messages(thread_id, limit)
         query = {"thread_id": thread_id, "role": {"$in": ["user", "assistant"]}}
 
         # Sort by timestamp descending (most recent first)
-        cursor = self.agent_memory_repli_post.find(query).sort("timestamp", -1)
+        cursor = self.agent_memory_repli_post.find(query).sort([("timestamp", -1), ("_id", -1)])
 
         # Apply limit if specified
         if limit:
@@ -363,6 +607,32 @@ class MongoManager:
             logging.error(f"Error retrieving user info from MongoDB: {str(e)}")
             return None
 
+    # --- Contexto por conversación (colecciones context_data y conversation_context) ---
+
+    def _ensure_collection(self, name: str):
+        """Creates the collection the first time this process writes to it (no server round-trip once known)"""
+        if name in MongoManager._known_collections:
+            return
+        try:
+            self.db.create_collection(name)
+        except CollectionInvalid:
+            pass  # Ya existía
+        MongoManager._known_collections.add(name)
+
+    def _find_context(self, collection_name: str, thread_id: str) -> dict:
+        return self.db[collection_name].find_one({"thread_id": thread_id})
+
+    def _upsert_context(self, collection_name: str, thread_id: str, context_data: dict) -> bool:
+        """Single write path for context documents: one upsert keyed by thread_id"""
+        self._ensure_collection(collection_name)
+        document = dict(context_data, thread_id=thread_id, last_updated=datetime.utcnow())
+        result = self.db[collection_name].update_one(
+            {"thread_id": thread_id},
+            {"$set": document},
+            upsert=True
+        )
+        return result.acknowledged
+
     def get_context(self, thread_id: str) -> dict:
         """
         Get context data for a thread
@@ -374,12 +644,7 @@ class MongoManager:
             dict: Context data or None if not found
         """
         try:
-            # Create a new collection for storing context if it doesn't exist yet
-            if 'context_data' not in self.db.list_collection_names():
-                self.db.create_collection('context_data')
-
-            context = self.db.context_data.find_one({"thread_id": thread_id})
-            return context
+            return self._find_context("context_data", thread_id)
         except Exception as e:
             logging.error(f"Error retrieving context from MongoDB: {str(e)}")
             return None
@@ -396,20 +661,7 @@ class MongoManager:
             bool: True if successful, False otherwise
         """
         try:
-            # Add thread_id to ensure we can query it later
-            context_data["thread_id"] = thread_id
-            context_data["last_updated"] = datetime.utcnow()
-
-            # Create a new collection for storing context if it doesn't exist yet
-            if 'context_data' not in self.db.list_collection_names():
-                self.db.create_collection('context_data')
-
-            self.db.context_data.update_one(
-                {"thread_id": thread_id},
-                {"$set": context_data},
-                upsert=True
-            )
-            return True
+            return self._upsert_context("context_data", thread_id, context_data)
         except Exception as e:
             logging.error(f"Error saving context to MongoDB: {str(e)}")
             return False
@@ -425,19 +677,9 @@ class MongoManager:
             dict: Conversation context or None if not found
         """
         try:
-            # Try to find in a dedicated collection first
-            if 'conversation_context' in self.db.list_collection_names():
-                context = self.db.conversation_context.find_one({"thread_id": thread_id})
-                if context:
-                    return context
-
-            # Fall back to context_data if available
-            if 'context_data' in self.db.list_collection_names():
-                context = self.db.context_data.find_one({"thread_id": thread_id})
-                if context:
-                    return context
-
-            return None
+            # Colección dedicada primero, luego context_data como respaldo
+            return (self._find_context("conversation_context", thread_id)
+                    or self._find_context("context_data", thread_id))
         except Exception as e:
             logging.error(f"Error retrieving conversation context from MongoDB: {str(e)}")
             return None
@@ -454,20 +696,81 @@ class MongoManager:
             bool: True if successful, False otherwise
         """
         try:
-            # Add thread_id to ensure we can query it later
-            context_data["thread_id"] = thread_id
-            context_data["last_updated"] = datetime.utcnow()
+            return self._upsert_context("conversation_context", thread_id, context_data)
+        except Exception as e:
+            logging.error(f"Error saving conversation context to MongoDB: {str(e)}")
+            return False
+
+    # --- Documentos extraídos (colección documents) ---
+
+    def save_document(self, thread_id: str, sha256: str, fields: dict,
+                      job_id: str = None, batch_id: str = None) -> bool:
+        """
+        Upserts the document identified by (thread_id, sha256) with `fields`,
+        recording the job and batch that produced it
+        """
+        now = datetime.utcnow()
+        update = {
+            "$set": dict(fields, updated_at=now),
+            "$setOnInsert": {"thread_id": thread_id, "sha256": sha256, "created_at": now}
+        }
+        if job_id or batch_id:
+            update["$addToSet"] = {key: value for key, value in (("job_ids", job_id), ("batch_ids", batch_id)) if value}
+        try:
+            result = self.db.documents.update_one({"thread_id": thread_id, "sha256": sha256}, update, upsert=True)
+            return result.acknowledged
+        except Exception as e:
+            logging.error(f"Error saving document to MongoDB: {str(e)}")
+            return False
 
-            # Create a new collection for storing conversation context if it doesn't exist yet
-            if 'conversation_context' not in self.db.list_collection_names():
-                self.db.create_collection('conversation_context')
+    def find_document(self, thread_id: str, sha256: str) -> dict:
+        """Gets the stored document with this content for the thread, or None"""
+        try:
+            return self.db.documents.find_one({"thread_id": thread_id, "sha256": sha256}, {"_id": 0})
+        except Exception as e:
+            logging.error(f"Error retrieving document from MongoDB: {str(e)}")
+            return None
 
-            self.db.conversation_context.update_one(
-                {"thread_id": thread_id},
-                {"$set": context_data},
-                upsert=True
-            )
+    def _document_projection(self, include_text: bool) -> dict:
+        return {"_id": 0} if include_text else {"_id": 0, "text": 0}
+
+    def find_document_by_job(self, job_id: str, include_text: bool = False) -> dict:
+        """Gets the document produced by an ingestion job, or None"""
+        try:
+            return self.db.documents.find_one({"job_ids": job_id}, self._document_projection(include_text))
+        except Exception as e:
+            logging.error(f"Error retrieving document job from MongoDB: {str(e)}")
+            return None
+
+    def find_documents_by_batch(self, batch_id: str, include_text: bool = False) -> List[Dict]:
+        """Gets the documents of an ingestion batch"""
+        try:
+            return list(self.db.documents.find({"batch_ids": batch_id}, self._document_projection(include_text)))
+        except Exception as e:
+            logging.error(f"Error retrieving document batch from MongoDB: {str(e)}")
+            return []
+
+    def get_pending_documents(self, thread_id: str) -> List[Dict]:
+        """Extracted documents of the thread not yet attached to the conversation, oldest first"""
+        try:
+            return list(self.db.documents.find(
+                {"thread_id": thread_id, "status": "done", "attached_at": None},
+                {"_id": 0, "sha256": 1, "filename": 1, "text": 1}
+            ).sort("created_at", 1))
+        except Exception as e:
+            logging.error(f"Error retrieving pending documents from MongoDB: {str(e)}")
+            return []
+
+    def mark_documents_attached(self, thread_id: str, sha256s: List[str]) -> bool:
+        """Marks documents as attached to the conversation so later turns skip them"""
+        if not sha256s:
             return True
+        try:
+            result = self.db.documents.update_many(
+                {"thread_id": thread_id, "sha256": {"$in": list(sha256s)}},
+                {"$set": {"attached_at": datetime.utcnow()}}
+            )
+            return result.acknowledged
         except Exception as e:
-            logging.error(f"Error saving conversation context to MongoDB: {str(e)}")
+            logging.error(f"Error marking documents as attached in MongoDB: {str(e)}")
             return False
@@ -0,0 +1,239 @@
+"""
+Bucketed single-document-per-thread storage for conversation messages.
+
+Selected with CONVERSATION_STORAGE_LAYOUT=thread. Instead of one document per
+message in conversations_memory, each thread lives in conversation_threads as
+one document whose `messages` array holds up to `bucket_size` messages. A
+thread that outgrows it continues in a new bucket document (bucket pattern),
+so no document approaches the 16 MB limit. Writes only go to the newest
+bucket, keeping bucket order chronological. Most threads are a single
+document, which turns update_user_name / finalize_conversation into
+one-document updates and a cold load into a single read.
+
+Bucket document:
+    {thread_id, user_name, status, count, first_timestamp, last_timestamp,
+     messages: [{_id, role, content, user_name, timestamp}, ...]}
+
+The methods return message dicts shaped like the conversations_memory
+documents (thread_id, user_name, role, content, timestamp, status, _id), so
+MongoManager callers work unchanged with either layout.
+"""
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+
+THREADS_COLLECTION = "conversation_threads"
+
+# Campos de cada mensaje dentro del array
+_MESSAGE_FIELDS = ("_id", "role", "content", "user_name", "timestamp")
+
+
+def build_bucket_message(message: Dict) -> Dict:
+    """Subdocument stored in the bucket for one conversations_memory-style message."""
+    return {field: message[field] for field in _MESSAGE_FIELDS if field in message}
+
+
+class ThreadBucketStore:
+    """Conversation storage with one bucket document (or a few) per thread."""
+
+    def __init__(self, collection_fn: Callable, bucket_size: int = 200):
+        # collection_fn se evalúa en cada operación para respetar el cliente del proceso actual (fork)
+        self._collection_fn = collection_fn
+        self.bucket_size = max(bucket_size, 1)
+
+    @property
+    def collection(self):
+        return self._collection_fn()
+
+    # --- Escritura ---
+
+    def _newest_bucket(self, thread_id: str) -> Optional[Dict]:
+        return self.collection.find_one(
+            {"thread_id": thread_id}, {"count": 1},
+            sort=[("first_timestamp", -1), ("_id", -1)]
+        )
+
+    def append(self, thread_id: str, messages: List[Dict]) -> None:
+        """
+        Appends messages to the newest bucket of the thread with one $push, spilling
+        whatever does not fit into new buckets. Older buckets are never written to,
+        so bucket order stays chronological. Each message is marked `_bucket_written`
+        once stored, so a retried batch skips it (see insert_messages).
+        """
+        pending = [m for m in messages if not m.get("_bucket_written")]
+        while pending:
+            newest = self._newest_bucket(thread_id)
+            room = self.bucket_size - newest.get("count", 0) if newest else 0
+            if room > 0:
+                chunk = pending[:room]
+                result = self.collection.update_one(
+                    # El filtro por count vuelve a comprobar el espacio: si otro escritor llenó
+                    # el bucket entre la lectura y el $push, no se escribe y se vuelve a leer
+                    {"_id": newest["_id"], "count": {"$lte": self.bucket_size - len(chunk)}},
+                    {
+                        "$push": {"messages": {"$each": [build_bucket_message(m) for m in chunk]}},
+                        "$inc": {"count": len(chunk)},
+                        "$set": {"last_timestamp": chunk[-1]["timestamp"],
+                                 "status": chunk[0].get("status", "active")}
+                    }
+                )
+                if not result.matched_count:
+                    continue
+            else:
+                chunk = pending[:self.bucket_size]
+                self.collection.insert_one({
+                    "thread_id": thread_id,
+                    "user_name": chunk[0].get("user_name"),
+                    "status": chunk[0].get("status", "active"),
+                    "count": len(chunk),
+                    "first_timestamp": chunk[0]["timestamp"],
+                    "last_timestamp": chunk[-1]["timestamp"],
+                    "messages": [build_bucket_message(m) for m in chunk]
+                })
+            for message in chunk:
+                message["_bucket_written"] = True
+            pending = pending[len(chunk):]
+
+    def insert_messages(self, messages: List[Dict]) -> None:
+        """
+        Writes a batch of messages (write-behind flush function), appending the messages
+        of each thread in order. Messages already written in a previous attempt of the
+        same batch are skipped, so retries do not duplicate them.
+        """
+        groups: "OrderedDict[str, List[Dict]]" = OrderedDict()
+        for message in messages:
+            if not message.get("_bucket_written"):
+                groups.setdefault(message["thread_id"], []).append(message)
+
+        for thread_id, thread_messages in groups.items():
+            self.append(thread_id, thread_messages)
+
+    def update_user_name(self, thread_id: str, user_name: str) -> None:
+        self.collection.update_many(
+            {"thread_id": thread_id},
+            {"$set": {"user_name": user_name, "messages.$[].user_name": user_name}}
+        )
+
+    def finalize_conversation(self, thread_id: str) -> None:
+        self.collection.update_many(
+            {"thread_id": thread_id},
+            {"$set": {"status": "completed", "end_time": datetime.utcnow()}}
+        )
+
+    # --- Lectura ---
+
+    @staticmethod
+    def _as_message_document(bucket: Dict, message: Dict) -> Dict:
+        document = dict(message)
+        document["thread_id"] = bucket.get("thread_id")
+        document["status"] = bucket.get("status")
+        return document
+
+    def _iter_buckets(self, thread_id: str, descending: bool = False, projection: Optional[Dict] = None):
+        direction = -1 if descending else 1
+        return self.collection.find({"thread_id": thread_id}, projection).sort(
+            [("first_timestamp", direction), ("_id", direction)]
+        )
+
+    def iter_history(self, thread_id: str, fields: Tuple[str, ...] = ("role", "content")) -> Iterator[Dict]:
+        """Streams the thread's messages in chronological order, limited to `fields`."""
+        projection = {"_id": 0, **{f"messages.{field}": 1 for field in fields}}
+        for bucket in self._iter_buckets(thread_id, projection=projection):
+            for message in bucket.get("messages", []):
+                yield {field: message.get(field) for field in fields}
+
+    def get_history(self, thread_id: str, limit: int = None) -> List[Dict]:
+        """Full message documents in chronological order (first `limit` if given)."""
+        result = []
+        for bucket in self._iter_buckets(thread_id):
+            for message in bucket.get("messages", []):
+                result.append(self._as_message_document(bucket, message))
+                if limit and len(result) >= limit:
+                    return result
+        return result
+
+    def iter_newest_first(self, thread_id: str, until: Optional[datetime] = None) -> Iterator[Dict]:
+        """
+        Yields message documents from newest to oldest, bucket by bucket. With `until`,
+        buckets that start after that timestamp are not fetched (the caller still filters messages).
+        """
+        query = {"thread_id": thread_id}
+        if until is not None:
+            query["first_timestamp"] = {"$lte": until}
+        cursor = self.collection.find(query).sort([("first_timestamp", -1), ("_id", -1)])
+        for bucket in cursor:
+            for message in reversed(bucket.get("messages", [])):
+                yield self._as_message_document(bucket, message)
+
+    def get_recent(self, thread_id: str, limit: int) -> List[Dict]:
+        """Last `limit` messages, chronological, reading only the tail of the newest bucket ($slice)."""
+        bucket = self.collection.find_one(
+            {"thread_id": thread_id},
+            {"messages": {"$slice": -limit}, "thread_id": 1, "status": 1, "count": 1},
+            sort=[("first_timestamp", -1), ("_id", -1)]
+        )
+        if bucket is None:
+            return []
+        if bucket.get("count", 0) < limit:
+            # El último bucket no basta: se recorre hacia atrás
+            messages = []
+            for message in self.iter_newest_first(thread_id):
+                messages.append(message)
+                if len(messages) >= limit:
+                    break
+            return list(reversed(messages))
+        return [self._as_message_document(bucket, message) for message in bucket.get("messages", [])]
+
+    def get_messages(self, thread_id: str, limit: int = None, roles=("user", "assistant")) -> List[Dict]:
+        """Most recent messages with the given roles, newest first."""
+        result = []
+        for message in self.iter_newest_first(thread_id):
+            if message.get("role") in roles:
+                result.append(message)
+                if limit and len(result) >= limit:
+                    break
+        return result
+
+    def _latest_bucket(self, query: Dict) -> Optional[Dict]:
+        return self.collection.find_one(
+            query,
+            {"thread_id": 1, "user_name": 1, "last_timestamp": 1, "status": 1},
+            sort=[("last_timestamp", -1)]
+        )
+
+    def get_last_active(self) -> Optional[Dict]:
+        """{'thread_id', 'user_name', 'timestamp'} of the most recently active thread."""
+        bucket = self._latest_bucket({"status": "active"})
+        if not bucket:
+            return None
+        return {"thread_id": bucket["thread_id"], "user_name": bucket.get("user_name"),
+                "timestamp": bucket["last_timestamp"]}
+
+    def get_last_active_by_user(self, user_name: str) -> Optional[Dict]:
+        bucket = self._latest_bucket({"user_name": user_name, "status": "active"})
+        if not bucket:
+            return None
+        return {"thread_id": bucket["thread_id"], "user_name": bucket.get("user_name"),
+                "timestamp": bucket["last_timestamp"]}
+
+    # --- Migración ---
+
+    def build_buckets(self, thread_id: str, messages: List[Dict]) -> List[Dict]:
+        """Bucket documents for a whole thread (messages in chronological order), used by the migration."""
+        buckets = []
+        for start in range(0, len(messages), self.bucket_size):
+            chunk = messages[start:start + self.bucket_size]
+            buckets.append({
+                "thread_id": thread_id,
+                "user_name": chunk[-1].get("user_name"),
+                "status": chunk[-1].get("status", "active"),
+                "count": len(chunk),
+                "first_timestamp": chunk[0]["timestamp"],
+                "last_timestamp": chunk[-1]["timestamp"],
+                "messages": [build_bucket_message(m) for m in chunk]
+            })
+        if buckets and messages[-1].get("end_time"):
+            for bucket in buckets:
+                bucket["end_time"] = messages[-1]["end_time"]
+        return buckets
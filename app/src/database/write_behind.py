@@ -0,0 +1,217 @@
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+# Modos de durabilidad
+WRITE_MODE_SYNC = "sync"    # Escribe en la llamada (comportamiento clásico)
+WRITE_MODE_ASYNC = "async"  # Encola y retorna de inmediato; un hilo persiste por lotes
+WRITE_MODE_GROUP = "group"  # Encola y espera a que el lote que lo contiene se confirme (group commit)
+WRITE_MODES = (WRITE_MODE_SYNC, WRITE_MODE_ASYNC, WRITE_MODE_GROUP)
+
+
+class WriteBehindError(Exception):
+    """Raised when a write could not be persisted (sync/group modes) or enqueued (queue full)."""
+
+
+class _PendingWrite:
+    __slots__ = ("item", "done", "error")
+
+    def __init__(self, item: Any, wait: bool):
+        self.item = item
+        self.done = threading.Event() if wait else None
+        self.error: Optional[Exception] = None
+
+
+class WriteBehindQueue:
+    """
+    Write-behind queue that batches documents and persists them with a single flush_fn call per batch.
+
+    A background thread drains the queue and flushes when the batch reaches
+    `batch_size`, when `flush_interval` seconds passed since the first queued item,
+    or on shutdown. In group mode there is no linger: an idle writer flushes the
+    first item right away, and items submitted while a flush is in flight are
+    committed together in the next one. Failed batches are retried with
+    exponential backoff; while retrying the queue keeps filling and producers
+    block once it is full (backpressure), up to `put_timeout` seconds.
+
+    The queue is fork-aware: a child process starts with an empty queue and its own worker thread.
+    """
+
+    def __init__(
+        self,
+        flush_fn: Callable[[List[Any]], None],
+        mode: str = WRITE_MODE_GROUP,
+        batch_size: int = 100,
+        flush_interval: float = 0.05,
+        max_queue: int = 10000,
+        max_retries: int = 5,
+        retry_backoff: float = 0.2,
+        put_timeout: float = 5.0,
+        name: str = "write_behind"
+    ):
+        if mode not in WRITE_MODES:
+            raise ValueError(f"Modo de escritura no válido: {mode}. Opciones: {WRITE_MODES}")
+        self.flush_fn = flush_fn
+        self.mode = mode
+        self.batch_size = max(batch_size, 1)
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.put_timeout = put_timeout
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._drained = threading.Condition(self._lock)
+        self._pid = None
+        self._queue: Optional[queue.Queue] = None
+        self._worker: Optional[threading.Thread] = None
+        self._stopping = False
+        self._pending = 0
+        self._stats = {"submitted": 0, "written": 0, "batches": 0, "retries": 0, "dropped": 0}
+        atexit.register(self.close)
+
+    # --- API pública ---
+
+    def submit(self, item: Any) -> None:
+        """Persists `item` according to the configured durability mode."""
+        if self.mode == WRITE_MODE_SYNC:
+            self._flush_with_retries([item])
+            with self._lock:
+                self._stats["submitted"] += 1
+            return
+
+        self._ensure_worker()
+        pending = _PendingWrite(item, wait=self.mode == WRITE_MODE_GROUP)
+        with self._lock:
+            self._pending += 1
+            self._stats["submitted"] += 1
+        try:
+            self._queue.put(pending, timeout=self.put_timeout)
+        except queue.Full:
+            with self._lock:
+                self._pending -= 1
+                self._stats["dropped"] += 1
+                self._drained.notify_all()
+            raise WriteBehindError(f"[{self.name}] Cola llena ({self.max_queue}); la base de datos no da abasto")
+
+        if pending.done is not None:
+            pending.done.wait()
+            if pending.error is not None:
+                raise WriteBehindError(f"[{self.name}] No se pudo persistir el lote: {pending.error}")
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Blocks until every queued item has been processed. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            while self._pending > 0 and self._pid == os.getpid():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._drained.wait(remaining)
+        return True
+
+    def has_pending(self) -> bool:
+        return self._pending > 0 and self._pid == os.getpid()
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Flushes what is queued and stops the worker thread."""
+        if self._worker is None or self._pid != os.getpid():
+            return
+        self.flush(timeout)
+        self._stopping = True
+        self._worker.join(timeout=1.0)
+        self._worker = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"mode": self.mode, "pending": self._pending, **self._stats}
+
+    # --- Internos ---
+
+    def _ensure_worker(self) -> None:
+        pid = os.getpid()
+        if self._pid == pid and self._worker is not None:
+            return
+        with self._lock:
+            if self._pid == pid and self._worker is not None:
+                return
+            # Proceso nuevo (o tras un fork): los elementos heredados pertenecen al padre
+            self._pid = pid
+            self._queue = queue.Queue(maxsize=self.max_queue)
+            self._pending = 0
+            self._stopping = False
+            self._worker = threading.Thread(target=self._run, name=f"{self.name}-writer", daemon=True)
+            self._worker.start()
+
+    def _run(self) -> None:
+        while not self._stopping:
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            batch = [first]
+            if self.mode == WRITE_MODE_GROUP:
+                # Group commit: el lote sale en cuanto llega el primero, con lo que ya estaba en
+                # cola; quienes llegan durante el flush forman el siguiente lote, sin esperas fijas
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                self._process_batch(batch)
+                continue
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._process_batch(batch)
+
+    def _process_batch(self, batch: List[_PendingWrite]) -> None:
+        error = None
+        try:
+            self._flush_with_retries([pending.item for pending in batch])
+        except Exception as e:
+            error = e
+            logging.error(f"[{self.name}] Se descartan {len(batch)} escrituras tras {self.max_retries} reintentos: {e}")
+
+        with self._lock:
+            if error is None:
+                self._stats["written"] += len(batch)
+            else:
+                self._stats["dropped"] += len(batch)
+            self._pending -= len(batch)
+            self._drained.notify_all()
+
+        for pending in batch:
+            if pending.done is not None:
+                pending.error = error
+                pending.done.set()
+
+    def _flush_with_retries(self, items: List[Any]) -> None:
+        attempt = 0
+        while True:
+            try:
+                self.flush_fn(items)
+                with self._lock:
+                    self._stats["batches"] += 1
+                return
+            except Exception as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                wait = self.retry_backoff * (2 ** (attempt - 1))
+                with self._lock:
+                    self._stats["retries"] += 1
+                logging.warning(f"[{self.name}] Falló la escritura de {len(items)} documentos ({e}). "
+                                f"Reintento {attempt}/{self.max_retries} en {wait:.2f}s")
+                time.sleep(wait)
@@ -1,55 +1,118 @@
 # src/memory/conversation_memory.py
 import os
+import asyncio
 import logging
 from typing import Dict, List
 from pathlib import Path
 
 # Importamos el MongoManager para la persistencia
 from ..database.mongo_manager import MongoManager
+from .session_cache import SessionCache
+from app.config.settings import SESSION_CACHE_MAX_ENTRIES, SESSION_CACHE_IDLE_TTL_SECONDS, SESSION_CACHE_MAX_MB
 
-# Diccionario para almacenar instancias de memoria de conversación por thread_id
-_conversation_memories = {}
+# Caché acotada de instancias de memoria de conversación por thread_id.
+# Las instancias expulsadas se recargan desde MongoDB al volver a pedirlas.
+_conversation_memories = SessionCache(
+    max_entries=SESSION_CACHE_MAX_ENTRIES,
+    idle_ttl_seconds=SESSION_CACHE_IDLE_TTL_SECONDS,
+    max_bytes=SESSION_CACHE_MAX_MB * 1024 * 1024,
+    name="conversation_memories"
+)
+
+_mongo_manager = None
+
+def _get_mongo_manager():
+    """MongoManager compartido por todas las memorias (usa el cliente con pool del proceso)"""
+    global _mongo_manager
+    if _mongo_manager is None:
+        _mongo_manager = MongoManager()
+    return _mongo_manager
 
 def get_conversation_memory(thread_id: str):
     """Obtiene o crea una instancia de ConversationMemory para un thread_id específico"""
-    global _conversation_memories
-    
     # Si ya existe una instancia para este thread_id, la devolvemos
-    if thread_id in _conversation_memories:
-        return _conversation_memories[thread_id]
+    memory = _conversation_memories.get(thread_id)
+    if memory is not None:
+        return memory
     
-    # Si no existe, creamos una nueva instancia
-    from ..database.mongo_manager import MongoManager
-    mongo_manager = MongoManager()
-    memory = ConversationMemory(thread_id, mongo_manager)
-    _conversation_memories[thread_id] = memory
+    # Si no existe (o fue expulsada), la creamos/rehidratamos desde MongoDB
+    memory = ConversationMemory(thread_id, _get_mongo_manager())
+    _conversation_memories.set(thread_id, memory)
     
     return memory
 
+def get_conversation_memory_cache_stats():
+    """Devuelve los contadores de la caché de memorias de conversación"""
+    return _conversation_memories.stats()
+
 class ConversationMemory:
-    """Clase para mantener el estado de la conversación y guardar mensajes en MongoDB"""
+    """
+    Clase para mantener el estado de la conversación y guardar mensajes en MongoDB.
+
+    Con un AsyncMongoManager, ConversationMemory.acreate() y aadd_message() cargan y
+    guardan sin bloquear el event loop; sin él recurren a hilos del pool.
+    """
     
-    def __init__(self, thread_id, mongo_manager):
+    def __init__(self, thread_id, mongo_manager, async_mongo_manager=None, preload=True):
         self.thread_id = thread_id
         self.db = mongo_manager
+        self.async_db = async_mongo_manager
+        self.messages = []
         
         # Cargar mensajes anteriores desde MongoDB si existen
+        if preload:
+            try:
+                # Cursor con proyección: solo role y content, sin materializar los documentos completos
+                self.messages = [
+                    {"role": msg["role"], "content": msg["content"]}
+                    for msg in self.db.iter_conversation_history(thread_id)
+                ]
+                self._log_loaded()
+            except Exception as e:
+                logging.error(f"Error cargando mensajes anteriores: {str(e)}")
+                self.messages = []
+
+    @classmethod
+    async def acreate(cls, thread_id, mongo_manager, async_mongo_manager=None):
+        """Crea la memoria cargando el historial sin bloquear el event loop"""
+        if async_mongo_manager is None:
+            return await asyncio.to_thread(cls, thread_id, mongo_manager)
+        memory = cls(thread_id, mongo_manager, async_mongo_manager, preload=False)
         try:
-            previous_messages = self.db.get_conversation_history(thread_id)
-            self.messages = []
-            for msg in previous_messages:
-                self.messages.append({"role": msg["role"], "content": msg["content"]})
-            if self.messages:
-                logging.info(f"Cargados {len(self.messages)} mensajes anteriores de la conversación {thread_id}.")
+            memory.messages = [
+                {"role": msg["role"], "content": msg["content"]}
+                async for msg in async_mongo_manager.iter_conversation_history(thread_id)
+            ]
+            memory._log_loaded()
         except Exception as e:
             logging.error(f"Error cargando mensajes anteriores: {str(e)}")
-            self.messages = []
+            memory.messages = []
+        return memory
+
+    def _log_loaded(self):
+        if self.messages:
+            logging.info(f"Cargados {len(self.messages)} mensajes anteriores de la conversación {self.thread_id}.")
+
+    @staticmethod
+    def _user_name_for(role):
+        return "Geraldine" if role == "assistant" else "Usuario"
         
     def add_message(self, role, content):
         """Añade un mensaje a la memoria de conversación y lo guarda en MongoDB"""
         self.messages.append({"role": role, "content": content})
         try:
-            self.db.save_message(self.thread_id, "Geraldine" if role == "assistant" else "Usuario", role, content)
+            self.db.save_message(self.thread_id, self._user_name_for(role), role, content)
+        except Exception as e:
+            logging.error(f"Error saving message to MongoDB: {str(e)}")
+
+    async def aadd_message(self, role, content):
+        """Versión asíncrona de add_message"""
+        if self.async_db is None:
+            await asyncio.to_thread(self.add_message, role, content)
+            return
+        self.messages.append({"role": role, "content": content})
+        try:
+            await self.async_db.save_message(self.thread_id, self._user_name_for(role), role, content)
         except Exception as e:
             logging.error(f"Error saving message to MongoDB: {str(e)}")
     
@@ -0,0 +1,177 @@
+# src/memory/session_cache.py
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+# Sobrecarga aproximada por mensaje (objeto, dict, metadatos) además del texto
+_PER_MESSAGE_OVERHEAD_BYTES = 256
+
+
+def estimate_conversation_size(entry: Any) -> int:
+    """
+    Estima en bytes el tamaño de una conversación cacheada.
+
+    Acepta un dict {"state": ..., "memory": ...} como los que guarda la API,
+    una ConversationMemory o cualquier objeto con atributo/clave 'messages'.
+    Es una estimación barata (longitud del texto + sobrecarga fija por mensaje),
+    suficiente para aplicar un presupuesto de memoria.
+    """
+    def _messages_size(messages) -> int:
+        total = 0
+        for msg in messages or []:
+            content = msg.get("content", "") if isinstance(msg, dict) else getattr(msg, "content", "")
+            total += len(content if isinstance(content, str) else str(content)) + _PER_MESSAGE_OVERHEAD_BYTES
+        return total
+
+    if isinstance(entry, dict):
+        size = 0
+        state = entry.get("state")
+        if isinstance(state, dict):
+            size += _messages_size(state.get("messages"))
+        memory = entry.get("memory")
+        if memory is not None:
+            size += _messages_size(getattr(memory, "messages", None))
+        if "messages" in entry:
+            size += _messages_size(entry.get("messages"))
+        return size
+
+    return _messages_size(getattr(entry, "messages", None))
+
+
+class SessionCache:
+    """
+    Caché de sesiones en memoria con expulsión LRU, TTL por inactividad y presupuesto de memoria.
+
+    Las entradas expulsadas no se pierden: la fuente de verdad es MongoDB y el
+    llamador las reconstruye desde allí en la siguiente petición (un miss).
+    Es segura para hilos.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        idle_ttl_seconds: Optional[float] = 1800,
+        max_bytes: Optional[int] = None,
+        size_fn: Callable[[Any], int] = estimate_conversation_size,
+        name: str = "sessions"
+    ):
+        self.max_entries = max_entries
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.max_bytes = max_bytes
+        self.size_fn = size_fn
+        self.name = name
+
+        self._entries: "OrderedDict[Hashable, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._total_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = {"lru": 0, "ttl": 0, "memory": 0}
+
+    # --- API tipo dict ---
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Devuelve la entrada y la marca como usada recientemente; cuenta hit/miss."""
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None and self._is_expired(item, time.monotonic()):
+                self._remove(key, reason="ttl")
+                item = None
+            if item is None:
+                self.misses += 1
+                return default
+            item["last_access"] = time.monotonic()
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return item["value"]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Inserta o actualiza una entrada y aplica los límites de la caché."""
+        size = self._safe_size(value)
+        with self._lock:
+            if key in self._entries:
+                self._total_bytes -= self._entries[key]["size"]
+            self._entries[key] = {"value": value, "size": size, "last_access": time.monotonic()}
+            self._entries.move_to_end(key)
+            self._total_bytes += size
+            self._enforce_limits(protect=key)
+
+    __setitem__ = set
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return default
+            self._remove(key, reason=None)
+            return item["value"]
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            item = self._entries.get(key)
+            return item is not None and not self._is_expired(item, time.monotonic())
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "approx_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "idle_ttl_seconds": self.idle_ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": dict(self.evictions)
+            }
+
+    # --- Internos ---
+
+    def _safe_size(self, value: Any) -> int:
+        try:
+            return int(self.size_fn(value))
+        except Exception as e:
+            logging.warning(f"[SessionCache:{self.name}] No se pudo estimar el tamaño de la entrada: {e}")
+            return 0
+
+    def _is_expired(self, item: Dict[str, Any], now: float) -> bool:
+        return bool(self.idle_ttl_seconds) and now - item["last_access"] > self.idle_ttl_seconds
+
+    def _remove(self, key: Hashable, reason: Optional[str]) -> None:
+        item = self._entries.pop(key)
+        self._total_bytes -= item["size"]
+        if reason:
+            self.evictions[reason] += 1
+            logging.debug(f"[SessionCache:{self.name}] Expulsada '{key}' ({reason})")
+
+    def _enforce_limits(self, protect: Hashable = None) -> None:
+        """Expulsa por TTL, luego por número de entradas y luego por presupuesto de memoria (LRU primero)."""
+        now = time.monotonic()
+        for key in [k for k, item in self._entries.items() if self._is_expired(item, now)]:
+            if key != protect:
+                self._remove(key, reason="ttl")
+
+        while self.max_entries and len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            if oldest == protect:
+                break
+            self._remove(oldest, reason="lru")
+
+        while self.max_bytes and self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            oldest = next(iter(self._entries))
+            if oldest == protect:
+                break
+            self._remove(oldest, reason="memory")
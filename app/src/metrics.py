@@ -0,0 +1,101 @@
+# src/metrics.py
+"""
+In-process latency metrics.
+
+LatencyHistogram counts observations into fixed millisecond buckets (cheap,
+constant memory) and estimates percentiles from them. Histograms are
+registered by name so /health can report all of them.
+"""
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# Límites superiores de los buckets, en milisegundos
+DEFAULT_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000)
+
+
+class LatencyHistogram:
+    """Thread-safe bucketed latency histogram."""
+
+    def __init__(self, name: str, buckets_ms=DEFAULT_BUCKETS_MS):
+        self.name = name
+        self.buckets_ms = tuple(sorted(buckets_ms))
+        self._counts = [0] * (len(self.buckets_ms) + 1)  # El último bucket es +inf
+        self._lock = threading.Lock()
+        self._count = 0
+        self._sum_ms = 0.0
+        self._min_ms: Optional[float] = None
+        self._max_ms: Optional[float] = None
+
+    def observe(self, milliseconds: float) -> None:
+        index = len(self.buckets_ms)
+        for i, bound in enumerate(self.buckets_ms):
+            if milliseconds <= bound:
+                index = i
+                break
+        with self._lock:
+            self._counts[index] += 1
+            self._count += 1
+            self._sum_ms += milliseconds
+            self._min_ms = milliseconds if self._min_ms is None else min(self._min_ms, milliseconds)
+            self._max_ms = milliseconds if self._max_ms is None else max(self._max_ms, milliseconds)
+
+    @contextmanager
+    def time(self):
+        """Context manager that observes the duration of its block (also when it raises)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe((time.perf_counter() - start) * 1000)
+
+    def _percentile(self, counts: List[int], total: int, fraction: float, max_ms: float) -> float:
+        """Upper bound of the bucket holding the given fraction of observations."""
+        target = fraction * total
+        running = 0
+        for i, count in enumerate(counts):
+            running += count
+            if running >= target:
+                return self.buckets_ms[i] if i < len(self.buckets_ms) else max_ms
+        return max_ms
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            counts = list(self._counts)
+            total, sum_ms = self._count, self._sum_ms
+            min_ms, max_ms = self._min_ms, self._max_ms
+        if not total:
+            return {"count": 0}
+        return {
+            "count": total,
+            "mean_ms": round(sum_ms / total, 2),
+            "min_ms": round(min_ms, 2),
+            "max_ms": round(max_ms, 2),
+            "p50_ms": self._percentile(counts, total, 0.50, max_ms),
+            "p95_ms": self._percentile(counts, total, 0.95, max_ms),
+            "p99_ms": self._percentile(counts, total, 0.99, max_ms),
+            "buckets": {
+                (f"le_{bound}" if i < len(self.buckets_ms) else "inf"): count
+                for i, (bound, count) in enumerate(zip(self.buckets_ms + (None,), counts))
+                if count
+            }
+        }
+
+
+_histograms: Dict[str, LatencyHistogram] = {}
+_histograms_lock = threading.Lock()
+
+
+def get_histogram(name: str, buckets_ms=DEFAULT_BUCKETS_MS) -> LatencyHistogram:
+    """Returns the histogram registered under `name`, creating it on first use."""
+    histogram = _histograms.get(name)
+    if histogram is None:
+        with _histograms_lock:
+            histogram = _histograms.setdefault(name, LatencyHistogram(name, buckets_ms))
+    return histogram
+
+
+def histograms_snapshot() -> Dict[str, Dict]:
+    """Snapshot of every registered histogram, keyed by name."""
+    return {name: histogram.snapshot() for name, histogram in list(_histograms.items())}
@@ -0,0 +1,235 @@
+"""
+Content-addressed two-tier cache for expensive derived content.
+
+TieredCache maps a hex key (normally a SHA-256 of the input plus everything
+that changes the output) to bytes. Lookups go to an in-memory LRU first
+(SessionCache with a byte budget) and then to a directory on disk. Disk hits
+are promoted to memory. The disk tier has its own size budget: when it is
+exceeded, the least recently used files (by mtime, refreshed on every hit)
+are deleted. Files are written atomically, so several workers can share the
+same directory.
+
+The extraction cache (get_extraction_cache) stores the text extracted from
+PDFs, so a document uploaded or linked again is served without re-running
+the extraction and OCR. The TTS cache (get_tts_cache) stores synthesized MP3
+audio, so phrases the assistant repeats are not sent to Text-to-Speech again.
+"""
+import os
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import Any, Dict, Iterable, Optional, Union
+
+from ..memory.session_cache import SessionCache
+
+# Tamaño de lectura al calcular el hash de un archivo
+_HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def content_hash(source: Union[bytes, str]) -> str:
+    """SHA-256 of the bytes, or of the file contents when `source` is a path."""
+    digest = hashlib.sha256()
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        digest.update(source)
+    else:
+        with open(source, "rb") as f:
+            for chunk in iter(lambda: f.read(_HASH_CHUNK_BYTES), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_cache_key(source_hash: str, *parts: Any) -> str:
+    """Cache key combining a content hash with the parameters that affect the result."""
+    digest = hashlib.sha256(source_hash.encode("ascii"))
+    for part in parts:
+        digest.update(b"\x00" + json.dumps(part, sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class TieredCache:
+    """Memory LRU + on-disk cache of bytes values under hex keys. Thread-safe."""
+
+    def __init__(self, name: str, memory_max_bytes: int, disk_dir: Optional[str] = None,
+                 disk_max_bytes: int = 0):
+        self.name = name
+        self.memory = SessionCache(max_entries=0, idle_ttl_seconds=None, max_bytes=memory_max_bytes,
+                                   size_fn=len, name=name)
+        self.disk_dir = disk_dir if disk_dir and disk_max_bytes > 0 else None
+        self.disk_max_bytes = disk_max_bytes
+        self._lock = threading.Lock()
+        self._disk_bytes: Optional[int] = None  # Se calcula al primer uso recorriendo el directorio
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "sets": 0,
+                         "disk_evictions": 0, "disk_errors": 0}
+
+    # --- API ---
+
+    def get(self, key: str) -> Optional[bytes]:
+        value = self.memory.get(key)
+        if value is not None:
+            self._count("memory_hits")
+            return value
+
+        value = self._disk_read(key)
+        if value is None:
+            self._count("misses")
+            return None
+        self._count("disk_hits")
+        self.memory.set(key, value)
+        return value
+
+    def set(self, key: str, value: bytes) -> None:
+        self._count("sets")
+        self.memory.set(key, value)
+        self._disk_write(key, value)
+
+    def get_json(self, key: str) -> Any:
+        value = self.get(key)
+        return json.loads(value) if value is not None else None
+
+    def set_json(self, key: str, value: Any) -> None:
+        self.set(key, json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.counters)
+        lookups = counters["memory_hits"] + counters["disk_hits"] + counters["misses"]
+        counters["hit_rate"] = round((lookups - counters["misses"]) / lookups, 4) if lookups else None
+        counters["memory"] = self.memory.stats()
+        counters["disk_dir"] = self.disk_dir
+        counters["disk_bytes"] = self._disk_bytes
+        counters["disk_max_bytes"] = self.disk_max_bytes if self.disk_dir else 0
+        return counters
+
+    # --- Disco ---
+
+    def _count(self, name: str, value: int = 1):
+        with self._lock:
+            self.counters[name] += value
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], key)
+
+    def _disk_read(self, key: str) -> Optional[bytes]:
+        if not self.disk_dir:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = f.read()
+            os.utime(path)  # Marca el archivo como usado recientemente para la expulsión
+            return value
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            self._count("disk_errors")
+            logging.warning(f"[TieredCache:{self.name}] No se pudo leer {path}: {e}")
+            return None
+
+    def _disk_write(self, key: str, value: bytes) -> None:
+        if not self.disk_dir or len(value) > self.disk_max_bytes:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(value)
+                os.replace(tmp_path, path)  # Atómico: otros procesos nunca ven un archivo a medias
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            self._count("disk_errors")
+            logging.warning(f"[TieredCache:{self.name}] No se pudo escribir {path}: {e}")
+            return
+
+        with self._lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes += len(value)
+            over_budget = self._disk_bytes is None or self._disk_bytes > self.disk_max_bytes
+        if over_budget:
+            self._enforce_disk_budget()
+
+    def _iter_disk_files(self) -> Iterable[os.DirEntry]:
+        for shard in os.scandir(self.disk_dir):
+            if shard.is_dir():
+                for entry in os.scandir(shard.path):
+                    if entry.is_file() and not entry.name.endswith(".tmp"):
+                        yield entry
+
+    def _enforce_disk_budget(self) -> None:
+        """Rescans the directory and deletes the least recently used files down to 90% of the budget."""
+        try:
+            files = [(entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in self._iter_disk_files()]
+        except OSError as e:
+            logging.warning(f"[TieredCache:{self.name}] No se pudo recorrer {self.disk_dir}: {e}")
+            return
+        total = sum(size for _, size, _ in files)
+        evicted = 0
+        if total > self.disk_max_bytes:
+            target = self.disk_max_bytes * 0.9
+            for _, size, path in sorted(files):
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                    evicted += 1
+                except FileNotFoundError:
+                    total -= size  # Otro proceso ya lo expulsó
+                except OSError:
+                    pass
+        with self._lock:
+            self._disk_bytes = total
+            self.counters["disk_evictions"] += evicted
+
+
+# --- Caché de extracción de PDFs ---
+
+_extraction_cache: Optional[TieredCache] = None
+_extraction_cache_lock = threading.Lock()
+
+
+def get_extraction_cache() -> TieredCache:
+    """Process-wide cache of extracted document text, configured from settings."""
+    global _extraction_cache
+    if _extraction_cache is None:
+        with _extraction_cache_lock:
+            if _extraction_cache is None:
+                from config.settings import (
+                    EXTRACTION_CACHE_MEMORY_MB,
+                    EXTRACTION_CACHE_DIR,
+                    EXTRACTION_CACHE_DISK_MB
+                )
+                _extraction_cache = TieredCache(
+                    "extraction",
+                    memory_max_bytes=EXTRACTION_CACHE_MEMORY_MB * 1024 * 1024,
+                    disk_dir=EXTRACTION_CACHE_DIR,
+                    disk_max_bytes=EXTRACTION_CACHE_DISK_MB * 1024 * 1024
+                )
+    return _extraction_cache
+
+
+# --- Caché de audio TTS ---
+
+_tts_cache: Optional[TieredCache] = None
+_tts_cache_lock = threading.Lock()
+
+
+def get_tts_cache() -> TieredCache:
+    """Process-wide cache of synthesized speech, configured from settings."""
+    global _tts_cache
+    if _tts_cache is None:
+        with _tts_cache_lock:
+            if _tts_cache is None:
+                from config.settings import TTS_CACHE_MEMORY_MB, TTS_CACHE_DIR, TTS_CACHE_DISK_MB
+                _tts_cache = TieredCache(
+                    "tts",
+                    memory_max_bytes=TTS_CACHE_MEMORY_MB * 1024 * 1024,
+                    disk_dir=TTS_CACHE_DIR,
+                    disk_max_bytes=TTS_CACHE_DISK_MB * 1024 * 1024
+                )
+    return _tts_cache
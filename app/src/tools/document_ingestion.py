@@ -0,0 +1,458 @@
+"""
+Document ingestion: text extraction of uploaded files and a background job queue.
+
+ingest_document() extracts the text of one PDF or image and stores it in the
+MongoDB 'documents' collection, keyed by (thread_id, SHA-256 of the content).
+A document already extracted for the thread is reused as is, and PDF pages go
+through the shared extraction cache, so the same file uploaded again is never
+re-extracted.
+
+DocumentJobQueue runs ingest_document() for many files on a local thread pool
+(the PDF engine already spreads pages over a process pool). submit() spools
+nothing in memory: it takes paths of uploaded files saved to disk, records one
+job per file in MongoDB and returns the job IDs immediately. Job state lives in
+memory for the process that runs it and in the documents collection, so any
+worker can report progress.
+
+Stored documents are attached to the conversation state on the thread's next
+chat turn (see api.attach_pending_documents) with no further extraction. Threads
+with documents waiting are flagged in process memory (mark_pending_documents),
+so turns of other threads skip the pending-documents query.
+"""
+import os
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from app.config.settings import (
+    PDF_EXTRACTION_MAX_WORKERS,
+    PDF_PAGE_TIMEOUT_SECONDS,
+    PDF_PARALLEL_MIN_PAGES
+)
+from ..metrics import get_histogram
+from .content_cache import content_hash, make_cache_key, get_extraction_cache
+from .pdf_extraction import (
+    EXTRACTOR_VERSION,
+    DEFAULT_OCR_LANG,
+    DEFAULT_BACKENDS,
+    extract_pdf_pages,
+    summarize_timings
+)
+
+PDF_EXTENSIONS = {"pdf"}
+IMAGE_EXTENSIONS = {"png", "jpg", "jpeg"}
+ALLOWED_EXTENSIONS = PDF_EXTENSIONS | IMAGE_EXTENSIONS
+
+# Estados de un trabajo (y del documento en MongoDB)
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_ERROR = "error"
+FINISHED_STATES = (JOB_DONE, JOB_ERROR)
+
+
+class DocumentError(Exception):
+    """The uploaded file cannot be ingested (unsupported type, empty name)."""
+
+
+class DocumentQueueFull(Exception):
+    """The job queue has no room for the submitted files."""
+
+
+def file_extension(filename: str) -> str:
+    """Lower-case extension of `filename`; raises DocumentError when it is not allowed."""
+    if not filename:
+        raise DocumentError("Nombre de archivo vacío")
+    extension = filename.rsplit(".", 1)[1].lower() if "." in filename else ""
+    if extension not in ALLOWED_EXTENSIONS:
+        raise DocumentError(f"Tipo de archivo no permitido: '{filename}'")
+    return extension
+
+
+# --- Documentos pendientes de adjuntar ---
+
+_pending_threads = set()
+_pending_threads_lock = threading.Lock()
+
+
+def mark_pending_documents(thread_id: str) -> None:
+    """Flags the thread as having stored documents not yet attached to its conversation."""
+    with _pending_threads_lock:
+        _pending_threads.add(thread_id)
+
+
+def claim_pending_documents(thread_id: str) -> bool:
+    """Clears the thread's flag; True when it was set (the caller should look the documents up)."""
+    with _pending_threads_lock:
+        if thread_id not in _pending_threads:
+            return False
+        _pending_threads.discard(thread_id)
+        return True
+
+
+def has_pending_documents(thread_id: str) -> bool:
+    return thread_id in _pending_threads
+
+
+# --- Extracción ---
+
+def _extract_pdf(path: str, source_hash: str) -> Dict:
+    # Misma clave que process_pdf con todas las páginas: ambas rutas comparten la caché
+    cache = get_extraction_cache()
+    cache_key = make_cache_key(source_hash, "process_pdf", EXTRACTOR_VERSION,
+                               None, DEFAULT_OCR_LANG, DEFAULT_BACKENDS)
+    pages = cache.get_json(cache_key)
+    if pages is None:
+        pages = extract_pdf_pages(
+            path,
+            max_workers=PDF_EXTRACTION_MAX_WORKERS,
+            page_timeout=PDF_PAGE_TIMEOUT_SECONDS,
+            ocr_lang=DEFAULT_OCR_LANG,
+            parallel_min_pages=PDF_PARALLEL_MIN_PAGES,
+            backends=DEFAULT_BACKENDS
+        )
+        logging.info(f"[documents] Tiempo por backend: {summarize_timings(pages)}")
+        if all(page["method"] not in ("timeout", "error") for page in pages):
+            cache.set_json(cache_key, pages)
+    text = "\n\n".join(page["text"] for page in pages if page["text"])
+    return {
+        "kind": "pdf",
+        "text": text or "[El documento PDF fue procesado, pero no se encontró contenido textual extraíble.]",
+        "pages": len(pages),
+        "failed_pages": [page["page"] for page in pages if page["method"] in ("timeout", "error")]
+    }
+
+
+_vision_client = None
+
+
+def _vision_text(path: str, filename: str) -> Optional[str]:
+    """Text and labels from Google Vision, or None when the client library is not installed."""
+    global _vision_client
+    try:
+        from google.cloud import vision
+    except ImportError:
+        return None
+    if _vision_client is None:
+        _vision_client = vision.ImageAnnotatorClient()
+    with open(path, "rb") as f:
+        image = vision.Image(content=f.read())
+    texts = _vision_client.text_detection(image=image).text_annotations
+    labels = [label.description for label in _vision_client.label_detection(image=image).label_annotations]
+
+    text = f"[Imagen analizada: {filename}]\n"
+    if texts:
+        text += f"\nTexto detectado en la imagen:\n{texts[0].description}\n"
+    if labels:
+        text += "\nElementos detectados en la imagen:\n- " + "\n- ".join(labels[:10])
+    return text
+
+
+def _tesseract_text(path: str, filename: str) -> str:
+    from PIL import Image
+    from . import ocr
+
+    with Image.open(path) as image:
+        dpi = int((image.info.get("dpi") or (ocr.OCR_DEFAULT_DPI,))[0]) or ocr.OCR_DEFAULT_DPI
+        text, _ = ocr.recognize(image.convert("L"), DEFAULT_OCR_LANG, dpi, timeout=PDF_PAGE_TIMEOUT_SECONDS)
+    if not text:
+        return f"[Imagen recibida: {filename}. No se detectó texto en la imagen.]"
+    return f"[Imagen analizada: {filename}]\n\nTexto detectado en la imagen:\n{text}"
+
+
+def _extract_image(path: str, filename: str) -> Dict:
+    # Google Vision (texto + etiquetas) si está disponible; si no, Tesseract local
+    text = _vision_text(path, filename)
+    if text is None:
+        text = _tesseract_text(path, filename)
+    return {"kind": "image", "text": text, "pages": 1, "failed_pages": []}
+
+
+def extract_document(path: str, filename: str, source_hash: Optional[str] = None) -> Dict:
+    """Extracts the text of a PDF or image file. Returns {kind, text, pages, failed_pages}."""
+    extension = file_extension(filename)
+    with get_histogram(f"documents.extract.{extension}").time():
+        if extension in PDF_EXTENSIONS:
+            return _extract_pdf(path, source_hash or content_hash(path))
+        return _extract_image(path, filename)
+
+
+def ingest_document(mongo_manager, thread_id: str, filename: str, path: str,
+                    source_hash: Optional[str] = None) -> Dict:
+    """
+    Stores the extracted text of the file at `path` for the thread and returns the
+    document ({sha256, filename, kind, text, pages, status, reused, ...}). A document
+    with the same content already extracted for the thread is returned without
+    re-extracting it. Extraction errors are stored and returned with status 'error'.
+    """
+    source_hash = source_hash or content_hash(path)
+    existing = mongo_manager.find_document(thread_id, source_hash)
+    if existing and existing.get("status") == JOB_DONE:
+        logging.info(f"[documents] '{filename}' ya estaba extraído en {thread_id}; se reutiliza")
+        mongo_manager.save_document(thread_id, source_hash, {"filename": filename, "attached_at": None})
+        mark_pending_documents(thread_id)
+        return dict(existing, filename=filename, reused=True)
+
+    started = time.perf_counter()
+    try:
+        result = extract_document(path, filename, source_hash)
+        document = dict(result, status=JOB_DONE, error=None)
+    except Exception as e:
+        logging.exception(f"[documents] Error al extraer '{filename}': {e}")
+        document = {"status": JOB_ERROR, "error": str(e), "text": None}
+    document.update(filename=filename, chars=len(document.get("text") or ""),
+                    seconds=round(time.perf_counter() - started, 3), attached_at=None)
+    mongo_manager.save_document(thread_id, source_hash, document)
+    if document["status"] == JOB_DONE:
+        mark_pending_documents(thread_id)
+    logging.info(f"[documents] '{filename}' ({source_hash[:12]}) -> {document['status']} en "
+                 f"{document['seconds']:.2f}s, {document['chars']} caracteres")
+    return dict(document, sha256=source_hash, thread_id=thread_id, reused=False)
+
+
+# --- Cola de trabajos ---
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logging.warning(f"[documents] No se pudo eliminar el archivo temporal {path}: {e}")
+
+
+def job_view(job: Dict, include_text: bool = False) -> Dict:
+    """Public representation of a job (the extracted text only when requested)."""
+    view = {key: job.get(key) for key in ("job_id", "batch_id", "thread_id", "filename", "sha256", "status",
+                                          "kind", "pages", "chars", "failed_pages", "seconds", "reused", "error")}
+    if include_text:
+        view["text"] = job.get("text")
+    return view
+
+
+def batch_progress(jobs: List[Dict]) -> Dict:
+    """Counters of a batch: {total, queued, running, done, error, finished}."""
+    progress = {"total": len(jobs), JOB_QUEUED: 0, JOB_RUNNING: 0, JOB_DONE: 0, JOB_ERROR: 0}
+    for job in jobs:
+        progress[job.get("status", JOB_QUEUED)] = progress.get(job.get("status", JOB_QUEUED), 0) + 1
+    progress["finished"] = progress[JOB_DONE] + progress[JOB_ERROR] == progress["total"]
+    return progress
+
+
+class DocumentJobQueue:
+    """
+    Local queue of document extraction jobs (one job per file) served by a thread pool.
+    The executor is created lazily and rebuilt after a fork, like the other per-process pools.
+    """
+
+    def __init__(self, mongo_manager, max_workers: int = 2, max_pending: int = 200, retain_jobs: int = 1000):
+        self.mongo_manager = mongo_manager
+        self.max_workers = max(1, max_workers)
+        self.max_pending = max_pending
+        self.retain_jobs = retain_jobs
+        self._jobs: "OrderedDict[str, Dict]" = OrderedDict()
+        self._batches: Dict[str, List[str]] = {}
+        self._paths: Dict[str, str] = {}  # job_id -> archivo temporal aún no procesado
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_pid: Optional[int] = None
+        self.counters = {"submitted": 0, "done": 0, "error": 0, "reused": 0, "rejected": 0}
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="documents")
+            self._executor_pid = os.getpid()
+        return self._executor
+
+    def submit(self, thread_id: str, files: List[Tuple[str, str]]) -> Dict:
+        """
+        Enqueues (filename, path) pairs for the thread; the queue takes ownership of the
+        files and deletes them once processed. Returns {batch_id, jobs: [job views]}.
+        Raises DocumentQueueFull when the queue cannot take all the files; on any other
+        error the files are deleted and their queue slots released before re-raising.
+        """
+        with self._lock:
+            if self._pending + len(files) > self.max_pending:
+                self.counters["rejected"] += len(files)
+                raise DocumentQueueFull(f"La cola de documentos está llena ({self._pending} archivos pendientes)")
+            self._pending += len(files)
+
+        batch_id = uuid.uuid4().hex
+        jobs, by_hash, queued = [], {}, []
+        now = time.time()
+        handled = 0  # Archivos cuyo temporal ya es de un trabajo o ya se eliminó
+        try:
+            for filename, path in files:
+                source_hash = content_hash(path)
+                duplicate = by_hash.get(source_hash)
+                if duplicate is not None:
+                    # El mismo contenido dos veces en el lote: un solo trabajo
+                    self._finish_without_running(path)
+                    jobs.append(duplicate)
+                    handled += 1
+                    continue
+                job = {"job_id": uuid.uuid4().hex, "batch_id": batch_id, "thread_id": thread_id,
+                       "filename": filename, "sha256": source_hash, "status": JOB_QUEUED, "created": now}
+
+                existing = self.mongo_manager.find_document(thread_id, source_hash)
+                if existing and existing.get("status") == JOB_DONE:
+                    # Ya extraído para este hilo: el trabajo termina sin pasar por la cola
+                    self.mongo_manager.save_document(thread_id, source_hash,
+                                                     {"filename": filename, "attached_at": None},
+                                                     job_id=job["job_id"], batch_id=batch_id)
+                    job.update({key: existing.get(key) for key in ("kind", "pages", "chars", "failed_pages",
+                                                                   "seconds")},
+                               status=JOB_DONE, reused=True, text=existing.get("text"))
+                    self._finish_without_running(path)
+                    mark_pending_documents(thread_id)
+                    with self._lock:
+                        self.counters["reused"] += 1
+                else:
+                    self.mongo_manager.save_document(thread_id, source_hash,
+                                                     {"filename": filename, "status": JOB_QUEUED},
+                                                     job_id=job["job_id"], batch_id=batch_id)
+                    queued.append(job)
+                    with self._lock:
+                        self._paths[job["job_id"]] = path
+                by_hash[source_hash] = job
+                jobs.append(job)
+                handled += 1
+                with self._lock:
+                    self._jobs[job["job_id"]] = job
+                    self.counters["submitted"] += 1
+            executor = self._get_executor()
+        except Exception:
+            # Ningún trabajo llegó al pool: se liberan los huecos de la cola y los temporales
+            # de los trabajos creados y de los archivos sin procesar, y el lote no se registra
+            for job in queued:
+                with self._lock:
+                    path = self._paths.pop(job["job_id"], None)
+                    self._jobs.pop(job["job_id"], None)
+                job.update(status=JOB_ERROR, error="submit_failed")
+                if path is not None:
+                    self._finish_without_running(path)
+            for _, path in files[handled:]:
+                self._finish_without_running(path)
+            raise
+
+        with self._lock:
+            self._batches[batch_id] = list(job["job_id"] for job in by_hash.values())
+        for job in queued:
+            executor.submit(self._run, job)
+        logging.info(f"[documents] Lote {batch_id} para {thread_id}: {len(queued)} archivos en cola, "
+                     f"{len(by_hash) - len(queued)} ya extraídos")
+        return {"batch_id": batch_id, "jobs": [dict(job_view(job), filename=filename)
+                                               for job, (filename, _) in zip(jobs, files)]}
+
+    def _finish_without_running(self, path: str) -> None:
+        _remove_file(path)
+        with self._lock:
+            self._pending -= 1
+
+    def _run(self, job: Dict) -> None:
+        with self._lock:
+            path = self._paths.pop(job["job_id"], None)
+        if path is None:
+            return  # Cancelado al cerrar la cola
+        job.update(status=JOB_RUNNING, started=time.time())
+        try:
+            self.mongo_manager.save_document(job["thread_id"], job["sha256"], {"status": JOB_RUNNING})
+            document = ingest_document(self.mongo_manager, job["thread_id"], job["filename"], path, job["sha256"])
+            job.update({key: document.get(key) for key in ("status", "kind", "text", "pages", "chars",
+                                                            "failed_pages", "seconds", "reused", "error")})
+        except Exception as e:
+            logging.exception(f"[documents] Error en el trabajo {job['job_id']}: {e}")
+            job.update(status=JOB_ERROR, error=str(e))
+        finally:
+            _remove_file(path)
+            with self._lock:
+                self._pending -= 1
+                self.counters[job["status"] if job["status"] in FINISHED_STATES else JOB_ERROR] += 1
+                self._trim()
+
+    def _trim(self) -> None:
+        # Conserva solo los últimos `retain_jobs` trabajos terminados (MongoDB sigue teniendo el resultado)
+        excess = len(self._jobs) - self.retain_jobs
+        for job_id in list(self._jobs):
+            if excess <= 0:
+                break
+            if self._jobs[job_id]["status"] in FINISHED_STATES:
+                job = self._jobs.pop(job_id)
+                batch = self._batches.get(job["batch_id"])
+                if batch is not None and all(j not in self._jobs for j in batch):
+                    del self._batches[job["batch_id"]]
+                excess -= 1
+
+    def get_job(self, job_id: str, include_text: bool = False) -> Optional[Dict]:
+        """Job view from this process or, when another worker ran it, from MongoDB."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            job = dict(job) if job else None
+        if job is None:
+            document = self.mongo_manager.find_document_by_job(job_id, include_text=include_text)
+            if document is None:
+                return None
+            job = dict(document, job_id=job_id)
+        return job_view(job, include_text)
+
+    def get_batch(self, batch_id: str, include_text: bool = False) -> Optional[Dict]:
+        """{batch_id, progress, jobs} for a batch, from memory or MongoDB."""
+        with self._lock:
+            job_ids = list(self._batches.get(batch_id) or [])
+            jobs = [dict(self._jobs[job_id]) for job_id in job_ids if job_id in self._jobs]
+        if not jobs or len(jobs) < len(job_ids):
+            documents = self.mongo_manager.find_documents_by_batch(batch_id, include_text=include_text)
+            if not documents:
+                return None
+            jobs = [dict(document, batch_id=batch_id) for document in documents]
+        views = [job_view(job, include_text) for job in jobs]
+        return {"batch_id": batch_id, "progress": batch_progress(views), "jobs": views}
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self.counters, pending=self._pending, retained=len(self._jobs), workers=self.max_workers)
+
+    def shutdown(self) -> None:
+        """Cancels the queued jobs (marked as errors in MongoDB) and waits for the running ones."""
+        with self._lock:
+            cancelled = [(self._jobs.get(job_id), path) for job_id, path in self._paths.items()]
+            self._paths.clear()
+        for job, path in cancelled:
+            _remove_file(path)
+            if job is not None:
+                job.update(status=JOB_ERROR, error="Trabajo interrumpido al detener el servidor")
+                try:
+                    self.mongo_manager.save_document(job["thread_id"], job["sha256"],
+                                                     {"status": JOB_ERROR, "error": job["error"]})
+                except Exception as e:
+                    logging.error(f"[documents] No se pudo marcar el trabajo {job['job_id']}: {e}")
+        if self._executor is not None and self._executor_pid == os.getpid():
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+_job_queue: Optional[DocumentJobQueue] = None
+_job_queue_lock = threading.Lock()
+
+
+def get_document_job_queue(mongo_manager=None) -> Optional[DocumentJobQueue]:
+    """Process-wide job queue, configured from settings (created on the first call with a mongo_manager)."""
+    global _job_queue
+    if _job_queue is None and mongo_manager is not None:
+        with _job_queue_lock:
+            if _job_queue is None:
+                from app.config.settings import DOCUMENT_JOB_WORKERS, DOCUMENT_JOB_QUEUE_MAX, DOCUMENT_JOB_RETAIN
+                _job_queue = DocumentJobQueue(mongo_manager, max_workers=DOCUMENT_JOB_WORKERS,
+                                              max_pending=DOCUMENT_JOB_QUEUE_MAX, retain_jobs=DOCUMENT_JOB_RETAIN)
+    return _job_queue
+
+
+def shutdown_document_job_queue() -> None:
+    """Stops the process-wide queue if it was created; call on worker shutdown before closing MongoDB."""
+    if _job_queue is not None:
+        _job_queue.shutdown()
@@ -0,0 +1,199 @@
+"""
+Streaming, memory-bounded downloads of Google Drive files.
+
+acquire_drive_file() downloads a public Drive file to a unique temporary file
+in fixed-size chunks, so memory use does not depend on the file size, and
+aborts as soon as the file exceeds the configured maximum. Requests go
+through one pooled requests.Session per process with connect/read timeouts
+and retries with backoff.
+
+Concurrent requests for the same file_id share a single transfer: the first
+caller downloads, the others wait for it and receive the same path. The file
+is deleted when the last caller calls release_drive_file().
+"""
+import os
+import time
+import logging
+import tempfile
+import threading
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DRIVE_DOWNLOAD_URL = "https://drive.google.com/uc"
+_CHUNK_BYTES = 64 * 1024
+
+
+class DriveDownloadError(Exception):
+    """The Drive file could not be downloaded (HTTP error, too large, not downloadable)."""
+
+
+def parse_drive_file_id(url: str) -> str:
+    """Extracts the file id from a /file/d/<id>/ or ?id=<id> Drive link."""
+    if '/file/d/' in url:
+        return url.split('/file/d/')[1].split('/')[0].split('?')[0]
+    if 'id=' in url:
+        return url.split('id=')[1].split('&')[0]
+    raise ValueError("Formato de enlace de Drive no reconocido")
+
+
+# --- Sesión HTTP por proceso ---
+
+_session: Optional[requests.Session] = None
+_session_pid: Optional[int] = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Pooled Session for this process (rebuilt after a fork) that retries connection errors and 429/5xx."""
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        with _session_lock:
+            if _session is None or _session_pid != os.getpid():
+                from config.settings import DRIVE_DOWNLOAD_RETRIES
+                retry = Retry(
+                    total=DRIVE_DOWNLOAD_RETRIES,
+                    backoff_factor=0.5,
+                    status_forcelist=(429, 500, 502, 503, 504),
+                    allowed_methods=frozenset(["GET"]),
+                    respect_retry_after_header=True
+                )
+                session = requests.Session()
+                session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry))
+                _session, _session_pid = session, os.getpid()
+    return _session
+
+
+def _confirm_token(response: requests.Response) -> Optional[str]:
+    # Drive pide confirmación (aviso de antivirus) para archivos grandes
+    for name, value in response.cookies.items():
+        if name.startswith("download_warning"):
+            return value
+    return None
+
+
+def _stream_to_file(response: requests.Response, target, max_bytes: int) -> int:
+    declared = int(response.headers.get("Content-Length") or 0)
+    if declared > max_bytes:
+        raise DriveDownloadError(f"El archivo ocupa {declared} bytes (máximo {max_bytes})")
+    written = 0
+    for chunk in response.iter_content(chunk_size=_CHUNK_BYTES):
+        written += len(chunk)
+        if written > max_bytes:
+            raise DriveDownloadError(f"El archivo supera el máximo de {max_bytes} bytes")
+        target.write(chunk)
+    return written
+
+
+def download_drive_file(file_id: str, suffix: str = ".pdf") -> str:
+    """
+    Downloads the file to a new NamedTemporaryFile and returns its path (the caller deletes it).
+    Raises DriveDownloadError.
+    """
+    from config.settings import (
+        DRIVE_DOWNLOAD_MAX_MB,
+        DRIVE_DOWNLOAD_CONNECT_TIMEOUT_SECONDS,
+        DRIVE_DOWNLOAD_READ_TIMEOUT_SECONDS,
+        DRIVE_DOWNLOAD_RETRIES
+    )
+    max_bytes = DRIVE_DOWNLOAD_MAX_MB * 1024 * 1024
+    timeout = (DRIVE_DOWNLOAD_CONNECT_TIMEOUT_SECONDS, DRIVE_DOWNLOAD_READ_TIMEOUT_SECONDS)
+    params = {"export": "download", "id": file_id}
+    session = get_session()
+    started = time.perf_counter()
+
+    for attempt in range(DRIVE_DOWNLOAD_RETRIES + 1):
+        target = tempfile.NamedTemporaryFile(prefix="drive_", suffix=suffix, delete=False)
+        try:
+            with target:
+                response = session.get(DRIVE_DOWNLOAD_URL, params=params, stream=True, timeout=timeout)
+                token = _confirm_token(response)
+                if token:
+                    response.close()
+                    response = session.get(DRIVE_DOWNLOAD_URL, params=dict(params, confirm=token),
+                                           stream=True, timeout=timeout)
+                with response:
+                    if response.status_code != 200:
+                        raise DriveDownloadError(f"Error al descargar el archivo: {response.status_code}")
+                    if response.headers.get("Content-Type", "").startswith("text/html"):
+                        raise DriveDownloadError("Drive devolvió una página HTML: el archivo no es público "
+                                                 "o no se puede descargar directamente")
+                    size = _stream_to_file(response, target, max_bytes)
+            logging.info(f"[drive] {file_id} descargado ({size} bytes) en "
+                         f"{time.perf_counter() - started:.2f}s -> {target.name}")
+            return target.name
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+            # Cortes a mitad de la transferencia: el adaptador solo reintenta el establecimiento
+            os.unlink(target.name)
+            if attempt == DRIVE_DOWNLOAD_RETRIES:
+                raise DriveDownloadError(f"No se pudo descargar el archivo de Drive: {str(e)}")
+            wait = 0.5 * 2 ** attempt
+            logging.warning(f"[drive] Descarga de {file_id} interrumpida ({str(e)}); reintento en {wait:.1f}s")
+            time.sleep(wait)
+        except BaseException:
+            os.unlink(target.name)
+            raise
+
+
+# --- Descargas compartidas por file_id ---
+
+class _Transfer:
+    def __init__(self):
+        self.done = threading.Event()
+        self.path: Optional[str] = None
+        self.error: Optional[BaseException] = None
+        self.users = 1
+
+
+_inflight: Dict[str, _Transfer] = {}
+_inflight_lock = threading.Lock()
+
+
+def acquire_drive_file(file_id: str, suffix: str = ".pdf") -> str:
+    """
+    Returns the path of a local copy of the Drive file, downloading it unless a
+    transfer for the same file_id is in flight or still in use. Every successful
+    call must be paired with release_drive_file(file_id).
+    """
+    with _inflight_lock:
+        transfer = _inflight.get(file_id)
+        owner = transfer is None
+        if owner:
+            transfer = _inflight[file_id] = _Transfer()
+        else:
+            transfer.users += 1
+
+    if owner:
+        try:
+            transfer.path = download_drive_file(file_id, suffix)
+        except BaseException as e:
+            transfer.error = e
+            with _inflight_lock:
+                _inflight.pop(file_id, None)  # La siguiente llamada vuelve a intentarlo
+        finally:
+            transfer.done.set()
+    else:
+        logging.info(f"[drive] Reutilizando la descarga en curso de {file_id}")
+        transfer.done.wait()
+
+    if transfer.error is not None:
+        raise transfer.error
+    return transfer.path
+
+
+def release_drive_file(file_id: str) -> None:
+    """Releases a path obtained with acquire_drive_file; the last user deletes the file."""
+    with _inflight_lock:
+        transfer = _inflight.get(file_id)
+        if transfer is None:
+            return
+        transfer.users -= 1
+        if transfer.users > 0:
+            return
+        del _inflight[file_id]
+    try:
+        os.remove(transfer.path)
+    except OSError as e:
+        logging.warning(f"[drive] No se pudo eliminar el archivo temporal {transfer.path}: {str(e)}")
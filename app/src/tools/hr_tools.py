@@ -1,15 +1,11 @@
 # src/tools/hr_tools.py
 import os
 import sys
-import pypdf
-import pdfplumber
-import requests
 import logging
 from pathlib import Path
 from typing import Annotated, Dict, Any, List, Optional, Union
 from langchain_core.tools import InjectedToolCallId, tool
 from io import BytesIO
-import tempfile
 
 # Función para obtener la ruta base del proyecto
 def get_project_root():
@@ -26,10 +22,25 @@ if str(APP_ROOT) not in sys.path:
     print(f"Añadiendo {APP_ROOT} a sys.path")
 
 # Importa la lista de países desde la configuración
-from config.settings import PERMITTED_COUNTRIES
+from config.settings import (
+    PERMITTED_COUNTRIES,
+    PDF_EXTRACTION_MAX_WORKERS,
+    PDF_PAGE_TIMEOUT_SECONDS,
+    PDF_PARALLEL_MIN_PAGES
+)
 
 # Importamos la herramienta RAG
 from .rag_utils import analyze_cv_with_rag
+from .pdf_extraction import (
+    EXTRACTOR_VERSION,
+    DEFAULT_OCR_LANG,
+    DEFAULT_BACKENDS,
+    count_pdf_pages,
+    extract_pdf_pages,
+    summarize_timings
+)
+from .content_cache import content_hash, make_cache_key, get_extraction_cache
+from .drive_downloader import parse_drive_file_id, acquire_drive_file, release_drive_file
 
 from utils.config import Config
 
@@ -96,51 +107,25 @@ def process_pdf(pdf_input: Union[str, BytesIO], page_numbers: Optional[List[int]
     logging.info(f"[process_pdf] Iniciando procesamiento de PDF")
     
     pdf_path = None # Inicializar pdf_path a None por defecto
+    drive_file_id = None
     try:
         # Manejar diferentes tipos de entrada
         if isinstance(pdf_input, BytesIO):
             logging.info("[process_pdf] Procesando PDF desde BytesIO")
-            pdf_stream = pdf_input
-            reader = pypdf.PdfReader(pdf_stream)
-            # No se crea archivo temporal en este caso
-            pdf_plumber_input = pdf_stream # Usar el mismo stream para pdfplumber
+            # No se crea archivo temporal en este caso: los workers reciben los bytes
+            pdf_source = pdf_input.getvalue()
 
         elif isinstance(pdf_input, str):
             pdf_path = pdf_input # Asignar pdf_path aquí si es string
             # Verificar si es un enlace de Google Drive
             if "drive.google.com" in pdf_path:
                 logging.info("[process_pdf] Detectado enlace de Google Drive")
-                # Convertir el enlace de Drive a un enlace directo de descarga
-                if '/file/d/' in pdf_path:
-                    file_id = pdf_path.split('/file/d/')[1].split('/')[0]
-                elif 'id=' in pdf_path:
-                    file_id = pdf_path.split('id=')[1].split('&')[0]
-                else:
-                    raise ValueError("Formato de enlace de Drive no reconocido")
-                
-                # Crear enlace directo de descarga
-                download_url = f"https://drive.google.com/uc?export=download&id={file_id}"
-                
-                # Descargar el archivo
-                response = requests.get(download_url)
-                if response.status_code != 200:
-                    raise Exception(f"Error al descargar el archivo: {response.status_code}")
-                
-                # Guardar temporalmente
-                temp_dir = tempfile.gettempdir()
-                temp_path = os.path.join(temp_dir, f"drive_pdf_{file_id}.pdf")
-                
-                with open(temp_path, 'wb') as f:
-                    f.write(response.content)
-                
-                pdf_path = temp_path # Asignar el path del archivo temporal
-                logging.info(f"[process_pdf] Archivo de Drive descargado exitosamente a: {temp_path}")
-                reader = pypdf.PdfReader(pdf_path)
-                pdf_plumber_input = pdf_path # Usar el path para pdfplumber
-            else:
-                 # Si es una ruta local
-                 reader = pypdf.PdfReader(pdf_path)
-                 pdf_plumber_input = pdf_path # Usar el path para pdfplumber
+                # Descarga en streaming a un temporal único; las peticiones simultáneas del mismo archivo la comparten
+                file_id = parse_drive_file_id(pdf_path)
+                pdf_path = acquire_drive_file(file_id)
+                drive_file_id = file_id
+                logging.info(f"[process_pdf] Archivo de Drive descargado exitosamente a: {pdf_path}")
+            pdf_source = pdf_path
         else:
             raise ValueError("El input debe ser una ruta de archivo (str) o un BytesIO")
 
@@ -153,95 +138,54 @@ def process_pdf(pdf_input: Union[str, BytesIO], page_numbers: Optional[List[int]
             raise ValueError(f"El archivo '{pdf_path}' no parece ser un archivo PDF.")
 
         try:
-            logging.info(f"[process_pdf] Abriendo PDF con pypdf")
-            text_parts = []
-            
-            # Función para extraer texto con OCR si es necesario
-            def extract_text_with_ocr(page, page_num):
-                try:
-                    # Primero intentar con pypdf
-                    text = page.extract_text()
-                    if text and len(text.strip()) > 0:
-                        return text.strip()
-                    
-                    # Si no hay texto, intentar con pdfplumber
-                    # Asegurarse de que el stream esté al inicio si se usa BytesIO
-                    if isinstance(pdf_plumber_input, BytesIO):
-                        pdf_plumber_input.seek(0)
-
-                    with pdfplumber.open(pdf_plumber_input) as pdf:
-                        plumber_page = pdf.pages[page_num - 1]
-                        text = plumber_page.extract_text()
-                        if text and len(text.strip()) > 0:
-                            return text.strip()
-                    
-                    # Si aún no hay texto, intentar OCR
-                    try:
-                        import pytesseract
-                        from PIL import Image
-                        import io
-                        
-                        # Convertir página a imagen
-                        # Asegurarse de que el stream esté al inicio si se usa BytesIO
-                        if isinstance(pdf_plumber_input, BytesIO):
-                            pdf_plumber_input.seek(0)
-                            
-                        with pdfplumber.open(pdf_plumber_input) as pdf:
-                            plumber_page = pdf.pages[page_num - 1]
-                            img = plumber_page.to_image()
-                            img_bytes = io.BytesIO()
-                            img.save(img_bytes, format='PNG')
-                            img_bytes.seek(0)
-                            
-                            # Realizar OCR
-                            image = Image.open(img_bytes)
-                            text = pytesseract.image_to_string(image, lang='spa+eng')
-                            if text and len(text.strip()) > 0:
-                                return text.strip()
-                    except ImportError:
-                        logging.warning("[process_pdf] pytesseract no está instalado. OCR no disponible.")
-                    except Exception as e:
-                        logging.warning(f"[process_pdf] Error durante OCR: {str(e)}")
-                    
-                    return None
-                except Exception as e:
-                    logging.error(f"[process_pdf] Error al extraer texto de la página {page_num}: {str(e)}")
-                    return None
-            
+            total_pages = count_pdf_pages(pdf_source)
             if page_numbers:
                 logging.info(f"[process_pdf] Procesando páginas específicas: {page_numbers}")
                 # Validar números de página
                 for page_num in page_numbers:
-                    if not (1 <= page_num <= len(reader.pages)):
-                        error_msg = f"Error: El número de página {page_num} está fuera del rango (el PDF tiene {len(reader.pages)} páginas)."
+                    if not (1 <= page_num <= total_pages):
+                        error_msg = f"Error: El número de página {page_num} está fuera del rango (el PDF tiene {total_pages} páginas)."
                         logging.error(f"[process_pdf] {error_msg}")
                         return error_msg
-                
-                # Extraer de páginas específicas
-                for page_num in sorted(list(set(page_numbers))):
-                    logging.info(f"[process_pdf] Extrayendo texto de la página {page_num}")
-                    page = reader.pages[page_num - 1]
-                    extracted = extract_text_with_ocr(page, page_num)
-                    
-                    if extracted:
-                        text_parts.append(f"--- Contenido de la Página {page_num} ---\n{extracted}")
-                        logging.info(f"[process_pdf] Texto extraído exitosamente de la página {page_num}")
-                    else:
-                        text_parts.append(f"--- Página {page_num} no contiene texto extraíble ---")
-                        logging.warning(f"[process_pdf] No se pudo extraer texto de la página {page_num}")
             else:
-                logging.info(f"[process_pdf] Procesando todas las páginas del PDF")
-                # Extraer de todas las páginas
-                for i, page in enumerate(reader.pages):
-                    logging.info(f"[process_pdf] Extrayendo texto de la página {i+1}")
-                    extracted = extract_text_with_ocr(page, i+1)
-                    
-                    if extracted:
-                        text_parts.append(f"--- Contenido de la Página {i+1} ---\n{extracted}")
-                        logging.info(f"[process_pdf] Texto extraído exitosamente de la página {i+1}")
-                    else:
-                        text_parts.append(f"--- Página {i+1} no contiene texto extraíble ---")
-                        logging.warning(f"[process_pdf] No se pudo extraer texto de la página {i+1}")
+                logging.info(f"[process_pdf] Procesando todas las páginas del PDF ({total_pages})")
+
+            # Un documento ya procesado (mismo contenido y páginas) se sirve desde la caché
+            cache = get_extraction_cache()
+            selected_pages = sorted(set(page_numbers)) if page_numbers else None
+            cache_key = make_cache_key(content_hash(pdf_source), "process_pdf", EXTRACTOR_VERSION,
+                                       selected_pages, DEFAULT_OCR_LANG, DEFAULT_BACKENDS)
+            pages = cache.get_json(cache_key)
+            if pages is not None:
+                logging.info(f"[process_pdf] Texto recuperado de la caché de extracción ({len(pages)} páginas)")
+            else:
+                # Páginas repartidas entre procesos; cada worker abre el documento una sola vez
+                pages = extract_pdf_pages(
+                    pdf_source,
+                    page_numbers=selected_pages,
+                    max_workers=PDF_EXTRACTION_MAX_WORKERS,
+                    page_timeout=PDF_PAGE_TIMEOUT_SECONDS,
+                    ocr_lang=DEFAULT_OCR_LANG,
+                    parallel_min_pages=PDF_PARALLEL_MIN_PAGES,
+                    backends=DEFAULT_BACKENDS
+                )
+                logging.info(f"[process_pdf] Tiempo por backend: {summarize_timings(pages)}")
+                # Los fallos transitorios (timeout, error) no se cachean para reintentarlos
+                if all(page["method"] not in ("timeout", "error") for page in pages):
+                    cache.set_json(cache_key, pages)
+
+            text_parts = []
+            for page in pages:
+                page_num = page["page"]
+                if page["text"]:
+                    text_parts.append(f"--- Contenido de la Página {page_num} ---\n{page['text']}")
+                    logging.info(f"[process_pdf] Texto extraído de la página {page_num} ({page['method']}, {page['seconds']:.2f}s)")
+                elif page["method"] == "timeout":
+                    text_parts.append(f"--- Página {page_num}: tiempo de extracción agotado ---")
+                    logging.warning(f"[process_pdf] Tiempo agotado al extraer la página {page_num}")
+                else:
+                    text_parts.append(f"--- Página {page_num} no contiene texto extraíble ---")
+                    logging.warning(f"[process_pdf] No se pudo extraer texto de la página {page_num}")
             
             if not text_parts:
                 logging.warning("[process_pdf] No se pudo extraer texto del PDF.")
@@ -250,14 +194,6 @@ def process_pdf(pdf_input: Union[str, BytesIO], page_numbers: Optional[List[int]
             final_text = "\n\n".join(text_parts)
             logging.info(f"[process_pdf] Procesamiento completado exitosamente. Longitud del texto extraído: {len(final_text)} caracteres")
 
-            # Limpiar archivos temporales (solo si se crearon)
-            try:
-                if pdf_path and (isinstance(pdf_input, str) and "drive.google.com" in pdf_input):
-                    os.remove(pdf_path)
-                    logging.info(f"[process_pdf] Archivo temporal eliminado: {pdf_path}")
-            except Exception as e:
-                logging.warning(f"[process_pdf] No se pudo eliminar el archivo temporal: {str(e)}")
-            
             return final_text
 
         except FileNotFoundError as e:
@@ -276,6 +212,10 @@ def process_pdf(pdf_input: Union[str, BytesIO], page_numbers: Optional[List[int]
     except Exception as e:
         logging.error(f"[process_pdf] Error inesperado al procesar el PDF: {str(e)}")
         return f"Error al procesar el PDF: {str(e)}"
+    finally:
+        # El temporal de Drive se elimina cuando lo suelta la última petición que lo usa
+        if drive_file_id:
+            release_drive_file(drive_file_id)
 
 from .tools_pago import (
     generate_payment_link,
@@ -0,0 +1,167 @@
+"""
+Adaptive OCR stage of the PDF extraction engine (see pdf_extraction.OcrBackend).
+
+For each page that reaches OCR:
+
+1. Triage: the page's images (pdfplumber layout objects, including inline
+   images) are measured. OCR is skipped when images cover only a small part of
+   a page that has fonts (logos, a CV photo), when the page is blank, and when
+   the text layer is already dense and images cover less than half the page.
+2. DPI: chosen per page from the native resolution of its largest image,
+   clamped to [OCR_MIN_DPI, OCR_MAX_DPI] and capped so the long edge of the
+   render stays under OCR_MAX_LONG_EDGE_PX. Rendering a 100 dpi fax at 300 dpi
+   only makes Tesseract slower.
+3. Recognition: the page is rendered once to a grayscale PIL image and its raw
+   pixel buffer is handed to Tesseract, without a PNG encode/decode. With
+   tesserocr the Tesseract API handle stays loaded in the process
+   (one per thread and language) and is reused across pages; otherwise the PIL
+   image goes straight to pytesseract.
+"""
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+# Umbrales de triage
+OCR_MIN_IMAGE_AREA_RATIO = 0.10   # Por debajo, las imágenes son decorativas si la página tiene fuentes
+OCR_DENSE_IMAGE_AREA_RATIO = 0.50  # Con capa de texto densa, solo se hace OCR si las imágenes cubren más
+OCR_DENSE_TEXT_CHARS_PER_SQIN = 5.0  # ~480 caracteres en una página A4
+
+# Resolución de renderizado
+OCR_DEFAULT_DPI = 200
+OCR_MIN_DPI = 150
+OCR_MAX_DPI = 300
+OCR_MAX_LONG_EDGE_PX = 4000
+
+_POINTS_PER_INCH = 72.0
+
+
+class OcrTimeoutError(Exception):
+    """Tesseract did not finish within the page time budget."""
+
+
+def image_area_ratio(plumber_page) -> Tuple[float, Optional[dict]]:
+    """(share of the page covered by images, largest image) from pdfplumber's layout objects."""
+    page_area = float(plumber_page.width * plumber_page.height) or 1.0
+    covered, largest, largest_area = 0.0, None, 0.0
+    for image in plumber_page.images:
+        # Se recorta cada imagen a la página; los solapes pueden sobrestimar (se limita a 1)
+        width = max(0.0, min(image["x1"], plumber_page.width) - max(image["x0"], 0))
+        height = max(0.0, min(image["bottom"], plumber_page.height) - max(image["top"], 0))
+        area = width * height
+        covered += area
+        if area > largest_area:
+            largest, largest_area = image, area
+    return min(covered / page_area, 1.0), largest
+
+
+def choose_dpi(plumber_page, largest_image: Optional[dict]) -> int:
+    """Render resolution matching the page's largest image, within the configured bounds."""
+    dpi = OCR_DEFAULT_DPI
+    if largest_image and largest_image.get("srcsize") and largest_image.get("width"):
+        pixels_wide = largest_image["srcsize"][0]
+        inches_wide = largest_image["width"] / _POINTS_PER_INCH
+        if pixels_wide and inches_wide > 0:
+            dpi = int(round(pixels_wide / inches_wide))
+    dpi = max(OCR_MIN_DPI, min(OCR_MAX_DPI, dpi))
+    long_edge_in = max(plumber_page.width, plumber_page.height) / _POINTS_PER_INCH
+    if long_edge_in > 0:
+        dpi = min(dpi, int(OCR_MAX_LONG_EDGE_PX / long_edge_in))
+    return max(dpi, 72)
+
+
+def triage(plumber_page, has_fonts: bool, text_layer: str) -> Dict:
+    """
+    Decides whether the page is worth OCR and at which DPI. Returns
+    {run, reason, image_ratio, dpi}.
+    """
+    ratio, largest = image_area_ratio(plumber_page)
+    decision = {"run": True, "reason": "images", "image_ratio": round(ratio, 3), "dpi": None}
+    area_sqin = (plumber_page.width * plumber_page.height) / _POINTS_PER_INCH ** 2 or 1.0
+    density = len(text_layer) / area_sqin
+
+    if ratio == 0.0:
+        # Sin imágenes: con fuentes no hay nada que reconocer; sin fuentes la página está en blanco
+        decision.update(run=False, reason="no_images")
+    elif has_fonts and ratio < OCR_MIN_IMAGE_AREA_RATIO:
+        decision.update(run=False, reason="small_images")
+    elif density >= OCR_DENSE_TEXT_CHARS_PER_SQIN and ratio < OCR_DENSE_IMAGE_AREA_RATIO:
+        decision.update(run=False, reason="dense_text_layer")
+    else:
+        decision["dpi"] = choose_dpi(plumber_page, largest)
+    return decision
+
+
+def render_page(plumber_page, dpi: int):
+    """Grayscale PIL image of the page at `dpi` (Tesseract binarizes anyway; 1/3 of the RGB bytes)."""
+    return plumber_page.to_image(resolution=dpi).original.convert("L")
+
+
+# --- Tesseract ---
+
+_local = threading.local()
+_tesserocr_unavailable = False
+
+
+def _tesserocr_api(lang: str):
+    """Warm tesserocr handle for this thread and language, or None without tesserocr."""
+    global _tesserocr_unavailable
+    if _tesserocr_unavailable:
+        return None
+    handles = getattr(_local, "handles", None)
+    if handles is None:
+        handles = _local.handles = {}
+    api = handles.get(lang)
+    if api is None:
+        try:
+            import tesserocr
+            api = tesserocr.PyTessBaseAPI(lang=lang, psm=tesserocr.PSM.AUTO)
+        except ImportError:
+            _tesserocr_unavailable = True
+            return None
+        except RuntimeError as e:
+            # Faltan los datos entrenados del idioma: se usa pytesseract, que mostrará el mismo error
+            logging.warning(f"[ocr] tesserocr no pudo inicializar '{lang}': {str(e)}")
+            _tesserocr_unavailable = True
+            return None
+        handles[lang] = api
+    return api
+
+
+def engine_name() -> str:
+    """Name of the OCR engine used in this process: tesserocr, pytesseract or none."""
+    try:
+        import tesserocr  # noqa: F401
+        if not _tesserocr_unavailable:
+            return "tesserocr"
+    except ImportError:
+        pass
+    try:
+        import pytesseract  # noqa: F401
+        return "pytesseract"
+    except ImportError:
+        return "none"
+
+
+def recognize(image, lang: str, dpi: int, timeout: Optional[float] = None) -> Tuple[str, str]:
+    """Runs Tesseract on a PIL image; returns (text, engine). Raises OcrTimeoutError."""
+    api = _tesserocr_api(lang)
+    if api is not None:
+        # Buffer de píxeles crudo (8 bits por píxel), sin codificar a PNG
+        api.SetImageBytes(image.tobytes(), image.width, image.height, 1, image.width)
+        api.SetSourceResolution(dpi)
+        if not api.Recognize(timeout=int((timeout or 0) * 1000)):
+            api.Clear()
+            raise OcrTimeoutError("tesserocr timeout")
+        text = api.GetUTF8Text()
+        api.Clear()
+        return (text or "").strip(), "tesserocr"
+
+    import pytesseract
+    try:
+        text = pytesseract.image_to_string(image, lang=lang, config=f"--dpi {dpi}", timeout=timeout or 0)
+    except RuntimeError as e:
+        # pytesseract mata el proceso de Tesseract y lanza RuntimeError al agotar el timeout
+        if "timeout" in str(e).lower():
+            raise OcrTimeoutError(str(e))
+        raise
+    return (text or "").strip(), "pytesseract"
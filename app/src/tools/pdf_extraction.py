@@ -0,0 +1,536 @@
+"""
+PDF text extraction engine.
+
+Every PDF path of the app (process_pdf, PostGeneratorTool, document uploads)
+goes through this module. A page is extracted by a chain of backends, from
+cheapest to most expensive:
+
+    text    pypdf text layer
+    layout  pdfplumber (layout-aware word grouping; recovers some text that
+            pypdf garbles)
+    ocr     Tesseract on the rendered page, with its own triage (see ocr.py)
+
+A cheap per-page profile taken from the already-parsed page dictionary
+(fonts, image XObjects) decides which backends are worth running: a page
+without fonts has no text layer to read and goes straight to OCR, and a
+page with fonts but no images never reaches OCR. The chain stops at the
+first backend whose text looks usable (not mostly unmapped glyphs, and not
+a few stray characters on an image page). All backends share one parse of
+the document (OpenDocument), and each page result records the time spent in
+each backend.
+
+extract_pdf_pages() fans the pages of one document out across a
+ProcessPoolExecutor. Each worker opens the document once (pool initializer)
+and reuses it for every page it receives. Results are returned in page order
+regardless of completion order, and a page that exceeds its time budget is
+reported with method "timeout" instead of holding up the whole document.
+Small documents (fewer than `parallel_min_pages` pages) are extracted in the
+calling process, where starting a pool would cost more than it saves.
+Concurrent extractions (uploads, process_pdf, document jobs) share a
+process-wide budget of MAX_PROCESS_WORKERS worker processes: each pool is sized
+to the slots still free, waits when none are, and runs in the calling process
+when it only gets one.
+iter_pdf_pages() extracts lazily in the calling process, page by page.
+
+This module does not import the app configuration, so worker processes start
+quickly; callers pass the settings explicitly.
+"""
+import os
+import io
+import math
+import time
+import signal
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeoutError, as_completed
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+from ..metrics import get_histogram
+from . import ocr
+
+PdfSource = Union[str, bytes]
+
+DEFAULT_OCR_LANG = "spa+eng"
+DEFAULT_BACKENDS = ("text", "layout", "ocr")
+
+# Versión de la salida de extracción; se incrementa cuando cambia el texto producido (invalida la caché)
+EXTRACTOR_VERSION = "3"
+
+# Por debajo de este número de caracteres, en una página con imágenes se sigue probando la cadena
+# (p. ej. un escaneo con solo el pie de página como texto)
+MIN_TEXT_CHARS_WITH_IMAGES = 50
+# Proporción máxima de caracteres ilegibles (glifos sin mapear) para aceptar un texto
+MAX_GARBLED_RATIO = 0.3
+
+
+class PageTimeoutError(Exception):
+    """Raised inside a worker when a page exceeds its time budget."""
+
+
+class OpenDocument:
+    """A PDF opened once, with the pypdf reader and the pdfplumber document created on first use."""
+
+    def __init__(self, source: PdfSource):
+        self.source = source
+        self._reader = None
+        self._plumber = None
+
+    def _stream(self):
+        # Cada librería recibe su propio stream: ambas mueven la posición de lectura
+        return io.BytesIO(self.source) if isinstance(self.source, bytes) else self.source
+
+    @property
+    def reader(self):
+        if self._reader is None:
+            import pypdf
+            self._reader = pypdf.PdfReader(self._stream())
+        return self._reader
+
+    @property
+    def plumber(self):
+        if self._plumber is None:
+            import pdfplumber
+            self._plumber = pdfplumber.open(self._stream())
+        return self._plumber
+
+    @property
+    def page_count(self) -> int:
+        return len(self.reader.pages)
+
+    def close(self):
+        if self._plumber is not None:
+            self._plumber.close()
+        self._reader = self._plumber = None
+
+
+def count_pdf_pages(source: PdfSource) -> int:
+    """Number of pages of the document (parses only the cross-reference table)."""
+    return OpenDocument(source).page_count
+
+
+# --- Perfil barato de cada página ---
+
+def _resolve(value):
+    return value.get_object() if hasattr(value, "get_object") else value
+
+
+def inspect_page(document: OpenDocument, page_index: int) -> Dict:
+    """
+    {has_fonts, images} read from the page's resource dictionary, without
+    decoding its content stream. Unknown when the dictionary cannot be read.
+    """
+    try:
+        resources = _resolve(document.reader.pages[page_index].get("/Resources")) or {}
+        fonts = _resolve(resources.get("/Font")) or {}
+        xobjects = _resolve(resources.get("/XObject")) or {}
+        subtypes = [_resolve(ref).get("/Subtype") for ref in xobjects.values()]
+        # Un Form XObject puede llevar dentro sus propias fuentes e imágenes: se cuenta como ambas
+        forms = subtypes.count("/Form")
+        return {"has_fonts": len(fonts) > 0 or forms > 0, "images": subtypes.count("/Image") + forms}
+    except Exception:
+        return {"has_fonts": True, "images": 1}  # Sin perfil se recorre la cadena completa
+
+
+def garbled_ratio(text: str) -> float:
+    """Share of characters that come from unmapped glyphs ((cid:N), U+FFFD, control chars)."""
+    if not text:
+        return 0.0
+    garbled = text.count("\ufffd") + 6 * text.count("(cid:")
+    garbled += sum(1 for c in text if ord(c) < 32 and c not in "\n\r\t")
+    return min(garbled / len(text), 1.0)
+
+
+def is_usable(text: str, profile: Dict) -> bool:
+    if not text or garbled_ratio(text) > MAX_GARBLED_RATIO:
+        return False
+    # Página con imágenes y apenas texto: probablemente un escaneo; merece OCR
+    return not (profile["images"] and len(text) < MIN_TEXT_CHARS_WITH_IMAGES)
+
+
+# --- Backends ---
+#
+# Cada backend recibe el estado de la página: {"profile", "best_text", "details"}.
+# best_text es el mejor texto legible obtenido hasta ahora; details recoge
+# información del backend para el resultado (p. ej. la decisión de OCR).
+
+class TextLayerBackend:
+    """pypdf text layer: cheapest, only meaningful when the page has fonts."""
+
+    name = "text"
+
+    def applies(self, state: Dict) -> bool:
+        return state["profile"]["has_fonts"]
+
+    def extract(self, document: OpenDocument, page_index: int, options: Dict, state: Dict) -> str:
+        return (document.reader.pages[page_index].extract_text() or "").strip()
+
+
+class LayoutBackend:
+    """pdfplumber extraction: only tried when there are fonts but the text layer was unusable."""
+
+    name = "layout"
+
+    def applies(self, state: Dict) -> bool:
+        return state["profile"]["has_fonts"]
+
+    def extract(self, document: OpenDocument, page_index: int, options: Dict, state: Dict) -> str:
+        return (document.plumber.pages[page_index].extract_text() or "").strip()
+
+
+class OcrBackend:
+    """Adaptive Tesseract OCR (see ocr.py): triage, per-page DPI, raw pixel buffers, warm handle."""
+
+    name = "ocr"
+
+    def applies(self, state: Dict) -> bool:
+        # Sin fuentes tampoco hay capa de texto (las imágenes en línea no aparecen como XObject)
+        profile = state["profile"]
+        return profile["images"] > 0 or not profile["has_fonts"]
+
+    def extract(self, document: OpenDocument, page_index: int, options: Dict, state: Dict) -> str:
+        if ocr.engine_name() == "none":
+            logging.warning("[pdf_extraction] pytesseract no está instalado. OCR no disponible.")
+            return ""
+
+        plumber_page = document.plumber.pages[page_index]
+        decision = ocr.triage(plumber_page, state["profile"]["has_fonts"], state["best_text"])
+        state["details"]["ocr"] = decision
+        if not decision["run"]:
+            return ""
+        try:
+            text, engine = ocr.recognize(
+                ocr.render_page(plumber_page, decision["dpi"]),
+                lang=options.get("ocr_lang", DEFAULT_OCR_LANG),
+                dpi=decision["dpi"],
+                timeout=options.get("page_timeout")
+            )
+        except ocr.OcrTimeoutError as e:
+            raise PageTimeoutError(str(e))
+        decision["engine"] = engine
+        return text
+
+
+BACKENDS = {backend.name: backend for backend in (TextLayerBackend(), LayoutBackend(), OcrBackend())}
+
+
+def available_backends() -> List[str]:
+    """Backends whose libraries are installed."""
+    modules = {"text": ("pypdf",), "layout": ("pdfplumber",), "ocr": ("pdfplumber", "PIL")}
+    available = []
+    for name, required in modules.items():
+        try:
+            for module in required:
+                __import__(module)
+            if name != "ocr" or ocr.engine_name() != "none":
+                available.append(name)
+        except ImportError:
+            pass
+    return available
+
+
+def _page_result(page_number: int, text: str, method: str, started: float, timings: Dict[str, float],
+                 details: Optional[Dict] = None) -> Dict:
+    return {
+        "page": page_number,
+        "text": text,
+        "method": method,
+        "seconds": round(time.perf_counter() - started, 4),
+        "timings": {name: round(seconds, 4) for name, seconds in timings.items()},
+        "details": details or {}
+    }
+
+
+def extract_page(document: OpenDocument, page_number: int, options: Dict) -> Dict:
+    """
+    Extracts one page (1-based) with the backend chain in options["backends"].
+    Returns {page, text, method, seconds, timings, details}; never raises:
+    failures are reported with method "timeout" or "error".
+    """
+    started = time.perf_counter()
+    timings: Dict[str, float] = {}
+    state = {"profile": None, "best_text": "", "details": {}}
+    best_method = "empty"
+    try:
+        page_index = page_number - 1
+        state["profile"] = profile = inspect_page(document, page_index)
+        for name in options.get("backends", DEFAULT_BACKENDS):
+            backend = BACKENDS[name]
+            if not backend.applies(state):
+                continue
+            backend_started = time.perf_counter()
+            try:
+                text = backend.extract(document, page_index, options, state)
+            finally:
+                timings[name] = time.perf_counter() - backend_started
+            if is_usable(text, profile):
+                return _page_result(page_number, text, name, started, timings, state["details"])
+            # Se conserva el mejor intento legible por si ningún backend da un texto "usable"
+            if len(text) > len(state["best_text"]) and garbled_ratio(text) <= MAX_GARBLED_RATIO:
+                state["best_text"], best_method = text, name
+        return _page_result(page_number, state["best_text"], best_method, started, timings, state["details"])
+    except PageTimeoutError:
+        logging.warning(f"[pdf_extraction] Tiempo agotado en la página {page_number}")
+        return _page_result(page_number, state["best_text"], "timeout", started, timings, state["details"])
+    except Exception as e:
+        logging.error(f"[pdf_extraction] Error al extraer texto de la página {page_number}: {str(e)}")
+        return _page_result(page_number, state["best_text"], "error", started, timings, state["details"])
+
+
+def record_timings(pages: Iterable[Dict]) -> None:
+    """Feeds the per-backend page times into the pdf.<backend> latency histograms."""
+    for page in pages:
+        for name, seconds in page.get("timings", {}).items():
+            get_histogram(f"pdf.{name}").observe(seconds * 1000)
+
+
+def summarize_timings(pages: Iterable[Dict]) -> Dict[str, Dict]:
+    """
+    {backend: {pages, seconds, pages_per_second}} plus {method: pages} under
+    "methods" and {reason: pages} of pages the OCR triage skipped under "ocr_skipped".
+    """
+    summary: Dict[str, Dict] = {"methods": {}, "ocr_skipped": {}}
+    for page in pages:
+        summary["methods"][page["method"]] = summary["methods"].get(page["method"], 0) + 1
+        for name, seconds in page.get("timings", {}).items():
+            backend = summary.setdefault(name, {"pages": 0, "seconds": 0.0})
+            backend["pages"] += 1
+            backend["seconds"] = round(backend["seconds"] + seconds, 4)
+        decision = page.get("details", {}).get("ocr")
+        if decision and not decision["run"]:
+            summary["ocr_skipped"][decision["reason"]] = summary["ocr_skipped"].get(decision["reason"], 0) + 1
+    for name in BACKENDS:
+        if name in summary:
+            backend = summary[name]
+            backend["pages_per_second"] = round(backend["pages"] / backend["seconds"], 2) if backend["seconds"] else None
+    return summary
+
+
+def _build_options(backends: Sequence[str], page_timeout: Optional[float], ocr_lang: str) -> Dict:
+    unknown = [name for name in backends if name not in BACKENDS]
+    if unknown:
+        raise ValueError(f"Backends de extracción desconocidos: {unknown}")
+    return {"backends": tuple(backends), "page_timeout": page_timeout, "ocr_lang": ocr_lang}
+
+
+def iter_pdf_pages(source: Union[PdfSource, OpenDocument], page_numbers: Optional[Iterable[int]] = None,
+                   backends: Sequence[str] = DEFAULT_BACKENDS, page_timeout: Optional[float] = None,
+                   ocr_lang: str = DEFAULT_OCR_LANG) -> Iterator[Dict]:
+    """
+    Extracts pages lazily in the calling process, over a single parse of the
+    document: a page is only processed when the consumer asks for it. A
+    document opened by the iterator is closed when it finishes or is closed;
+    an OpenDocument passed in is left to the caller.
+    """
+    options = _build_options(backends, page_timeout, ocr_lang)
+    owned = not isinstance(source, OpenDocument)
+    document = OpenDocument(source) if owned else source
+    try:
+        for page_number in page_numbers or range(1, document.page_count + 1):
+            page = extract_page(document, page_number, options)
+            record_timings([page])
+            yield page
+    finally:
+        if owned:
+            document.close()
+
+
+def join_page_text(texts: Iterable[str], max_chars: Optional[int] = None, separator: str = "\n\n") -> Dict:
+    """
+    Joins page texts with a single str.join, consuming `texts` only until
+    `max_chars` characters have been collected (the last page is cut). Returns
+    {text, pages_read, truncated}.
+    """
+    parts: List[str] = []
+    collected = 0
+    pages_read = 0
+    truncated = False
+    for text in texts:
+        pages_read += 1
+        if max_chars is not None and collected + len(text) > max_chars:
+            parts.append(text[:max(max_chars - collected, 0)])
+            truncated = True
+            break
+        parts.append(text)
+        collected += len(text) + len(separator)
+    return {"text": separator.join(parts), "pages_read": pages_read, "truncated": truncated}
+
+
+# --- Estado de cada proceso del pool ---
+
+_worker_document: Optional[OpenDocument] = None
+
+
+def _raise_page_timeout(signum, frame):
+    raise PageTimeoutError("page time budget exceeded")
+
+
+def _init_worker(source: PdfSource):
+    """Pool initializer: opens the document once for all the pages of this worker."""
+    global _worker_document
+    _worker_document = OpenDocument(source)
+    if hasattr(signal, "setitimer"):
+        signal.signal(signal.SIGALRM, _raise_page_timeout)
+
+
+def _extract_page_in_worker(page_number: int, options: Dict) -> Dict:
+    # Las tareas corren en el hilo principal del worker, así que SIGALRM corta también pypdf/pdfplumber
+    timeout = options.get("page_timeout")
+    use_alarm = bool(timeout) and hasattr(signal, "setitimer")
+    if use_alarm:
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return extract_page(_worker_document, page_number, options)
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+# Tope de procesos worker de extracción vivos a la vez en este proceso, sumando todos los pools
+MAX_PROCESS_WORKERS = os.cpu_count() or 1
+
+
+class _WorkerBudget:
+    """Process-wide count of PDF worker processes in use by concurrent extractions."""
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self.in_use = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, wanted: int) -> int:
+        """Blocks until at least one slot is free; returns how many of `wanted` were granted."""
+        with self._condition:
+            while self.in_use >= self.limit:
+                self._condition.wait()
+            granted = min(wanted, self.limit - self.in_use)
+            self.in_use += granted
+            return granted
+
+    def release(self, slots: int) -> None:
+        with self._condition:
+            self.in_use -= slots
+            self._condition.notify_all()
+
+
+_budget: Optional[_WorkerBudget] = None
+_budget_pid: Optional[int] = None
+_budget_lock = threading.Lock()
+
+
+def _worker_budget() -> _WorkerBudget:
+    # Se recrea tras un fork: el contador del padre no describe los pools del hijo
+    global _budget, _budget_pid
+    with _budget_lock:
+        if _budget is None or _budget_pid != os.getpid():
+            _budget = _WorkerBudget(MAX_PROCESS_WORKERS)
+            _budget_pid = os.getpid()
+        return _budget
+
+
+def worker_budget_stats() -> Dict:
+    """{limit, in_use} of the process-wide worker budget."""
+    budget = _worker_budget()
+    return {"limit": budget.limit, "in_use": budget.in_use}
+
+
+def _pool_context():
+    # forkserver evita heredar hilos y sockets (Flask, MongoClient) del proceso que llama
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _terminate_pool(executor: ProcessPoolExecutor):
+    terminate = getattr(executor, "terminate_workers", None)  # Python >= 3.14
+    if terminate:
+        terminate()
+        return
+    # shutdown() suelta la referencia a los procesos, así que se toman antes
+    processes = list((getattr(executor, "_processes", None) or {}).values())
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.terminate()
+
+
+def _failed_page(page_number: int, method: str, seconds: float = 0.0) -> Dict:
+    return {"page": page_number, "text": "", "method": method, "seconds": seconds, "timings": {}, "details": {}}
+
+
+def _extract_in_process(source: PdfSource, pages: List[int], options: Dict) -> List[Dict]:
+    document = OpenDocument(source)
+    try:
+        results = [extract_page(document, page_number, options) for page_number in pages]
+    finally:
+        document.close()
+    record_timings(results)
+    return results
+
+
+def _extract_with_pool(source: PdfSource, pages: List[int], options: Dict, workers: int,
+                       page_timeout: Optional[float]) -> Dict[int, Dict]:
+    results_by_page: Dict[int, Dict] = {}
+    # Salvaguarda del proceso padre por si un worker no responde a SIGALRM (p. ej. en código C)
+    deadline = page_timeout * math.ceil(len(pages) / workers) + 30 if page_timeout else None
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context(),
+                                   initializer=_init_worker, initargs=(source,))
+    timed_out = False
+    try:
+        futures = {executor.submit(_extract_page_in_worker, page_number, options): page_number
+                   for page_number in pages}
+        try:
+            for future in as_completed(futures, timeout=deadline):
+                page_number = futures[future]
+                try:
+                    results_by_page[page_number] = future.result()
+                except Exception as e:
+                    logging.error(f"[pdf_extraction] Worker falló en la página {page_number}: {str(e)}")
+                    results_by_page[page_number] = _failed_page(page_number, "error")
+        except FuturesTimeoutError:
+            timed_out = True
+            logging.warning(f"[pdf_extraction] Plazo global agotado; "
+                            f"{len(pages) - len(results_by_page)} páginas sin terminar")
+    finally:
+        if timed_out:
+            _terminate_pool(executor)
+        else:
+            executor.shutdown(wait=True)
+    return results_by_page
+
+
+def extract_pdf_pages(source: PdfSource, page_numbers: Optional[Sequence[int]] = None,
+                      max_workers: Optional[int] = None, page_timeout: float = 60.0,
+                      ocr_lang: str = DEFAULT_OCR_LANG, parallel_min_pages: int = 4,
+                      backends: Sequence[str] = DEFAULT_BACKENDS) -> List[Dict]:
+    """
+    Extracts the given pages (1-based, all by default) and returns one
+    {page, text, method, seconds, timings} dict per page, in page order.
+
+    `source` is a file path or the PDF bytes. Pages are spread over up to
+    `max_workers` processes (CPU count by default), fewer when other extractions
+    hold part of the process-wide budget; each page gets `page_timeout` seconds.
+    Page numbers must be valid (see count_pdf_pages).
+    """
+    if page_numbers is None:
+        pages = list(range(1, count_pdf_pages(source) + 1))
+    else:
+        pages = sorted(set(page_numbers))
+    options = _build_options(backends, page_timeout, ocr_lang)
+    workers = min(max_workers or os.cpu_count() or 1, len(pages))
+
+    if workers <= 1 or len(pages) < parallel_min_pages:
+        return _extract_in_process(source, pages, options)
+
+    budget = _worker_budget()
+    workers = budget.acquire(workers)
+    try:
+        if workers <= 1:
+            # Presupuesto casi agotado: un solo worker no compensa arrancar un pool
+            return _extract_in_process(source, pages, options)
+        results_by_page = _extract_with_pool(source, pages, options, workers, page_timeout)
+    finally:
+        budget.release(workers)
+
+    results = [results_by_page.get(page_number) or _failed_page(page_number, "timeout", float(page_timeout or 0))
+               for page_number in pages]
+    record_timings(results)
+    return results
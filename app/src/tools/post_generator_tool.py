@@ -12,8 +12,7 @@ import requests
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple, Union
 from datetime import datetime
-import PyPDF2
-from io import BytesIO
+from pypdf.errors import PdfReadError
 import time
 import random
 import html
@@ -23,12 +22,17 @@ import google.generativeai as genai
 import google.api_core.exceptions
 from langchain_core.messages import ToolMessage
 
+from .content_cache import content_hash, make_cache_key, get_extraction_cache
+from .pdf_extraction import EXTRACTOR_VERSION, DEFAULT_BACKENDS, OpenDocument, iter_pdf_pages, join_page_text
+
 # Importar configuraciones
 from config.settings import (
     MARCELLA_GOOGLE_API_KEY, 
     LLM_MODEL_NAME,
     BLOG_API_URL,
-    BLOG_VERIFICATION_CODE
+    BLOG_VERIFICATION_CODE,
+    PDF_TEXT_MAX_CHARS,
+    PDF_PAGE_TIMEOUT_SECONDS
 )
 
 # Configurar Gemini
@@ -65,6 +69,42 @@ class PostGeneratorTool:
                 time.sleep(1)
         raise Exception("Max reintentos alcanzados para generar contenido.")
 
+    def _extract_pdf_text(self, source: Union[str, bytes], max_chars: Optional[int] = PDF_TEXT_MAX_CHARS) -> Dict:
+        """
+        Extrae el texto de un PDF (ruta o bytes) con el motor de extracción,
+        página a página, hasta reunir `max_chars` caracteres: las páginas
+        posteriores no se analizan. El resultado se guarda en la caché de
+        extracción por hash del contenido, así que un PDF repetido no se vuelve a procesar.
+
+        Returns:
+            Dict con text, pages (total), pages_read y truncated
+        """
+        cache = get_extraction_cache()
+        cache_key = make_cache_key(content_hash(source), "post_generator", EXTRACTOR_VERSION,
+                                   DEFAULT_BACKENDS, max_chars)
+        cached = cache.get_json(cache_key)
+        if cached is not None:
+            return cached
+
+        document = OpenDocument(source)
+        try:
+            pages = iter_pdf_pages(document, backends=DEFAULT_BACKENDS, page_timeout=PDF_PAGE_TIMEOUT_SECONDS)
+            result = join_page_text((page["text"] for page in pages), max_chars=max_chars)
+            result["pages"] = document.page_count
+        finally:
+            document.close()
+
+        cache.set_json(cache_key, result)
+        return result
+
+    @staticmethod
+    def _pdf_summary(extraction: Dict, pages_label: str, chars_label: str) -> str:
+        text_content = extraction["text"].strip()
+        pages = f"{extraction['pages']}"
+        if extraction["truncated"]:
+            pages = f"{extraction['pages_read']} de {extraction['pages']} (contenido truncado a {len(text_content)} caracteres)"
+        return f"{pages_label}: {pages}\n{chars_label}: {len(text_content)}\n\n--- CONTENIDO ---\n\n{text_content}"
+
     def read_pdf_content(
         self,
         pdf_path: str,
@@ -87,32 +127,22 @@ class PostGeneratorTool:
                     tool_call_id=tool_call_id or "read_pdf_content"
                 )
 
-            # Abrir y leer el PDF
-            with open(pdf_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                
-                # Extraer texto de todas las páginas
-                text_content = ""
-                total_pages = len(pdf_reader.pages)
-                
-                for page_num in range(total_pages):
-                    page = pdf_reader.pages[page_num]
-                    text_content += page.extract_text() + "\n\n"
-                
-                if not text_content.strip():
-                    return ToolMessage(
-                        content="Error: No se pudo extraer texto del PDF. Puede estar vacío o ser una imagen escaneada.",
-                        tool_call_id=tool_call_id or "read_pdf_content"
-                    )
-                
-                success_message = f"✅ PDF leído exitosamente\n\nPáginas procesadas: {total_pages}\nCaracteres extraídos: {len(text_content)}\n\n--- CONTENIDO ---\n\n{text_content.strip()}"
-                
+            extraction = self._extract_pdf_text(pdf_path)
+
+            if not extraction["text"].strip():
                 return ToolMessage(
-                    content=success_message,
+                    content="Error: No se pudo extraer texto del PDF. Puede estar vacío o ser una imagen escaneada.",
                     tool_call_id=tool_call_id or "read_pdf_content"
                 )
 
-        except PyPDF2.errors.PdfReadError:
+            success_message = "✅ PDF leído exitosamente\n\n" + self._pdf_summary(extraction, "Páginas procesadas", "Caracteres extraídos")
+
+            return ToolMessage(
+                content=success_message,
+                tool_call_id=tool_call_id or "read_pdf_content"
+            )
+
+        except PdfReadError:
             return ToolMessage(
                 content="Error: El archivo PDF está corrupto o no es válido.",
                 tool_call_id=tool_call_id or "read_pdf_content"
@@ -143,25 +173,15 @@ class PostGeneratorTool:
             if isinstance(pdf_bytes, str):
                 pdf_bytes = base64.b64decode(pdf_bytes)
 
-            # Crear un objeto BytesIO desde los bytes
-            pdf_file = BytesIO(pdf_bytes)
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            
-            # Extraer texto de todas las páginas
-            text_content = ""
-            total_pages = len(pdf_reader.pages)
-            
-            for page_num in range(total_pages):
-                page = pdf_reader.pages[page_num]
-                text_content += page.extract_text() + "\n\n"
-            
-            if not text_content.strip():
+            extraction = self._extract_pdf_text(bytes(pdf_bytes))
+
+            if not extraction["text"].strip():
                 return ToolMessage(
                     content="Error: No se pudo extraer texto del PDF. Puede estar vacío o ser una imagen escaneada.",
                     tool_call_id=tool_call_id or "read_pdf_from_bytes"
                 )
             
-            success_message = f"✅ PDF procesado exitosamente\n\nPáginas: {total_pages}\nCaracteres: {len(text_content)}\n\n--- CONTENIDO ---\n\n{text_content.strip()}"
+            success_message = "✅ PDF procesado exitosamente\n\n" + self._pdf_summary(extraction, "Páginas", "Caracteres")
             
             return ToolMessage(
                 content=success_message,
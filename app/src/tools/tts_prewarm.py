@@ -0,0 +1,161 @@
+"""
+Pre-warming of the TTS audio cache with the phrases the assistant repeats verbatim.
+
+known_phrases() collects the fixed answers of the API (document rejection,
+payment receipt, fallbacks) and the literal phrases quoted in SYSTEM_MESSAGE
+(greeting, the name/country prompt and its reminder, out-of-scope
+rejections). prewarm_tts_cache() synthesizes them per voice through
+VoiceTool.text_to_speech, split exactly as text_to_speech_chunks splits a
+reply, so the cache keys match the fragments requested at run time.
+Fragments already cached are not synthesized again.
+
+Run from the command line, the audio lands in the disk tier (TTS_CACHE_DIR)
+that every worker reads. With TTS_PREWARM_ON_START the API also warms its own
+memory tier in a background thread at startup.
+
+Uso desde la línea de comandos (con las credenciales de Google Cloud configuradas):
+    python -m app.src.tools.tts_prewarm                                  # voz por defecto
+    python -m app.src.tools.tts_prewarm --voice es-PE-Wavenet-A --voice es-ES-Standard-A
+    python -m app.src.tools.tts_prewarm --phrases-file frases.txt --dry-run
+"""
+import re
+import sys
+import time
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+from .voice_tool import voice_tool_instance, split_sentences, get_best_peruvian_female_voice
+from config.settings import (
+    SYSTEM_MESSAGE,
+    PAYMENT_RECEIVED_MESSAGE,
+    DOCUMENT_REJECTED_MESSAGE,
+    TTS_MAX_PARALLEL,
+    TTS_PREWARM_VOICES
+)
+
+# Respuestas literales de api.py / asgi.py cuando el grafo falla o no devuelve texto
+FALLBACK_PHRASES = [
+    "Lo siento, no pude generar una respuesta.",
+    "Bienvenido a la asistencia de Geraldine.",
+    "Lo siento, ha ocurrido un error al iniciar la conversación."
+]
+
+# Frase entre comillas del prompt (con o sin negritas); se excluyen las que llevan
+# variables (`nombre_usuario`), marcadores ([tema]) o etiquetas. Los ejemplos de mensajes
+# del usuario van en minúsculas, así que solo se toman frases que empiezan en mayúscula, ¿ o ¡
+_QUOTED_PHRASE = re.compile(r'"\**([^"`<>\[\]\n]{25,600}?)\**"')
+_SENTENCE_END = (".", "?", "!")
+
+
+def system_message_phrases(system_message: str = SYSTEM_MESSAGE) -> List[str]:
+    """Phrases quoted in the system prompt that the assistant is told to say verbatim."""
+    phrases = []
+    for match in _QUOTED_PHRASE.findall(system_message):
+        phrase = match.strip().strip("*").strip()
+        if (phrase[0].isupper() or phrase[0] in "¿¡") and phrase.endswith(_SENTENCE_END) \
+                and phrase not in phrases:
+            phrases.append(phrase)
+    return phrases
+
+
+def known_phrases() -> List[str]:
+    """Fixed API answers plus the verbatim phrases of SYSTEM_MESSAGE, without duplicates."""
+    phrases = []
+    for phrase in [DOCUMENT_REJECTED_MESSAGE, PAYMENT_RECEIVED_MESSAGE, *FALLBACK_PHRASES,
+                   *system_message_phrases()]:
+        if phrase not in phrases:
+            phrases.append(phrase)
+    return phrases
+
+
+def prewarm_fragments(phrases: Iterable[str]) -> List[str]:
+    """Fragments text_to_speech_chunks would synthesize for each phrase, without duplicates."""
+    fragments = []
+    for phrase in phrases:
+        for fragment in split_sentences(phrase):
+            if fragment not in fragments:
+                fragments.append(fragment)
+    return fragments
+
+
+def prewarm_tts_cache(voice_names: Optional[List[str]] = None, phrases: Optional[List[str]] = None,
+                      max_parallel: int = TTS_MAX_PARALLEL) -> Dict:
+    """
+    Synthesizes every fragment of `phrases` (default: known_phrases()) for each voice
+    (default: the default voice) into the TTS cache.
+    Returns {voices, fragments, already_cached, synthesized, errors, seconds}.
+    """
+    voice_names = voice_names or [get_best_peruvian_female_voice()]
+    fragments = prewarm_fragments(phrases if phrases is not None else known_phrases())
+    before = voice_tool_instance.get_tts_stats()
+    errors = []
+    started = time.perf_counter()
+
+    def warm(voice_name: str, fragment: str):
+        try:
+            voice_tool_instance.text_to_speech(fragment, voice_name)
+        except Exception as e:
+            errors.append(f"{voice_name}: {fragment[:40]}... -> {str(e)}")
+
+    with ThreadPoolExecutor(max_workers=max(1, max_parallel), thread_name_prefix="tts-prewarm") as executor:
+        for voice_name in voice_names:
+            for fragment in fragments:
+                executor.submit(warm, voice_name, fragment)
+
+    after = voice_tool_instance.get_tts_stats()
+    result = {
+        "voices": voice_names,
+        "fragments": len(fragments),
+        "already_cached": after["cache_hits"] - before["cache_hits"],
+        "synthesized": after["syntheses"] - before["syntheses"],
+        "errors": errors,
+        "seconds": round(time.perf_counter() - started, 2)
+    }
+    logging.info(f"[tts_prewarm] {result['fragments']} fragmentos x {len(voice_names)} voces: "
+                 f"{result['synthesized']} sintetizados, {result['already_cached']} ya en caché, "
+                 f"{len(errors)} errores en {result['seconds']}s")
+    return result
+
+
+def start_background_prewarm() -> threading.Thread:
+    """Runs prewarm_tts_cache for TTS_PREWARM_VOICES in a daemon thread (API startup)."""
+    thread = threading.Thread(target=prewarm_tts_cache, args=(TTS_PREWARM_VOICES or None,),
+                              name="tts-prewarm", daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precalienta la caché de audio TTS con las frases conocidas")
+    parser.add_argument("--voice", action="append", dest="voices",
+                        help="Voz a precalentar (repetible; por defecto TTS_PREWARM_VOICES o la voz por defecto)")
+    parser.add_argument("--phrases-file", help="Archivo con frases adicionales, una por línea")
+    parser.add_argument("--max-parallel", type=int, default=TTS_MAX_PARALLEL)
+    parser.add_argument("--dry-run", action="store_true", help="Solo lista los fragmentos")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    phrases = known_phrases()
+    if args.phrases_file:
+        with open(args.phrases_file, encoding="utf-8") as f:
+            phrases += [line.strip() for line in f if line.strip()]
+
+    if args.dry_run:
+        for fragment in prewarm_fragments(phrases):
+            print(fragment)
+        sys.exit(0)
+
+    if voice_tool_instance.tts_client is None:
+        print("Cliente de Text-to-Speech no disponible: revisa las credenciales de Google Cloud")
+        sys.exit(1)
+    result = prewarm_tts_cache(args.voices or TTS_PREWARM_VOICES or None, phrases, args.max_parallel)
+    print(f"Voces: {', '.join(result['voices'])}")
+    print(f"Fragmentos: {result['fragments']}  sintetizados: {result['synthesized']}  "
+          f"ya en caché: {result['already_cached']}  tiempo: {result['seconds']}s")
+    for error in result["errors"]:
+        print(f"ERROR {error}")
+    print(f"Caché: {voice_tool_instance.get_tts_stats()['cache']}")
+    sys.exit(1 if result["errors"] else 0)
@@ -1,11 +1,20 @@
 # src/tools/voice_tool.py
 import os
 import sys
+import re
+import time
+import queue
+import struct
 import logging
+import threading
+import unicodedata
 import tempfile
 import base64
 from pathlib import Path
-from typing import Annotated, Dict, Any, Optional
+from collections import deque
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from typing import Annotated, Dict, Any, Iterable, Iterator, List, Optional
 from langchain_core.tools import InjectedToolCallId, tool
 from langchain_core.messages import ToolMessage
 import wave
@@ -28,13 +37,28 @@ if str(APP_ROOT) not in sys.path:
 
 # Importar configuración
 try:
-    from config.settings import MARCELLA_GOOGLE_API_KEY
+    from config.settings import (
+        MARCELLA_GOOGLE_API_KEY,
+        TTS_MAX_PARALLEL,
+        TTS_POOL_WORKERS,
+        TTS_SENTENCE_MIN_CHARS,
+        TTS_CHUNK_MAX_CHARS
+    )
 except ImportError:
     # Fallback para cuando se ejecuta desde test_tools
     import sys
     import os
     sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
-    from config.settings import MARCELLA_GOOGLE_API_KEY
+    from config.settings import (
+        MARCELLA_GOOGLE_API_KEY,
+        TTS_MAX_PARALLEL,
+        TTS_POOL_WORKERS,
+        TTS_SENTENCE_MIN_CHARS,
+        TTS_CHUNK_MAX_CHARS
+    )
+
+from ..metrics import get_histogram
+from .content_cache import content_hash, make_cache_key, get_tts_cache
 
 # Configurar logging
 logger = logging.getLogger(__name__)
@@ -135,6 +159,13 @@ SPEECH_CONFIG = {
     "use_enhanced": True  # Usar modelo mejorado si está disponible
 }
 
+# Reconocimiento en streaming (audio por chunks desde un WebSocket o una subida chunked)
+STREAMING_SPEECH_CONFIG = {
+    "interim_results": True,  # Transcripciones parciales mientras el usuario habla
+    "single_utterance": True,  # El servidor emite END_OF_SINGLE_UTTERANCE al detectar el final del enunciado
+    "max_request_bytes": 25 * 1024  # Audio máximo por StreamingRecognizeRequest
+}
+
 def get_voice_config(voice_name: str = None) -> dict:
     """
     Obtiene la configuración de una voz específica
@@ -157,7 +188,7 @@ def get_voice_config(voice_name: str = None) -> dict:
         return SPANISH_VOICES[voice_name]
 
     # Si no se encuentra, devolver la voz por defecto
-    return PERUVIAN_VOICES[DEFAULT_VOICE]
+    return SPANISH_VOICES[DEFAULT_VOICE]
 
 def get_available_voices() -> dict:
     """
@@ -205,6 +236,101 @@ def get_best_peruvian_female_voice() -> str:
     # Fallback a la voz por defecto
     return DEFAULT_VOICE
 
+# Cabecera de cada entrada de la caché TTS: milisegundos que costó sintetizarla
+_TTS_ENTRY_HEADER = struct.Struct("<I")
+
+# Parámetros de la voz que cambian el audio generado
+_TTS_VOICE_PARAMS = ("name", "language_code", "gender", "speaking_rate", "pitch", "volume_gain_db")
+
+def normalize_tts_text(text: str) -> str:
+    """Texto en forma NFC y con los espacios colapsados (mismo audio, misma clave de caché)"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+def tts_cache_key(text: str, voice_config: dict, audio_encoding: str = "MP3") -> str:
+    """
+    Clave de la caché TTS para un texto ya normalizado
+
+    Args:
+        text: Texto normalizado con normalize_tts_text
+        voice_config: Configuración de la voz (get_voice_config)
+        audio_encoding: Codificación del audio
+
+    Returns:
+        Clave hexadecimal
+    """
+    params = {name: voice_config.get(name) for name in _TTS_VOICE_PARAMS}
+    return make_cache_key(content_hash(text.encode("utf-8")), "tts", params, audio_encoding)
+
+# Fin de frase: puntuación final seguida de espacio, o salto de línea
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?…;:])\s+|\n+")
+
+def split_sentences(text: str, min_chars: int = TTS_SENTENCE_MIN_CHARS,
+                    max_chars: int = TTS_CHUNK_MAX_CHARS) -> List[str]:
+    """
+    Divide el texto en fragmentos para sintetizar por separado
+
+    Las frases más cortas que min_chars se unen a la siguiente (menos peticiones y
+    mejor entonación) y las más largas que max_chars se cortan en una coma o un espacio.
+
+    Args:
+        text: Texto completo de la respuesta
+        min_chars: Longitud mínima de un fragmento (salvo el último)
+        max_chars: Longitud máxima de un fragmento
+
+    Returns:
+        Lista de fragmentos en orden
+    """
+    chunks = []
+    current = ""
+    for sentence in _SENTENCE_BOUNDARY.split(text.strip()):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        current = f"{current} {sentence}" if current else sentence
+        while len(current) > max_chars:
+            cut = current.rfind(", ", 0, max_chars)
+            cut = cut + 1 if cut > 0 else current.rfind(" ", 0, max_chars)
+            if cut <= 0:
+                cut = max_chars
+            chunks.append(current[:cut].strip())
+            current = current[cut:].strip()
+        if len(current) >= min_chars:
+            chunks.append(current)
+            current = ""
+    if current:
+        chunks.append(current)
+    return chunks
+
+class AudioChunkQueue:
+    """
+    Iterable de chunks de audio alimentado desde otro hilo o desde el event loop.
+    streaming_speech_to_text lo consume en el hilo de gRPC; close() termina el stream
+    (los chunks recibidos después se descartan).
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self.closed = False
+        self.bytes_received = 0
+
+    def put(self, chunk: bytes) -> None:
+        if self.closed or not chunk:
+            return
+        self.bytes_received += len(chunk)
+        self._queue.put(chunk)
+
+    def close(self) -> None:
+        if not self.closed:
+            self.closed = True
+            self._queue.put(None)
+
+    def __iter__(self) -> Iterator[bytes]:
+        while True:
+            chunk = self._queue.get()
+            if chunk is None:
+                return
+            yield chunk
+
 # ============================================================================
 # CLASE PRINCIPAL DE HERRAMIENTA DE VOZ
 # ============================================================================
@@ -216,6 +342,10 @@ class VoiceTool:
         self.google_api_key = MARCELLA_GOOGLE_API_KEY
         self.speech_client = None
         self.tts_client = None
+        self._tts_executor = None
+        self._tts_executor_pid = None
+        self._tts_lock = threading.Lock()
+        self._tts_counters = {"cache_hits": 0, "syntheses": 0, "saved_ms": 0.0, "synthesis_ms": 0.0}
         self._initialize_clients()
 
     def _initialize_clients(self):
@@ -281,6 +411,92 @@ class VoiceTool:
             logger.error(f"Error en speech-to-text: {e}")
             raise
 
+    def streaming_speech_to_text(self, audio_chunks: Iterable[bytes], language_code: str = "es-ES",
+                                 encoding: str = None, sample_rate_hertz: int = None,
+                                 single_utterance: bool = None) -> Iterator[Dict[str, Any]]:
+        """
+        Transcribe audio recibido por chunks con streaming_recognize
+
+        Args:
+            audio_chunks: Iterable de bytes de audio (se consume en el hilo de gRPC)
+            language_code: Código de idioma (es-ES por defecto)
+            encoding: Codificación del audio (LINEAR16, WEBM_OPUS, OGG_OPUS, FLAC...);
+                      obligatoria salvo en FLAC/WAV con cabecera
+            sample_rate_hertz: Frecuencia de muestreo (obligatoria con LINEAR16)
+            single_utterance: Cortar el reconocimiento al final del enunciado (STREAMING_SPEECH_CONFIG por defecto)
+
+        Yields:
+            Eventos {"event": "interim", "transcript", "stability"}, {"event": "final", "transcript",
+            "confidence"}, {"event": "end_of_utterance"} y, al terminar, {"event": "transcript",
+            "transcript", "end_of_utterance", "seconds"} con el texto completo
+        """
+        if not self.speech_client:
+            raise RuntimeError("Cliente de Speech-to-Text no disponible")
+
+        config_kwargs = dict(
+            language_code=language_code,
+            enable_automatic_punctuation=SPEECH_CONFIG["enable_automatic_punctuation"],
+            enable_word_time_offsets=SPEECH_CONFIG["enable_word_time_offsets"],
+            enable_word_confidence=SPEECH_CONFIG["enable_word_confidence"],
+            model=SPEECH_CONFIG["model"],
+            use_enhanced=SPEECH_CONFIG["use_enhanced"]
+        )
+        if encoding:
+            try:
+                config_kwargs["encoding"] = speech_v1.RecognitionConfig.AudioEncoding[encoding.upper()]
+            except KeyError:
+                raise ValueError(f"Codificación de audio no soportada: {encoding}")
+        if sample_rate_hertz:
+            config_kwargs["sample_rate_hertz"] = int(sample_rate_hertz)
+        streaming_config = speech_v1.StreamingRecognitionConfig(
+            config=speech_v1.RecognitionConfig(**config_kwargs),
+            interim_results=STREAMING_SPEECH_CONFIG["interim_results"],
+            single_utterance=(STREAMING_SPEECH_CONFIG["single_utterance"]
+                              if single_utterance is None else single_utterance)
+        )
+
+        max_bytes = STREAMING_SPEECH_CONFIG["max_request_bytes"]
+
+        def requests():
+            for chunk in audio_chunks:
+                # Los chunks grandes del cliente se parten al tamaño máximo por petición
+                for start in range(0, len(chunk), max_bytes):
+                    yield speech_v1.StreamingRecognizeRequest(audio_content=chunk[start:start + max_bytes])
+
+        end_of_utterance = speech_v1.StreamingRecognizeResponse.SpeechEventType.END_OF_SINGLE_UTTERANCE
+        finals = []
+        started = time.perf_counter()
+        utterance_ended_at = None
+        try:
+            for response in self.speech_client.streaming_recognize(config=streaming_config, requests=requests()):
+                if response.speech_event_type == end_of_utterance and utterance_ended_at is None:
+                    utterance_ended_at = time.perf_counter()
+                    yield {"event": "end_of_utterance"}
+                for result in response.results:
+                    if not result.alternatives:
+                        continue
+                    alternative = result.alternatives[0]
+                    if result.is_final:
+                        finals.append(alternative.transcript.strip())
+                        yield {"event": "final", "transcript": alternative.transcript.strip(),
+                               "confidence": round(alternative.confidence, 3)}
+                    else:
+                        yield {"event": "interim", "transcript": alternative.transcript.strip(),
+                               "stability": round(result.stability, 3)}
+        except Exception as e:
+            logger.error(f"Error en speech-to-text en streaming: {e}")
+            raise
+
+        if utterance_ended_at is not None:
+            # Desde que se detecta el final del enunciado hasta tener el texto definitivo
+            get_histogram("voice.stt_stream.finalize").observe((time.perf_counter() - utterance_ended_at) * 1000)
+        yield {
+            "event": "transcript",
+            "transcript": " ".join(text for text in finals if text),
+            "end_of_utterance": utterance_ended_at is not None,
+            "seconds": round(time.perf_counter() - started, 3)
+        }
+
     def text_to_speech(self, text: str, voice_name: str = None,
                       output_format: str = "MP3") -> bytes:
         """
@@ -294,9 +510,6 @@ class VoiceTool:
         Returns:
             Datos de audio en bytes
         """
-        if not self.tts_client:
-            raise RuntimeError("Cliente de Text-to-Speech no disponible")
-
         # Usar la mejor voz femenina peruana por defecto
         if voice_name is None:
             voice_name = get_best_peruvian_female_voice()
@@ -304,6 +517,19 @@ class VoiceTool:
         # Obtener configuración de la voz
         voice_config = get_voice_config(voice_name)
 
+        # Frases repetidas (saludos, peticiones de datos, rechazos) se sirven desde la caché
+        text = normalize_tts_text(text)
+        cache = get_tts_cache()
+        cache_key = tts_cache_key(text, voice_config)
+        entry = cache.get(cache_key)
+        if entry is not None:
+            synthesis_ms, = _TTS_ENTRY_HEADER.unpack_from(entry)
+            self._count_tts(hit=True, milliseconds=synthesis_ms)
+            return entry[_TTS_ENTRY_HEADER.size:]
+
+        if not self.tts_client:
+            raise RuntimeError("Cliente de Text-to-Speech no disponible")
+
         try:
             # Configurar la síntesis de voz
             synthesis_input = texttospeech.SynthesisInput(text=text)
@@ -324,16 +550,101 @@ class VoiceTool:
             )
 
             # Realizar la síntesis
+            started = time.perf_counter()
             response = self.tts_client.synthesize_speech(
                 input=synthesis_input, voice=voice, audio_config=audio_config
             )
+            synthesis_ms = (time.perf_counter() - started) * 1000
+            get_histogram("voice.tts.synthesize").observe(synthesis_ms)
+            self._count_tts(hit=False, milliseconds=synthesis_ms)
 
+            # Se guarda también el tiempo de síntesis para contabilizar el ahorro de cada acierto
+            cache.set(cache_key, _TTS_ENTRY_HEADER.pack(min(int(synthesis_ms), 2 ** 32 - 1)) + response.audio_content)
             return response.audio_content
 
         except Exception as e:
             logger.error(f"Error en text-to-speech: {e}")
             raise
 
+    def _count_tts(self, hit: bool, milliseconds: float) -> None:
+        with self._tts_lock:
+            if hit:
+                self._tts_counters["cache_hits"] += 1
+                self._tts_counters["saved_ms"] += milliseconds
+            else:
+                self._tts_counters["syntheses"] += 1
+                self._tts_counters["synthesis_ms"] += milliseconds
+
+    def get_tts_stats(self) -> dict:
+        """
+        Métricas de la caché de audio TTS
+
+        Returns:
+            Aciertos, síntesis, tasa de aciertos, tiempo de síntesis ahorrado y estado de la caché
+        """
+        with self._tts_lock:
+            counters = dict(self._tts_counters)
+        requests = counters["cache_hits"] + counters["syntheses"]
+        return {
+            "cache_hits": counters["cache_hits"],
+            "syntheses": counters["syntheses"],
+            "hit_rate": round(counters["cache_hits"] / requests, 4) if requests else None,
+            "saved_synthesis_seconds": round(counters["saved_ms"] / 1000, 3),
+            "avg_synthesis_ms": round(counters["synthesis_ms"] / counters["syntheses"], 1) if counters["syntheses"] else None,
+            "cache": get_tts_cache().stats()
+        }
+
+    def _get_tts_executor(self) -> ThreadPoolExecutor:
+        """Pool de síntesis compartido por todas las respuestas del proceso (TTS_POOL_WORKERS hilos)"""
+        if self._tts_executor is None or self._tts_executor_pid != os.getpid():
+            self._tts_executor = ThreadPoolExecutor(max_workers=TTS_POOL_WORKERS, thread_name_prefix="tts")
+            self._tts_executor_pid = os.getpid()
+        return self._tts_executor
+
+    def text_to_speech_chunks(self, text: str, voice_name: str = None,
+                              max_parallel: int = TTS_MAX_PARALLEL,
+                              cancel: Optional[threading.Event] = None) -> Iterator[bytes]:
+        """
+        Sintetiza el texto frase a frase, con hasta max_parallel peticiones en curso
+
+        Los fragmentos MP3 se devuelven en orden en cuanto está listo cada uno; la
+        concatenación de todos es un MP3 reproducible.
+
+        Args:
+            text: Texto a convertir a voz
+            voice_name: Nombre de la voz (si es None, usa la mejor voz femenina peruana)
+            max_parallel: Máximo de síntesis simultáneas para esta respuesta
+            cancel: Evento que detiene la síntesis (cliente desconectado); se comprueba
+                tras cada fragmento y las frases pendientes se cancelan
+
+        Yields:
+            Audio MP3 de cada fragmento
+        """
+        sentences = iter(split_sentences(text))
+        executor = self._get_tts_executor()
+        pending = deque(executor.submit(self.text_to_speech, sentence, voice_name)
+                        for sentence in islice(sentences, max(1, max_parallel)))
+        started = time.perf_counter()
+        first_chunk = True
+        try:
+            while pending:
+                audio = pending.popleft().result()
+                if cancel is not None and cancel.is_set():
+                    return
+                # Se encola la siguiente frase antes de entregar esta: la ventana se mantiene llena
+                next_sentence = next(sentences, None)
+                if next_sentence is not None:
+                    pending.append(executor.submit(self.text_to_speech, next_sentence, voice_name))
+                if first_chunk:
+                    first_chunk = False
+                    get_histogram("voice.tts.first_chunk").observe((time.perf_counter() - started) * 1000)
+                yield audio
+        finally:
+            # Cliente desconectado o error: no se sintetizan las frases restantes
+            for future in pending:
+                future.cancel()
+        get_histogram("voice.tts.total").observe((time.perf_counter() - started) * 1000)
+
 # Instancia global de la herramienta de voz
 voice_tool_instance = VoiceTool()
 
@@ -390,7 +701,8 @@ def speech_to_text_tool(
 def text_to_speech_tool(
     text: str,
     tool_call_id: Annotated[str, InjectedToolCallId],
-    voice_name: str = None
+    voice_name: str = None,
+    binary: bool = False
 ) -> Dict[str, Any]:
     """
     Convierte texto a audio usando Google Cloud Text-to-Speech.
@@ -398,31 +710,34 @@ def text_to_speech_tool(
     Args:
         text: Texto a convertir a voz
         voice_name: Nombre de la voz (si es None, usa la mejor voz femenina peruana)
+        binary: Devolver el MP3 en bytes ('audio_bytes') en lugar de base64
         tool_call_id: ID de la llamada de la herramienta
 
     Returns:
-        Diccionario con el audio en base64 y metadatos
+        Diccionario con el audio (base64 o bytes) y metadatos
     """
     print(f"--- [Herramienta text_to_speech] Convirtiendo texto a voz con {voice_name} ---")
 
     try:
-        # Convertir texto a audio
-        audio_data = voice_tool_instance.text_to_speech(text, voice_name)
-
-        # Codificar audio en base64
-        audio_base64 = base64.b64encode(audio_data).decode('utf-8')
+        # Convertir texto a audio (frases sintetizadas en paralelo y concatenadas)
+        audio_data = b"".join(voice_tool_instance.text_to_speech_chunks(text, voice_name))
 
         result = f"Texto convertido a audio exitosamente: '{text[:50]}{'...' if len(text) > 50 else ''}'"
         print(f"[Herramienta] Audio generado: {len(audio_data)} bytes")
 
-        return {
-            "audio_base64": audio_base64,
+        response = {
             "audio_format": "MP3",
             "voice_name": voice_name,
             "text_length": len(text),
             "audio_size_bytes": len(audio_data),
             "messages": [ToolMessage(content=result, tool_call_id=tool_call_id)]
         }
+        if binary:
+            response["audio_bytes"] = audio_data
+        else:
+            # Codificar audio en base64
+            response["audio_base64"] = base64.b64encode(audio_data).decode('utf-8')
+        return response
 
     except Exception as e:
         error_msg = f"Error al convertir texto a audio: {str(e)}"
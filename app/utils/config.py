@@ -17,3 +17,43 @@ class Config:
     GMAIL_PASSWORD = os.getenv("GMAIL_PASSWORD")
     MP_PUBLIC_KEY = os.getenv("MP_PUBLIC_KEY")
     MP_ACCESS_TOKEN = os.getenv("MP_ACCESS_TOKEN")
+
+    # Persistencia de mensajes: "sync" (insert por mensaje), "group" (por lotes, pero el llamador
+    # espera la confirmación de su lote; agrupa solo lo que llega durante un flush en curso,
+    # sin esperar MONGO_WRITE_FLUSH_INTERVAL_MS) o "async" (write-behind por lotes sin esperar; un cierre
+    # abrupto antes del flush pierde mensajes ya confirmados al cliente, por eso es opcional)
+    MONGO_WRITE_MODE = os.getenv("MONGO_WRITE_MODE", "group")
+    MONGO_WRITE_BATCH_SIZE = int(os.getenv("MONGO_WRITE_BATCH_SIZE", "100"))
+    MONGO_WRITE_FLUSH_INTERVAL_MS = int(os.getenv("MONGO_WRITE_FLUSH_INTERVAL_MS", "50"))
+    MONGO_WRITE_QUEUE_MAX = int(os.getenv("MONGO_WRITE_QUEUE_MAX", "10000"))
+    MONGO_WRITE_MAX_RETRIES = int(os.getenv("MONGO_WRITE_MAX_RETRIES", "5"))
+
+    # Índices: se crean al iniciar; con MONGO_VERIFY_QUERY_PLANS=true el arranque falla
+    # si alguna consulta caliente no usa índice (COLLSCAN u ordenación en memoria)
+    MONGO_ENSURE_INDEXES = os.getenv("MONGO_ENSURE_INDEXES", "true").lower() == "true"
+    MONGO_VERIFY_QUERY_PLANS = os.getenv("MONGO_VERIFY_QUERY_PLANS", "false").lower() == "true"
+
+    # Paginación de /conversation?action=history
+    HISTORY_PAGE_SIZE_DEFAULT = int(os.getenv("HISTORY_PAGE_SIZE_DEFAULT", "50"))
+    HISTORY_PAGE_SIZE_MAX = int(os.getenv("HISTORY_PAGE_SIZE_MAX", "200"))
+
+    # Write concern de las escrituras confirmadas (p. ej. save_cv_analysis).
+    # W: número de nodos o "majority"; J: esperar al journal; WTIMEOUT_MS: 0 = sin límite
+    MONGO_WRITE_CONCERN_W = os.getenv("MONGO_WRITE_CONCERN_W", "majority")
+    MONGO_WRITE_CONCERN_J = os.getenv("MONGO_WRITE_CONCERN_J", "false").lower() == "true"
+    MONGO_WRITE_CONCERN_WTIMEOUT_MS = int(os.getenv("MONGO_WRITE_CONCERN_WTIMEOUT_MS", "5000"))
+
+    # Pool de conexiones del MongoClient (uno por proceso, ver client_factory)
+    MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+    MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+    MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "0"))  # 0 = sin límite
+    # Compresión de protocolo en orden de preferencia; se omiten las que no tengan su paquete instalado
+    MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "zstd,snappy")
+    MONGO_RETRY_WRITES = os.getenv("MONGO_RETRY_WRITES", "true").lower() == "true"
+
+    # Almacenamiento de mensajes: "messages" (un documento por mensaje en conversations_memory)
+    # o "thread" (un documento por hilo en conversation_threads, en buckets de CONVERSATION_BUCKET_SIZE).
+    # Para pasar de uno a otro: python -m app.src.database.migrate_conversation_layout
+    CONVERSATION_STORAGE_LAYOUT = os.getenv("CONVERSATION_STORAGE_LAYOUT", "messages")
+    CONVERSATION_BUCKET_SIZE = int(os.getenv("CONVERSATION_BUCKET_SIZE", "200"))
@@ -0,0 +1,85 @@
+"""
+Benchmark de latencia por llamada del almacén de contexto (get_context / save_context).
+Compara la implementación anterior, que consultaba list_collection_names() en cada
+llamada, con el almacén unificado de MongoManager (caché de colecciones conocidas).
+
+Uso (con REPLI_MONGO_URI apuntando a una base de pruebas):
+    python benchmarks/bench_context_store.py --iterations 200
+"""
+
+import argparse
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.src.database.mongo_manager import MongoManager
+
+
+def legacy_get_context(manager: MongoManager, thread_id: str):
+    """Réplica de la versión anterior de get_context"""
+    if 'context_data' not in manager.db.list_collection_names():
+        manager.db.create_collection('context_data')
+    return manager.db.context_data.find_one({"thread_id": thread_id})
+
+
+def legacy_save_context(manager: MongoManager, thread_id: str, context_data: dict):
+    """Réplica de la versión anterior de save_context"""
+    context_data["thread_id"] = thread_id
+    context_data["last_updated"] = datetime.utcnow()
+    if 'context_data' not in manager.db.list_collection_names():
+        manager.db.create_collection('context_data')
+    manager.db.context_data.update_one({"thread_id": thread_id}, {"$set": context_data}, upsert=True)
+
+
+def measure(fn, iterations: int) -> dict:
+    latencies = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn(i)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "mean_ms": statistics.mean(latencies),
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del almacén de contexto")
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    manager = MongoManager()
+    # Cada implementación tiene sus propios hilos: las dos hacen la misma carga de upserts,
+    # primero sobre hilos nuevos (inserción) y luego sobre los mismos hilos (actualización)
+    legacy_ids = [f"bench_ctx_{uuid.uuid4().hex[:8]}_legacy_{i}" for i in range(args.iterations)]
+    unified_ids = [f"bench_ctx_{uuid.uuid4().hex[:8]}_unified_{i}" for i in range(args.iterations)]
+    payload = {"conversation_summary": "x" * 500, "summarized_turns": 3}
+
+    def legacy_save(i):
+        legacy_save_context(manager, legacy_ids[i], dict(payload))
+
+    def unified_save(i):
+        manager.save_context(unified_ids[i], dict(payload))
+
+    results = {
+        "save nuevo (antes)": measure(legacy_save, args.iterations),
+        "save nuevo (ahora)": measure(unified_save, args.iterations),
+        "save existente (antes)": measure(legacy_save, args.iterations),
+        "save existente (ahora)": measure(unified_save, args.iterations),
+        "get (antes)": measure(lambda i: legacy_get_context(manager, legacy_ids[i]), args.iterations),
+        "get (ahora)": measure(lambda i: manager.get_context(unified_ids[i]), args.iterations),
+    }
+    for name, result in results.items():
+        print(f"{name:<24} media={result['mean_ms']:.2f}ms p50={result['p50_ms']:.2f}ms p95={result['p95_ms']:.2f}ms")
+
+    manager.db.context_data.delete_many({"thread_id": {"$in": legacy_ids + unified_ids}})
+
+if __name__ == "__main__":
+    main()
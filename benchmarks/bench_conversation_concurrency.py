@@ -0,0 +1,78 @@
+"""
+Benchmark de concurrencia para /conversation.
+Lanza N conversaciones de texto simultáneas contra un servidor en ejecución y
+compara la ruta nativa asíncrona (/conversation) con la ruta Flask servida por
+el puente WSGI (/legacy/conversation).
+
+Uso (con el servidor levantado, p. ej. `cd app && gunicorn -c gunicorn_config.py asgi:app`):
+    python benchmarks/bench_conversation_concurrency.py --base-url http://localhost:8080 --concurrency 50 --requests 200
+
+Cada petición hace una llamada real al LLM y escribe en MongoDB; usa un entorno de pruebas.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+import httpx
+
+
+async def run_load(base_url: str, path: str, concurrency: int, total_requests: int, message: str) -> dict:
+    """Envía total_requests peticiones con como mucho `concurrency` en vuelo y devuelve las métricas"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=300) as client:
+        async def one_request(i: int):
+            nonlocal errors
+            payload = {"thread_id": f"bench_{uuid.uuid4().hex[:8]}_{i}", "message": message}
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.post(path, json=payload)
+                    if response.status_code != 200:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        wall_start = time.perf_counter()
+        await asyncio.gather(*(one_request(i) for i in range(total_requests)))
+        wall = time.perf_counter() - wall_start
+
+    latencies.sort()
+    return {
+        "path": path,
+        "requests": total_requests,
+        "errors": errors,
+        "wall_seconds": wall,
+        "throughput_rps": total_requests / wall if wall else 0.0,
+        "p50_seconds": statistics.median(latencies),
+        "p95_seconds": latencies[int(len(latencies) * 0.95) - 1] if latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de concurrencia de /conversation")
+    parser.add_argument("--base-url", default="http://localhost:8080")
+    parser.add_argument("--paths", default="/conversation,/legacy/conversation",
+                        help="Rutas a comparar, separadas por comas")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--message", default="Hola, ¿qué necesito para constituir una empresa en Perú?")
+    args = parser.parse_args()
+
+    for path in args.paths.split(","):
+        result = asyncio.run(run_load(args.base_url, path.strip(), args.concurrency, args.requests, args.message))
+        print(
+            f"{result['path']:<24} peticiones={result['requests']} errores={result['errors']} "
+            f"total={result['wall_seconds']:.1f}s rps={result['throughput_rps']:.2f} "
+            f"p50={result['p50_seconds']:.2f}s p95={result['p95_seconds']:.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark de los dos diseños de almacenamiento de conversaciones:
+  - messages: un documento por mensaje (conversations_memory)
+  - thread:   un documento por hilo en buckets (conversation_threads)
+
+Para hilos de 10, 100 y 1000 mensajes mide la carga en frío (leer el historial
+completo como hace ConversationMemory) y la latencia de añadir un mensaje.
+
+Uso (con REPLI_MONGO_URI apuntando a una base de pruebas):
+    python benchmarks/bench_conversation_layout.py --sizes 10,100,1000 --repeats 20
+"""
+
+import argparse
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bson import ObjectId
+
+from app.utils.config import Config
+from app.src.database.client_factory import get_client
+from app.src.database.indexes import ensure_indexes
+from app.src.database.thread_store import ThreadBucketStore, THREADS_COLLECTION
+
+
+def make_messages(thread_id: str, count: int, start: datetime):
+    return [{
+        "_id": ObjectId(),
+        "thread_id": thread_id,
+        "user_name": "Usuario" if i % 2 == 0 else "Geraldine",
+        "role": "user" if i % 2 == 0 else "assistant",
+        "content": f"Mensaje {i} " + "lorem ipsum dolor sit amet " * 12,
+        "timestamp": start + timedelta(milliseconds=i),
+        "status": "active"
+    } for i in range(count)]
+
+
+def timed(fn, repeats: int) -> float:
+    """Mediana en milisegundos de `repeats` ejecuciones"""
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de diseños de almacenamiento de conversaciones")
+    parser.add_argument("--sizes", default="10,100,1000")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--bucket-size", type=int, default=Config.CONVERSATION_BUCKET_SIZE)
+    args = parser.parse_args()
+
+    db = get_client().agent_memory_repli_post
+    ensure_indexes(db)
+    messages_collection, threads_collection = db.conversations_memory, db[THREADS_COLLECTION]
+    store = ThreadBucketStore(lambda: threads_collection, bucket_size=args.bucket_size)
+    created = []
+
+    print(f"{'mensajes':>8} | {'carga messages':>15} {'carga thread':>13} | {'append messages':>16} {'append thread':>14}")
+    try:
+        for size in [int(s) for s in args.sizes.split(",")]:
+            thread_id = f"bench_layout_{uuid.uuid4().hex[:8]}_{size}"
+            created.append(thread_id)
+            messages = make_messages(thread_id, size, datetime.utcnow())
+            messages_collection.insert_many([dict(m) for m in messages])
+            threads_collection.insert_many(store.build_buckets(thread_id, messages))
+
+            load_messages = timed(lambda: list(messages_collection.find(
+                {"thread_id": thread_id}, {"_id": 0, "role": 1, "content": 1}
+            ).sort([("timestamp", 1), ("_id", 1)])), args.repeats)
+            load_thread = timed(lambda: list(store.iter_history(thread_id)), args.repeats)
+
+            def append_messages():
+                messages_collection.insert_one(make_messages(thread_id, 1, datetime.utcnow())[0])
+
+            def append_thread():
+                store.append(thread_id, make_messages(thread_id, 1, datetime.utcnow()))
+
+            append_messages_ms = timed(append_messages, args.repeats)
+            append_thread_ms = timed(append_thread, args.repeats)
+            print(f"{size:>8} | {load_messages:>13.2f}ms {load_thread:>11.2f}ms | "
+                  f"{append_messages_ms:>14.2f}ms {append_thread_ms:>12.2f}ms")
+    finally:
+        messages_collection.delete_many({"thread_id": {"$in": created}})
+        threads_collection.delete_many({"thread_id": {"$in": created}})
+
+
+if __name__ == "__main__":
+    main()
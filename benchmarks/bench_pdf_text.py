@@ -0,0 +1,113 @@
+"""
+Benchmark de memoria y tiempo de la extracción de la capa de texto de un PDF grande.
+
+Compara, sobre un PDF sintético de 500 páginas con capa de texto:
+  - concat:  el bucle anterior de PostGeneratorTool (text += page.extract_text() + "\\n\\n")
+  - join:    iter_pdf_pages + join_page_text sin límite (un único join)
+  - budget:  iter_pdf_pages + join_page_text con límite de caracteres (deja de leer páginas)
+
+Mide el tiempo total y el pico de memoria (tracemalloc) de cada variante.
+Requiere pypdf.
+
+Uso:
+    python benchmarks/bench_pdf_text.py --pages 500 --max-chars 20000
+"""
+
+import argparse
+import io
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pypdf
+
+from app.src.tools.pdf_extraction import OpenDocument, iter_pdf_pages, join_page_text
+
+LINES_PER_PAGE = 45
+
+
+def _pdf_string(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_text_pdf(pages: int) -> bytes:
+    """PDF mínimo escrito a mano: `pages` páginas de texto en Helvetica, sin imágenes."""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # Árbol de páginas: se completa al final con los hijos
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for page in range(1, pages + 1):
+        lines = [f"Informe anual, pagina {page}, linea {line}: resultados del area de recursos humanos"
+                 for line in range(1, LINES_PER_PAGE + 1)]
+        content = "BT /F1 10 Tf 12 TL 50 800 Td " + " ".join(f"({_pdf_string(l)}) Tj T*" for l in lines) + " ET"
+        stream = content.encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_id = len(objects)
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id)
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % k for k in kids), len(kids))
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def legacy_concat(reader) -> str:
+    text_content = ""
+    for page_num in range(len(reader.pages)):
+        text_content += reader.pages[page_num].extract_text() + "\n\n"
+    return text_content
+
+
+def engine_text(pdf: bytes, max_chars=None) -> str:
+    document = OpenDocument(pdf)
+    try:
+        pages = iter_pdf_pages(document, backends=("text",))
+        return join_page_text((page["text"] for page in pages), max_chars=max_chars)["text"]
+    finally:
+        document.close()
+
+
+def measure(label: str, fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    text = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:>8}: {elapsed:7.2f}s  pico {peak / 1024 / 1024:7.1f} MB  {len(text):>9} caracteres")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de extracción de texto de PDFs grandes")
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--max-chars", type=int, default=20000)
+    args = parser.parse_args()
+
+    pdf = make_text_pdf(args.pages)
+    print(f"PDF sintético: {args.pages} páginas, {len(pdf) / 1024 / 1024:.1f} MB")
+
+    # Cada variante abre su propio lector: pypdf cachea el contenido de las páginas ya leídas
+    measure("concat", lambda: legacy_concat(pypdf.PdfReader(io.BytesIO(pdf))))
+    measure("join", lambda: engine_text(pdf))
+    measure("budget", lambda: engine_text(pdf, args.max_chars))
+
+
+if __name__ == "__main__":
+    main()
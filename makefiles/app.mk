@@ -19,8 +19,8 @@ app.migrate: ## Realizar migraciones
 	python3 app/manage.py makemigrations
 	python3 app/manage.py migrate
 
-app.test: ## Ejecutar pruebas
-	python3 app/manage.py test
+app.test: ## Ejecutar pruebas (MONGO_TEST_URI=mongodb://localhost:27017 para usar un mongod local)
+	python3 -m pytest -q tests
 
 app.static: ## Recolectar archivos estáticos
 	python3 app/manage.py collectstatic
@@ -0,0 +1,149 @@
+"""
+Fixtures shared by the MongoDB manager tests.
+
+The same test bodies drive MongoManager and AsyncMongoManager (through
+AsyncManagerRunner, which runs each coroutine to completion on the test's event
+loop), for both conversation storage layouts.
+
+By default the managers talk to mongomock / mongomock-motor, sharing one
+in-memory server so data written by one manager is visible to the other. Set
+MONGO_TEST_URI to run the suite against a real server instead, e.g. a local
+mongod:
+
+    MONGO_TEST_URI=mongodb://localhost:27017 python -m pytest tests
+
+The managers always use the agent_memory_repli_post database: use a throwaway
+server. Test threads are prefixed with 'pytest_' and deleted afterwards.
+"""
+import os
+import sys
+import uuid
+import asyncio
+import inspect
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.utils.config import Config
+from app.src.database import mongo_manager as mongo_manager_module
+from app.src.database import async_mongo_manager as async_mongo_manager_module
+from app.src.database.mongo_manager import MongoManager
+from app.src.database.async_mongo_manager import AsyncMongoManager
+from app.src.database.indexes import INDEX_SPECS
+
+MONGO_TEST_URI = os.getenv("MONGO_TEST_URI")
+THREAD_PREFIX = "pytest_"
+
+
+class AsyncManagerRunner:
+    """Exposes an AsyncMongoManager with MongoManager's synchronous call style."""
+
+    def __init__(self, manager: AsyncMongoManager, loop: asyncio.AbstractEventLoop):
+        self._manager = manager
+        self._loop = loop
+
+    def __getattr__(self, name):
+        attribute = getattr(self._manager, name)
+        if inspect.isasyncgenfunction(attribute):
+            async def collect(*args, **kwargs):
+                return [item async for item in attribute(*args, **kwargs)]
+            return lambda *args, **kwargs: iter(self._loop.run_until_complete(collect(*args, **kwargs)))
+        if inspect.iscoroutinefunction(attribute):
+            return lambda *args, **kwargs: self._loop.run_until_complete(attribute(*args, **kwargs))
+        return attribute
+
+
+@pytest.fixture
+def event_loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture
+def mongo_clients(event_loop):
+    """(sync client, async client) sharing the same data."""
+    if MONGO_TEST_URI:
+        pymongo = pytest.importorskip("pymongo")
+        motor_asyncio = pytest.importorskip("motor.motor_asyncio")
+        sync_client = pymongo.MongoClient(MONGO_TEST_URI, serverSelectionTimeoutMS=5000)
+        async_client = event_loop.run_until_complete(
+            _build_in_loop(lambda: motor_asyncio.AsyncIOMotorClient(MONGO_TEST_URI))
+        )
+    else:
+        mongomock = pytest.importorskip("mongomock")
+        mongomock_motor = pytest.importorskip("mongomock_motor")
+        sync_client = mongomock.MongoClient()
+        async_client = mongomock_motor.AsyncMongoMockClient(mock_mongo_client=sync_client)
+        _patch_async_with_options(mongomock_motor)
+    yield sync_client, async_client
+    if MONGO_TEST_URI:
+        db = sync_client.agent_memory_repli_post
+        for name in INDEX_SPECS:
+            db[name].delete_many({"thread_id": {"$regex": f"^{THREAD_PREFIX}"}})
+        async_client.close()
+        sync_client.close()
+
+
+def _patch_async_with_options(mongomock_motor):
+    # mongomock-motor devuelve la colección síncrona de mongomock desde with_options();
+    # Motor devuelve otra colección asíncrona (save_cv_analysis la usa para el write concern)
+    collection_class = mongomock_motor.AsyncMongoMockCollection
+    if getattr(collection_class, "_pytest_with_options", False):
+        return
+
+    def with_options(self, *args, **kwargs):
+        collection = getattr(self, "_AsyncMongoMockCollection__collection").with_options(*args, **kwargs)
+        return collection_class(self.database, collection)
+
+    collection_class.with_options = with_options
+    collection_class._pytest_with_options = True
+
+
+@pytest.fixture
+def mongo_backend():
+    """'server' with MONGO_TEST_URI, else 'mongomock'."""
+    return "server" if MONGO_TEST_URI else "mongomock"
+
+
+async def _build_in_loop(factory):
+    # Motor ata el cliente al event loop en el que se crea
+    return factory()
+
+
+@pytest.fixture(params=["messages", "thread"])
+def storage_layout(request):
+    return request.param
+
+
+@pytest.fixture
+def managers(monkeypatch, mongo_clients, storage_layout, event_loop):
+    """(MongoManager, AsyncManagerRunner) over the same database, with fresh process-wide state."""
+    sync_client, async_client = mongo_clients
+    monkeypatch.setattr(mongo_manager_module, "get_client", lambda: sync_client)
+    monkeypatch.setattr(async_mongo_manager_module, "get_async_client", lambda: async_client)
+    monkeypatch.setattr(Config, "CONVERSATION_STORAGE_LAYOUT", storage_layout)
+    monkeypatch.setattr(Config, "MONGO_WRITE_MODE", "group")
+    monkeypatch.setattr(Config, "MONGO_VERIFY_QUERY_PLANS", False)
+    monkeypatch.setattr(MongoManager, "_message_queue", None)
+    monkeypatch.setattr(MongoManager, "_schema_ready", False)
+    monkeypatch.setattr(MongoManager, "_known_collections", set())
+    monkeypatch.setattr(MongoManager, "_thread_store", None)
+
+    sync_manager = MongoManager()
+    yield sync_manager, AsyncManagerRunner(AsyncMongoManager(sync_manager), event_loop)
+    MongoManager._message_queue.close()
+
+
+@pytest.fixture(params=["sync", "async"])
+def manager(request, managers):
+    """The manager under test: MongoManager or AsyncMongoManager (run synchronously)."""
+    sync_manager, async_manager = managers
+    return sync_manager if request.param == "sync" else async_manager
+
+
+@pytest.fixture
+def thread_id():
+    return f"{THREAD_PREFIX}{uuid.uuid4().hex}"
@@ -0,0 +1,156 @@
+"""
+Shared behaviour of MongoManager and AsyncMongoManager.
+
+Every test runs once per manager (sync / async) and storage layout
+(messages / thread); see conftest.py for the backends.
+"""
+import uuid
+
+import pytest
+
+from app.src.database.mongo_manager import decode_page_token
+
+
+def save_conversation(manager, thread_id, count, user_name="anon"):
+    contents = []
+    for index in range(count):
+        role = "user" if index % 2 == 0 else "assistant"
+        content = f"mensaje {index}"
+        manager.save_message(thread_id, user_name, role, content)
+        contents.append(content)
+    return contents
+
+
+def test_save_message_and_history(manager, thread_id):
+    contents = save_conversation(manager, thread_id, 5)
+
+    history = manager.get_conversation_history(thread_id)
+    assert [message["content"] for message in history] == contents
+    assert [message["role"] for message in history] == ["user", "assistant", "user", "assistant", "user"]
+    assert all(message["thread_id"] == thread_id and message["status"] == "active" for message in history)
+
+    assert [message["content"] for message in manager.get_conversation_history(thread_id, limit=2)] == contents[:2]
+
+
+def test_iter_conversation_history_is_projected(manager, thread_id):
+    contents = save_conversation(manager, thread_id, 3)
+
+    streamed = list(manager.iter_conversation_history(thread_id))
+    assert streamed == [{"role": role, "content": content}
+                        for role, content in zip(["user", "assistant", "user"], contents)]
+
+
+def test_get_messages_newest_first(manager, thread_id):
+    contents = save_conversation(manager, thread_id, 4)
+
+    assert [message["content"] for message in manager.get_messages(thread_id)] == contents[::-1]
+    assert [message["content"] for message in manager.get_messages(thread_id, limit=2)] == contents[:1:-1]
+
+
+def test_history_page_token_pagination(manager, thread_id):
+    contents = save_conversation(manager, thread_id, 7)
+
+    first = manager.get_history_page(thread_id, limit=3)
+    assert [message["content"] for message in first["messages"]] == contents[4:]
+    assert first["next_page_token"]
+
+    second = manager.get_history_page(thread_id, limit=3, page_token=first["next_page_token"])
+    assert [message["content"] for message in second["messages"]] == contents[1:4]
+
+    last = manager.get_history_page(thread_id, limit=3, page_token=second["next_page_token"])
+    assert [message["content"] for message in last["messages"]] == contents[:1]
+    assert last["next_page_token"] is None
+
+    assert [message["content"] for message in manager.get_recent_messages(thread_id, 2)] == contents[5:]
+
+
+def test_history_page_rejects_malformed_token(manager, thread_id):
+    save_conversation(manager, thread_id, 2)
+    with pytest.raises(ValueError):
+        manager.get_history_page(thread_id, limit=1, page_token="no-es-un-token")
+
+
+def test_page_tokens_are_shared_between_managers(managers, thread_id):
+    sync_manager, async_manager = managers
+    contents = save_conversation(sync_manager, thread_id, 3)
+
+    first = async_manager.get_history_page(thread_id, limit=2)
+    decode_page_token(first["next_page_token"])
+    rest = sync_manager.get_history_page(thread_id, limit=2, page_token=first["next_page_token"])
+    assert [m["content"] for m in rest["messages"] + first["messages"]] == contents
+
+
+def test_update_user_name(manager, thread_id, storage_layout, mongo_backend):
+    if storage_layout == "thread" and mongo_backend == "mongomock":
+        pytest.skip("mongomock no soporta el operador posicional $[] (usar MONGO_TEST_URI)")
+    save_conversation(manager, thread_id, 3, user_name="anon")
+    user_name = f"Ana {uuid.uuid4().hex[:6]}"
+
+    manager.update_user_name(thread_id, user_name)
+
+    assert {message["user_name"] for message in manager.get_conversation_history(thread_id)} == {user_name}
+    conversation = manager.get_conversation_by_user(user_name)
+    assert conversation["thread_id"] == thread_id
+    assert conversation["user_name"] == user_name
+
+
+def test_finalize_conversation(manager, thread_id):
+    user_name = f"Luis {uuid.uuid4().hex[:6]}"
+    save_conversation(manager, thread_id, 2, user_name=user_name)
+    assert manager.get_last_active_thread() == thread_id
+
+    manager.finalize_conversation(thread_id)
+
+    assert manager.get_conversation_by_user(user_name) is None
+    assert manager.get_last_active_thread() != thread_id
+    assert len(manager.get_conversation_history(thread_id)) == 2
+
+
+def test_cv_analysis_roundtrip(manager, thread_id):
+    assert manager.get_cv_analysis(thread_id)["success"] is False
+
+    analysis = {"success": True, "data": {"name": "Ana", "skills": ["derecho laboral"]}}
+    assert manager.save_cv_analysis(thread_id, dict(analysis)) is True
+    assert manager.get_cv_analysis(thread_id)["data"] == analysis["data"]
+
+    stored = manager.save_cv_analysis(thread_id, {"success": True, "data": {"name": "Ana B."}}, return_document=True)
+    assert stored["thread_id"] == thread_id
+    assert stored["cv_analysis"]["data"] == {"name": "Ana B."}
+
+
+def test_cv_analysis_migrates_old_format(manager, thread_id):
+    assert manager.save_cv_analysis(thread_id, {"success": True, "cv_data": {"name": "Ana"}}) is True
+    assert manager.get_cv_analysis(thread_id)["data"] == {"name": "Ana"}
+
+
+def test_context_roundtrip(manager, thread_id):
+    assert manager.get_context(thread_id) is None
+    assert manager.get_conversation_context(thread_id) is None
+
+    assert manager.save_context(thread_id, {"user_location": "Perú", "is_latinamerica": True}) is True
+    context = manager.get_context(thread_id)
+    assert context["user_location"] == "Perú" and context["is_latinamerica"] is True
+    assert context["thread_id"] == thread_id and context["last_updated"]
+
+    # Sin contexto de conversación propio se usa context_data
+    assert manager.get_conversation_context(thread_id)["user_location"] == "Perú"
+
+    assert manager.save_conversation_context(thread_id, {"topic": "contratos"}) is True
+    assert manager.get_conversation_context(thread_id)["topic"] == "contratos"
+
+    assert manager.save_context(thread_id, {"user_location": "Chile"}) is True
+    context = manager.get_context(thread_id)
+    assert context["user_location"] == "Chile" and context["is_latinamerica"] is True
+
+
+def test_writes_are_visible_to_the_other_manager(managers, thread_id):
+    sync_manager, async_manager = managers
+    sync_manager.save_message(thread_id, "anon", "user", "desde el gestor síncrono")
+    async_manager.save_message(thread_id, "anon", "assistant", "desde el gestor asíncrono")
+
+    for manager in managers:
+        assert [m["content"] for m in manager.get_conversation_history(thread_id)] == [
+            "desde el gestor síncrono", "desde el gestor asíncrono"]
+
+    async_manager.save_context(thread_id, {"user_location": "México"})
+    assert sync_manager.get_context(thread_id)["user_location"] == "México"
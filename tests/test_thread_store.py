@@ -0,0 +1,50 @@
+"""
+ThreadBucketStore bucket filling: batches only go to the newest bucket.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.src.database.thread_store import ThreadBucketStore
+
+START = datetime(2024, 1, 1)
+
+
+@pytest.fixture
+def store():
+    mongomock = pytest.importorskip("mongomock")
+    collection = mongomock.MongoClient().agent_memory_repli_post.conversation_threads
+    return ThreadBucketStore(lambda: collection, bucket_size=3)
+
+
+def make_messages(thread_id, numbers):
+    return [{"thread_id": thread_id, "user_name": "anon", "role": "user", "content": str(number),
+             "timestamp": START + timedelta(seconds=number), "status": "active"}
+            for number in numbers]
+
+
+def contents(messages):
+    return [int(message["content"]) for message in messages]
+
+
+def test_mixed_batches_keep_chronological_order(store):
+    for batch in ([1, 2], [3, 4], [5], [6, 7, 8, 9, 10], [11]):
+        store.insert_messages(make_messages("t", batch))
+
+    expected = list(range(1, 12))
+    assert contents(store.iter_history("t")) == expected
+    assert contents(store.get_history("t")) == expected
+    assert contents(store.iter_newest_first("t")) == expected[::-1]
+    assert contents(store.get_recent("t", 4)) == expected[-4:]
+
+    buckets = list(store.collection.find({"thread_id": "t"}).sort("first_timestamp", 1))
+    assert [bucket["count"] for bucket in buckets] == [3, 3, 3, 2]
+    assert all(len(bucket["messages"]) == bucket["count"] for bucket in buckets)
+
+
+def test_retried_batch_is_not_duplicated(store):
+    batch = make_messages("t", [1, 2, 3, 4])
+    store.insert_messages(batch)
+    store.insert_messages(batch)
+
+    assert contents(store.iter_history("t")) == [1, 2, 3, 4]
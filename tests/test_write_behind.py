@@ -0,0 +1,52 @@
+"""
+WriteBehindQueue group commit latency and batching.
+"""
+import time
+import threading
+
+from app.src.database.write_behind import WriteBehindQueue, WRITE_MODE_GROUP
+
+
+def test_uncontended_group_submit_does_not_linger():
+    batches = []
+    write_queue = WriteBehindQueue(batches.append, mode=WRITE_MODE_GROUP, flush_interval=0.5)
+    try:
+        write_queue.submit("warmup")
+        started = time.perf_counter()
+        for index in range(5):
+            write_queue.submit(index)
+        elapsed = time.perf_counter() - started
+    finally:
+        write_queue.close()
+
+    assert elapsed < 0.5
+    assert batches == [["warmup"], [0], [1], [2], [3], [4]]
+
+
+def test_group_submits_during_a_flush_share_the_next_batch():
+    release = threading.Event()
+    batches = []
+
+    def flush(items):
+        if not batches:
+            release.wait(5)
+        batches.append(list(items))
+
+    write_queue = WriteBehindQueue(flush, mode=WRITE_MODE_GROUP, flush_interval=0.5)
+    writers = [threading.Thread(target=write_queue.submit, args=(index,)) for index in range(4)]
+    try:
+        writers[0].start()
+        while write_queue.stats()["pending"] != 1 or not write_queue._queue.empty():
+            time.sleep(0.001)
+        for writer in writers[1:]:
+            writer.start()
+        while write_queue._queue.qsize() < 3:
+            time.sleep(0.001)
+        release.set()
+        for writer in writers:
+            writer.join(5)
+    finally:
+        write_queue.close()
+
+    assert batches[0] == [0]
+    assert sorted(batches[1]) == [1, 2, 3]